@@ -0,0 +1,40 @@
+"""
+Cache models for reusing transcripts of previously uploaded audio.
+"""
+from datetime import datetime
+from app import db
+
+class AudioCacheEntry(db.Model):
+    """Transcript and summary for an audio file, keyed by its content hash."""
+    
+    __tablename__ = 'audio_cache'
+    __table_args__ = (
+        db.UniqueConstraint('content_hash', 'whisper_model', 'language', 'prompt_version',
+                            name='uq_audio_cache_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(64), nullable=False, index=True)  # SHA-256 hex digest
+    whisper_model = db.Column(db.String(50), nullable=False)
+    language = db.Column(db.String(10), nullable=False)
+    prompt_version = db.Column(db.String(20), nullable=False)
+    transcription_text = db.Column(db.Text, nullable=False)
+    summary = db.Column(db.Text, nullable=True)  # Stored as JSON string
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    hit_count = db.Column(db.Integer, nullable=False, default=0)
+    last_hit_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<AudioCacheEntry {self.content_hash[:12]}>'
+
+
+class CacheCounter(db.Model):
+    """Named counter shared between web and worker processes."""
+    
+    __tablename__ = 'cache_counters'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<CacheCounter {self.name}={self.value}>'
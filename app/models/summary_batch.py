@@ -0,0 +1,31 @@
+"""
+Queue model for summaries deferred to the OpenAI batch API.
+"""
+from datetime import datetime
+from app import db
+
+class SummaryBatchJob(db.Model):
+    """A pending, submitted or finished batch summary for one transcription."""
+
+    __tablename__ = 'summary_batch_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    transcription_id = db.Column(db.Integer, db.ForeignKey('transcriptions.id'), nullable=False, index=True)
+    request_body = db.Column(db.Text, nullable=False)  # Chat completion body as JSON string
+    models = db.Column(db.String(200), nullable=False)  # Summary cache key at enqueue time
+    prompt_version = db.Column(db.String(40), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True)
+    batch_id = db.Column(db.String(100), nullable=True, index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    submitted_at = db.Column(db.DateTime, nullable=True)
+    completed_at = db.Column(db.DateTime, nullable=True)
+
+    @property
+    def custom_id(self):
+        """ID of the request in the batch file, used to match results to jobs."""
+        return f'summary-{self.id}'
+
+    def __repr__(self):
+        return f'<SummaryBatchJob {self.id} {self.status}>'
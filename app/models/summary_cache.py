@@ -0,0 +1,25 @@
+"""
+Cache model for reusing summaries of identical transcripts.
+"""
+from datetime import datetime
+from app import db
+
+class SummaryCacheEntry(db.Model):
+    """Summary for a transcript, keyed by the hash of its normalized text."""
+    
+    __tablename__ = 'summary_cache'
+    __table_args__ = (
+        db.UniqueConstraint('transcript_hash', 'models', 'prompt_version', name='uq_summary_cache_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    transcript_hash = db.Column(db.String(64), nullable=False, index=True)  # SHA-256 of normalized text
+    models = db.Column(db.String(200), nullable=False)  # Configured model set that may answer
+    prompt_version = db.Column(db.String(40), nullable=False, index=True)
+    summary = db.Column(db.Text, nullable=False)  # Stored as JSON string
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    hit_count = db.Column(db.Integer, nullable=False, default=0)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<SummaryCacheEntry {self.transcript_hash[:12]}>'
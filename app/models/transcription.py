@@ -22,6 +22,8 @@ class Transcription(db.Model):
     audio_duration = db.Column(db.Integer, nullable=True)  # Duration in seconds
     patient_ref = db.Column(db.String(50), nullable=True)  # Optional patient reference
     notes = db.Column(db.Text, nullable=True)  # Additional notes
+    original_size = db.Column(db.BigInteger, nullable=True)  # Uploaded file size in bytes
+    compressed_size = db.Column(db.BigInteger, nullable=True)  # Size sent to Whisper in bytes
     
     def __repr__(self):
         return f'<Transcription {self.title}>'
@@ -38,5 +40,7 @@ class Transcription(db.Model):
             'user_id': self.user_id,
             'audio_duration': self.audio_duration,
             'patient_ref': self.patient_ref,
-            'notes': self.notes
+            'notes': self.notes,
+            'original_size': self.original_size,
+            'compressed_size': self.compressed_size
         }
\ No newline at end of file
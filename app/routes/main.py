@@ -3,13 +3,17 @@ Main routes for the DentalScribe application.
 """
 import os
 import json
-import tempfile
 import datetime
 from flask import Blueprint, render_template, request, jsonify, current_app, flash, redirect, url_for, session
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 from flask_wtf import FlaskForm
 from app.services.audio_processor import process_audio
+from app.services.audio_format import detect_format
+from app.services.audio_cache import save_and_hash, cache_stats
+from app.services.spool import spool_path, release
+from app.services import chunked_upload, live_transcription, summary_cache, summary_batch
+from app.services.model_router import router_status
 from app.services.transcription_service import transcribe_audio
 from app.services.summary_service import generate_summary
 from app.models.transcription import Transcription
@@ -18,10 +22,18 @@ from app import db
 
 main = Blueprint('main', __name__, url_prefix='')
 
-def allowed_file(filename):
-    """Check if the file has an allowed extension."""
+def allowed_file(filename, stream=None):
+    """
+    Check if the file has an allowed extension.
+    
+    If a stream is given, its header must also match a supported audio
+    format, so that corrupt or mislabelled uploads are rejected before
+    they reach a worker.
+    """
     ALLOWED_EXTENSIONS = {'wav', 'mp3', 'm4a', 'ogg', 'webm', 'mp4'}
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    if '.' not in filename or filename.rsplit('.', 1)[1].lower() not in ALLOWED_EXTENSIONS:
+        return False
+    return stream is None or detect_format(stream) is not None
 
 @main.route('/')
 def index():
@@ -72,6 +84,11 @@ def transcription_status(task_id):
             'state': task.state,
             'status': 'Sparar transkription...'
         }
+    elif task.state == 'RETRY':
+        response = {
+            'state': task.state,
+            'status': 'Tillfälligt fel, försöker igen...'
+        }
     elif task.state == 'FAILURE':
         # Something went wrong in the background job
         response = {
@@ -127,14 +144,13 @@ def transcribe():
             flash('Ingen fil vald', 'error')
             return redirect(request.url)
         
-        if file and allowed_file(file.filename):
+        if file and allowed_file(file.filename, file.stream):
             try:
                 # Spara original-ljudet tillfälligt
-                temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.' + file.filename.split('.')[-1])
-                file.save(temp_file.name)
-                temp_file.close()
+                temp_path = spool_path('.' + file.filename.split('.')[-1])
+                content_hash = save_and_hash(file.stream, temp_path)
                 
-                current_app.logger.info(f"Sparade fil tillfälligt till: {temp_file.name}")
+                current_app.logger.info(f"Sparade fil tillfälligt till: {temp_path} (sha256 {content_hash[:12]})")
                 
                 # Hämta titel från formuläret
                 title = request.form.get('title')
@@ -143,7 +159,7 @@ def transcribe():
                 
                 # Starta Celery task
                 from app.tasks.transcription_tasks import process_transcription
-                task = process_transcription.delay(temp_file.name, title, current_user.id)
+                task = process_transcription.delay(temp_path, title, current_user.id, content_hash=content_hash)
                 
                 current_app.logger.info(f"Startade Celery-task med ID: {task.id}")
                 
@@ -167,7 +183,7 @@ def transcribe():
                 return redirect(request.url)
         else:
             current_app.logger.warning(f"Otillåten filtyp: {file.filename}")
-            flash('Filtypen är inte tillåten. Vänligen ladda upp WAV, MP3, M4A eller OGG.', 'error')
+            flash('Filtypen är inte tillåten eller filen är skadad. Vänligen ladda upp WAV, MP3, M4A, OGG eller WebM.', 'error')
             return redirect(request.url)
     
     return render_template('main/transcribe.html', form=form)
@@ -205,6 +221,11 @@ def api_task_status(task_id):
             'state': task.state,
             'status': 'Saving transcription'
         }
+    elif task.state == 'RETRY':
+        response = {
+            'state': task.state,
+            'status': 'Retrying after a temporary error'
+        }
     elif task.state == 'FAILURE':
         # Something went wrong in the background job
         response = {
@@ -241,9 +262,16 @@ def view_transcription(id):
         flash('You do not have permission to view this transcription.', 'error')
         return redirect(url_for('main.dashboard'))
     
+    # A summary deferred to the batch API is written when the batch completes
+    summary_queued = transcription.summary is None
+    
     # Parse summary JSON
     try:
-        summary = json.loads(transcription.summary)
+        if summary_queued:
+            summary = {field: "Sammanfattningen är köad" for field in
+                       ("anamnes", "status", "diagnos", "åtgärd", "behandlingsplan", "kommunikation")}
+        else:
+            summary = json.loads(transcription.summary)
     except:
         summary = {
             "anamnes": "Error parsing summary",
@@ -256,7 +284,8 @@ def view_transcription(id):
     
     return render_template('main/view_transcription.html', 
                            transcription=transcription, 
-                           summary=summary)
+                           summary=summary,
+                           summary_queued=summary_queued)
 
 
 @main.route('/progress-status')
@@ -331,19 +360,25 @@ def api_transcribe():
         if request.content_length and request.content_length > 100 * 1024 * 1024:
             return jsonify({"error": "File is too large. Maximum file size is 100MB."}), 413
         
+        # Check extension and file header before anything is queued
+        if not allowed_file(audio_file.filename, audio_file.stream):
+            return jsonify({"error": "Unsupported or corrupt audio file. Allowed formats are WAV, MP3, M4A, MP4, OGG and WebM."}), 415
+        
         # Save original audio temporarily
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.' + audio_file.filename.split('.')[-1])
-        audio_file.save(temp_file.name)
-        temp_file.close()
+        temp_path = spool_path('.' + audio_file.filename.split('.')[-1])
+        content_hash = save_and_hash(audio_file.stream, temp_path)
         
-        current_app.logger.info(f"Saved file temporarily to: {temp_file.name}")
+        current_app.logger.info(f"Saved file temporarily to: {temp_path}")
         
-        # Get title from form
+        # Get title from form; summary_mode=batch defers the summary to the cheaper batch API
         title = request.form.get('title', 'API Transcription')
+        summary_mode = 'batch' if request.form.get('summary_mode') == 'batch' else None
         
         # Start Celery task
         from app.tasks.transcription_tasks import process_transcription
-        task = process_transcription.delay(temp_file.name, title, current_user.id)
+        task = process_transcription.delay(
+            temp_path, title, current_user.id, content_hash=content_hash, summary_mode=summary_mode
+        )
         
         # Return task ID for status checking
         return jsonify({
@@ -358,4 +393,221 @@ def api_transcribe():
         return jsonify({"error": str(re)}), 500
     except Exception as e:
         current_app.logger.error(f"Unexpected error: {str(e)}")
-        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
\ No newline at end of file
+        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
+
+def _start_transcription(path, title, content_hash):
+    """Queue the Celery transcription task for an uploaded file."""
+    from app.tasks.transcription_tasks import process_transcription
+    task = process_transcription.delay(path, title, current_user.id, content_hash=content_hash)
+    current_app.logger.info(f"Startade Celery-task med ID: {task.id}")
+    return task
+
+@main.route('/api/uploads', methods=['POST'])
+@login_required
+def api_upload_create():
+    """Start a resumable chunked upload."""
+    data = request.get_json(silent=True) or {}
+    filename = data.get('filename') or ''
+    if not allowed_file(filename):
+        return jsonify({"error": "Unsupported audio file. Allowed formats are WAV, MP3, M4A, MP4, OGG and WebM."}), 415
+    
+    try:
+        meta = chunked_upload.create_session(
+            current_user.id,
+            secure_filename(filename),
+            data.get('size', 0),
+            current_app.config['MAX_CONTENT_LENGTH'],
+            title=data.get('title'),
+            chunk_size=data.get('chunk_size')
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    
+    meta['received'] = []
+    return jsonify(meta), 201
+
+@main.route('/api/uploads/<upload_id>', methods=['GET'])
+@login_required
+def api_upload_status(upload_id):
+    """Chunks received so far, so an interrupted upload can resume."""
+    try:
+        return jsonify(chunked_upload.load_session(upload_id, current_user.id))
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+
+@main.route('/api/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def api_upload_discard(upload_id):
+    """Abort an upload and remove its chunks."""
+    try:
+        chunked_upload.discard(upload_id, current_user.id)
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    return jsonify({"status": "discarded"})
+
+@main.route('/api/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+@login_required
+def api_upload_chunk(upload_id, index):
+    """Store one chunk of an upload at its offset on disk."""
+    try:
+        meta = chunked_upload.write_chunk(
+            upload_id, current_user.id, index, request.stream,
+            checksum=request.headers.get('X-Chunk-SHA256')
+        )
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    return jsonify({
+        "upload_id": upload_id,
+        "index": index,
+        "received": len(meta['received']),
+        "total_chunks": meta['total_chunks']
+    })
+
+@main.route('/api/uploads/<upload_id>/finalize', methods=['POST'])
+@login_required
+def api_upload_finalize(upload_id):
+    """Verify the assembled upload and queue it for transcription."""
+    data = request.get_json(silent=True) or {}
+    try:
+        path, content_hash, meta = chunked_upload.finalize(upload_id, current_user.id, checksum=data.get('sha256'))
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+    
+    if not allowed_file(meta['filename'], path):
+        release(path)
+        return jsonify({"error": "Unsupported or corrupt audio file. Allowed formats are WAV, MP3, M4A, MP4, OGG and WebM."}), 415
+    
+    current_app.logger.info(f"Sparade fil tillfälligt till: {path} (sha256 {content_hash[:12]})")
+    
+    title = meta.get('title')
+    if not title or title.strip() == '':
+        title = 'Transkription ' + datetime.datetime.now().strftime('%Y-%m-%d %H:%M')
+    
+    try:
+        task = _start_transcription(path, title, content_hash)
+    except Exception as e:
+        current_app.logger.error(f"Unexpected error: {str(e)}")
+        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
+    
+    session['current_task_id'] = task.id
+    return jsonify({
+        "status": "processing",
+        "task_id": task.id,
+        "redirect": url_for('main.transcription_status', task_id=task.id),
+        "message": "Transcription is being processed"
+    })
+
+@main.route('/api/live', methods=['POST'])
+@login_required
+def api_live_create():
+    """Start a live recording that is transcribed while it is recorded."""
+    data = request.get_json(silent=True) or {}
+    meta = live_transcription.create_session(current_user.id, title=data.get('title'))
+    return jsonify(meta), 201
+
+@main.route('/api/live/<session_id>', methods=['GET'])
+@login_required
+def api_live_status(session_id):
+    """Slices received and the text transcribed so far."""
+    try:
+        meta = live_transcription.load_session(session_id, current_user.id)
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+
+    meta['text'] = live_transcription.transcript(session_id)
+    return jsonify(meta)
+
+@main.route('/api/live/<session_id>', methods=['DELETE'])
+@login_required
+def api_live_discard(session_id):
+    """Abort a live recording and remove it."""
+    try:
+        live_transcription.load_session(session_id, current_user.id)
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+
+    live_transcription.discard(session_id)
+    return jsonify({"status": "discarded"})
+
+@main.route('/api/live/<session_id>/slices/<int:index>', methods=['PUT'])
+@login_required
+def api_live_slice(session_id, index):
+    """Append one recorded slice and queue transcription of what is ready."""
+    from app.tasks.transcription_tasks import transcribe_live_slices
+
+    try:
+        meta = live_transcription.append_slice(session_id, current_user.id, index, request.stream)
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+
+    transcribe_live_slices.delay(session_id)
+    return jsonify({
+        "session_id": session_id,
+        "index": index,
+        "slices": meta['slices'],
+        "transcribed_ms": meta['transcribed_ms']
+    })
+
+@main.route('/api/live/<session_id>/finish', methods=['POST'])
+@login_required
+def api_live_finish(session_id):
+    """Stop a live recording: transcribe the last part, summarize and save."""
+    from app.tasks.transcription_tasks import finish_live_transcription
+
+    data = request.get_json(silent=True) or {}
+    try:
+        meta = live_transcription.load_session(session_id, current_user.id)
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    if not meta['slices']:
+        return jsonify({"error": "Inspelningen är tom"}), 409
+
+    title = data.get('title') or meta.get('title')
+    if not title or title.strip() == '':
+        title = 'Transkription ' + datetime.datetime.now().strftime('%Y-%m-%d %H:%M')
+
+    try:
+        task = finish_live_transcription.delay(session_id, title, current_user.id)
+        current_app.logger.info(f"Startade Celery-task med ID: {task.id}")
+    except Exception as e:
+        current_app.logger.error(f"Unexpected error: {str(e)}")
+        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
+
+    session['current_task_id'] = task.id
+    return jsonify({
+        "status": "processing",
+        "task_id": task.id,
+        "redirect": url_for('main.transcription_status', task_id=task.id),
+        "message": "Transcription is being processed"
+    })
+
+@main.route('/api/cache/stats', methods=['GET'])
+@login_required
+def api_cache_stats():
+    """Hit and miss counters for the audio dedupe cache and the summary cache (admins only)."""
+    if not current_user.is_admin:
+        return jsonify({"error": "Admin access required"}), 403
+    return jsonify({**cache_stats(), "summary": summary_cache.cache_stats()})
+
+@main.route('/api/models/health', methods=['GET'])
+@login_required
+def api_model_health():
+    """Circuit breaker state and latency of each summary model (admins only)."""
+    if not current_user.is_admin:
+        return jsonify({"error": "Admin access required"}), 403
+    return jsonify({"models": router_status()})
+
+@main.route('/api/summaries/batch', methods=['GET'])
+@login_required
+def api_summary_batch_status():
+    """Number of deferred batch summaries in each state (admins only)."""
+    if not current_user.is_admin:
+        return jsonify({"error": "Admin access required"}), 403
+    return jsonify({"jobs": summary_batch.queue_stats()})
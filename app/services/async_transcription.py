@@ -0,0 +1,115 @@
+"""
+Asynkron motor för många samtidiga Whisper-anrop.
+
+Att transkribera är nästan bara väntan på nätverket. Istället för en tråd
+eller process per utestående anrop körs alla anrop för ett jobb som
+korutiner i en event loop, med en semafor som begränsar hur många som är
+ute samtidigt. Svaren samlas i samma ordning som delarna, varje anrop har
+en egen tidsgräns, och om ett anrop misslyckas avbryts resten.
+
+Motorn anropas synkront (t.ex. från en Celery-task) via
+run_transcriptions(), som kör en egen event loop tills alla delar är klara.
+"""
+import os
+import asyncio
+import logging
+from app.services.openai_client import build_async_client
+from app.services.rate_limiter import call_with_backoff_async, WHISPER
+
+logger = logging.getLogger("async_transcription")
+
+
+def request_timeout():
+    """Tidsgräns per Whisper-anrop i sekunder, från WHISPER_REQUEST_TIMEOUT."""
+    return float(os.environ.get('WHISPER_REQUEST_TIMEOUT', 300))
+
+
+async def _create_transcription(client, file, model, language, timeout):
+    """Ett anrop inom den gemensamma kvoten; tidsgränsen gäller varje försök."""
+    def request():
+        file.seek(0)
+        return asyncio.wait_for(
+            client.audio.transcriptions.create(model=model, file=file, language=language), timeout
+        )
+    return await call_with_backoff_async(WHISPER, request)
+
+
+async def _transcribe_one(client, semaphore, aborted, source, model, language, timeout):
+    """Transkriberar en del när semaforen släpper fram den, om inget annat anrop har misslyckats."""
+    async with semaphore:
+        if aborted.is_set():
+            raise asyncio.CancelledError()
+        if hasattr(source, 'read'):
+            response = await _create_transcription(client, source, model, language, timeout)
+        else:
+            with open(source, 'rb') as f:
+                response = await _create_transcription(client, f, model, language, timeout)
+        return response.text
+
+
+async def transcribe_concurrently(client, sources, model, language, max_in_flight, timeout=None, on_done=None):
+    """
+    Transkriberar alla delar med högst max_in_flight anrop åt gången.
+
+    Args:
+        client: openai.AsyncOpenAI (eller motsvarande)
+        sources: Fil-liknande objekt eller sökvägar, i ordning
+        max_in_flight: Högsta antal samtidiga anrop
+        timeout: Tidsgräns per anrop i sekunder (None för ingen)
+        on_done: Anropas med (index, antal klara) när en del är klar (valfritt)
+
+    Returns:
+        list: Texterna i samma ordning som sources
+
+    Raises:
+        Det första felet från ett anrop (asyncio.TimeoutError vid tidsgräns).
+        Övriga anrop avbryts innan felet lyfts.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_in_flight))
+    aborted = asyncio.Event()
+    done = 0
+
+    async def run(index, source):
+        nonlocal done
+        try:
+            text = await _transcribe_one(client, semaphore, aborted, source, model, language, timeout)
+        except Exception:
+            # Sätts innan nästa väntande del hinner ta den lediga platsen
+            aborted.set()
+            raise
+        done += 1
+        if on_done:
+            on_done(index, done)
+        return text
+
+    tasks = [asyncio.ensure_future(run(i, source)) for i, source in enumerate(sources)]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+def run_transcriptions(sources, api_key, model, language, max_in_flight, timeout=None, on_done=None):
+    """
+    Synkron ingång till motorn, för Celery-tasks och annan synkron kod.
+
+    En asynkron klient med poolade anslutningar byggs för körningen och
+    stängs när alla delar är klara.
+
+    Returns:
+        list: Texterna i samma ordning som sources
+    """
+    if timeout is None:
+        timeout = request_timeout()
+
+    async def main():
+        async with build_async_client(api_key) as client:
+            return await transcribe_concurrently(
+                client, sources, model, language, max_in_flight, timeout=timeout, on_done=on_done
+            )
+
+    logger.info(f"Transkriberar {len(sources)} delar asynkront, högst {max_in_flight} samtidigt")
+    return asyncio.run(main())
@@ -0,0 +1,132 @@
+"""
+Innehållsadresserad cache för uppladdat ljud.
+
+Uppladdningen hashas (SHA-256) medan den sparas till disk. Samma inspelning
+som laddas upp igen, t.ex. vid ett nytt försök efter en timeout eller en
+dubbel inskickning, ger samma hash och kan då återanvända transkription och
+sammanfattning utan nya anrop till Whisper och GPT.
+"""
+import hashlib
+import logging
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.audio_cache import AudioCacheEntry, CacheCounter
+from app.services.processed_audio import ProcessedAudio
+
+logger = logging.getLogger("audio_cache")
+
+# Blockstorlek vid sparning och hashning
+CHUNK_SIZE = 1024 * 1024
+
+HIT_COUNTER = 'audio_cache_hits'
+MISS_COUNTER = 'audio_cache_misses'
+
+
+def save_and_hash(stream, destination_path):
+    """
+    Sparar en uppladdning till disk och beräknar dess SHA-256 i samma pass.
+    
+    Args:
+        stream: Fil-liknande objekt med uppladdningen (t.ex. FileStorage.stream)
+        destination_path: Sökväg dit filen skrivs
+        
+    Returns:
+        str: Hexadecimal SHA-256 för innehållet
+    """
+    digest = hashlib.sha256()
+    with open(destination_path, 'wb') as destination:
+        while chunk := stream.read(CHUNK_SIZE):
+            digest.update(chunk)
+            destination.write(chunk)
+    return digest.hexdigest()
+
+
+def hash_file(path):
+    """SHA-256 för en fil som redan finns på disk, läst via en minnesmappning."""
+    with ProcessedAudio(path, owned=False).buffer() as data:
+        return hashlib.sha256(data).hexdigest()
+
+
+def increment_counter(name):
+    """Räknar upp en delad räknare med en atomisk UPDATE."""
+    updated = CacheCounter.query.filter_by(name=name).update({CacheCounter.value: CacheCounter.value + 1})
+    if not updated:
+        db.session.add(CacheCounter(name=name, value=1))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # En annan process skapade räknaren samtidigt
+        db.session.rollback()
+        increment_counter(name)
+
+
+def lookup(content_hash, whisper_model, language, prompt_version):
+    """
+    Hämtar en cachad transkription och räknar träffen eller missen.
+    
+    Returns:
+        AudioCacheEntry: Cachad post, eller None om ingen finns
+    """
+    entry = AudioCacheEntry.query.filter_by(
+        content_hash=content_hash,
+        whisper_model=whisper_model,
+        language=language,
+        prompt_version=prompt_version
+    ).first()
+    
+    if entry is None:
+        logger.info(f"Cachemiss för {content_hash[:12]}")
+        increment_counter(MISS_COUNTER)
+        return None
+    
+    logger.info(f"Cacheträff för {content_hash[:12]}")
+    entry.hit_count += 1
+    entry.last_hit_at = datetime.utcnow()
+    db.session.commit()
+    increment_counter(HIT_COUNTER)
+    return entry
+
+
+def store(content_hash, whisper_model, language, prompt_version, transcription_text, summary):
+    """
+    Sparar transkription och sammanfattning för en hash.
+    
+    Om samma inspelning bearbetades parallellt och redan har sparats
+    behålls den befintliga posten.
+    """
+    entry = AudioCacheEntry(
+        content_hash=content_hash,
+        whisper_model=whisper_model,
+        language=language,
+        prompt_version=prompt_version,
+        transcription_text=transcription_text,
+        summary=summary
+    )
+    db.session.add(entry)
+    try:
+        db.session.commit()
+        logger.info(f"Cachade transkription för {content_hash[:12]}")
+    except IntegrityError:
+        db.session.rollback()
+        logger.info(f"Transkription för {content_hash[:12]} fanns redan i cachen")
+
+
+def cache_stats():
+    """
+    Returnerar cachens räknare.
+    
+    Returns:
+        dict: hits, misses, hit_rate och entries
+    """
+    counters = {counter.name: counter.value for counter in CacheCounter.query.filter(
+        CacheCounter.name.in_([HIT_COUNTER, MISS_COUNTER])
+    )}
+    hits = counters.get(HIT_COUNTER, 0)
+    misses = counters.get(MISS_COUNTER, 0)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+        'entries': AudioCacheEntry.query.count(),
+    }
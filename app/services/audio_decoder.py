@@ -0,0 +1,314 @@
+"""
+Strömmande avkodning av ljudfiler via en ffmpeg-process.
+
+Istället för att läsa in hela uppladdningen som ett AudioSegment läses
+PCM-data i block av fast storlek från ffmpeg:s stdout. Varje block skrivs
+till en spoolfil på disk och dess energi sparas per ram, så att tal-
+detektering (app.services.vad) och kodning kan göras utan att hela ljudet
+hålls i minnet.
+"""
+import os
+import math
+import mmap
+import logging
+import subprocess
+import tempfile
+import numpy as np
+from pydub import AudioSegment
+from pydub.audio_segment import read_wav_audio
+from pydub.exceptions import CouldntDecodeError
+from app.services.vad import frame_energies
+from app.services.export_planner import OPUS_FRAME_MS
+
+logger = logging.getLogger("audio_decoder")
+
+# Strömmade block avkodas alltid till 16-bitars mono
+SAMPLE_WIDTH = 2
+DEFAULT_SAMPLE_RATE = 16000
+DEFAULT_BLOCK_MS = 1000
+
+# ffmpeg-kodare per utdatacodec
+ENCODERS = {'mp3': 'libmp3lame', 'opus': 'libopus'}
+
+
+def _read_exact(stream, size):
+    """Läs upp till size bytes från en pipe, returnerar färre endast vid EOF."""
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def iter_pcm_blocks(input_path, sample_rate=DEFAULT_SAMPLE_RATE, block_ms=DEFAULT_BLOCK_MS,
+                    low_pass_hz=4000, input_format=None, start_ms=0):
+    """
+    Avkodar en ljudfil med ffmpeg och ger PCM-block av fast storlek.
+
+    ffmpeg sköter nedmixning till mono, omsampling och lågpassfiltrering,
+    så blocken är redo för taldetektering och kodning.
+
+    Args:
+        input_path: Sökväg till indatafilen
+        sample_rate: Samplingsfrekvens för utdata
+        block_ms: Blockstorlek i millisekunder
+        low_pass_hz: Brytfrekvens för lågpassfiltret (None för inget filter)
+        input_format: Indataformat från app.services.audio_format (None låter ffmpeg gissa)
+        start_ms: Position i indatan där avkodningen börjar. ffmpeg söker i
+            indatan, så ljudet före positionen avkodas inte; med accurate_seek
+            (standard) är positionen exakt även för filer utan sökindex
+            (t.ex. från MediaRecorder).
+
+    Yields:
+        numpy.ndarray: int16-sampel, block_ms långt (sista blocket kan vara kortare)
+    """
+    command = [
+        AudioSegment.converter, '-nostdin', '-hide_banner', '-loglevel', 'error',
+    ]
+    if start_ms:
+        command += ['-ss', f"{start_ms / 1000:.3f}"]
+    if input_format:
+        command += ['-f', input_format]
+    command += ['-i', input_path]
+    command += ['-vn', '-ac', '1', '-ar', str(sample_rate)]
+    if low_pass_hz:
+        command += ['-af', f'lowpass=f={low_pass_hz}']
+    command += ['-f', 's16le', '-acodec', 'pcm_s16le', '-']
+
+    block_bytes = sample_rate * block_ms // 1000 * SAMPLE_WIDTH
+
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr_file)
+        try:
+            while True:
+                data = _read_exact(process.stdout, block_bytes)
+                if len(data) % SAMPLE_WIDTH:
+                    data = data[:-(len(data) % SAMPLE_WIDTH)]
+                if data:
+                    yield np.frombuffer(data, dtype=np.int16)
+                if len(data) < block_bytes:
+                    break
+        finally:
+            process.stdout.close()
+            if process.poll() is None:
+                process.kill()
+            returncode = process.wait()
+
+        if returncode != 0:
+            stderr_file.seek(0)
+            stderr = stderr_file.read().decode('utf-8', errors='replace').strip()
+            raise RuntimeError(f"ffmpeg kunde inte avkoda {input_path}: {stderr or returncode}")
+
+
+def spool_pcm(input_path, spool_file, sample_rate=DEFAULT_SAMPLE_RATE, frame_ms=100,
+              block_ms=DEFAULT_BLOCK_MS, low_pass_hz=4000, input_format=None):
+    """
+    Avkodar en ljudfil blockvis till en spoolfil och beräknar ramenergier.
+
+    Args:
+        input_path: Sökväg till indatafilen
+        spool_file: Öppen binär fil dit rå PCM skrivs
+        sample_rate: Samplingsfrekvens för utdata
+        frame_ms: Ramlängd för energiberäkningen, måste dela block_ms jämnt
+        block_ms: Blockstorlek för läsning från ffmpeg
+        low_pass_hz: Brytfrekvens för lågpassfiltret
+        input_format: Indataformat från app.services.audio_format (valfritt)
+
+    Returns:
+        tuple: (ramenergier som int64-array med kvadratsummor, totalt antal sampel)
+    """
+    if block_ms % frame_ms:
+        raise ValueError("block_ms måste vara en multipel av frame_ms")
+
+    frame_len = sample_rate * frame_ms // 1000
+    energies = []
+    total_samples = 0
+
+    for block in iter_pcm_blocks(input_path, sample_rate, block_ms, low_pass_hz, input_format):
+        spool_file.write(block.tobytes())
+        total_samples += len(block)
+
+        full = len(block) // frame_len * frame_len
+        if full:
+            energies.append(frame_energies(block[:full].reshape(-1, frame_len)))
+        if full < len(block):
+            energies.append(np.array([frame_energies(block[full:]).sum()], dtype=np.int64))
+
+    spool_file.flush()
+    if not energies:
+        return np.zeros(0, dtype=np.int64), total_samples
+    return np.concatenate(energies), total_samples
+
+
+def encoder_options(codec):
+    """
+    Extra ffmpeg-argument för kodaren till en utdatacodec (utöver codec och bitrate).
+
+    Opus kodas med hård CBR och långa ramar för tal, så att storleken blir
+    förutsägbar (se app.services.export_planner) och containeroverheaden liten.
+    """
+    if codec not in ENCODERS:
+        raise ValueError(f"Okänd utdatacodec: {codec}")
+    if codec == 'opus':
+        return ['-vbr', 'off', '-application', 'voip', '-frame_duration', str(OPUS_FRAME_MS)]
+    return []
+
+
+def encode_ranges(spool_file, ranges, output_path, sample_rate=DEFAULT_SAMPLE_RATE,
+                  output_rate=None, bitrate="32k", gap_ms=100, pad_ms=300,
+                  block_ms=DEFAULT_BLOCK_MS, codec='mp3'):
+    """
+    Strömmar utvalda intervall från en spoolfil genom en kodare.
+
+    Intervallen separeras med gap_ms tystnad och hela utdatan omges av
+    pad_ms tystnad, som i den minnesbaserade optimeringen.
+
+    Args:
+        spool_file: Öppen binär spoolfil med rå 16-bitars mono PCM
+        ranges: Lista med [start, slut] i millisekunder
+        output_path: Sökväg för den kodade filen
+        sample_rate: Samplingsfrekvens i spoolfilen
+        output_rate: Samplingsfrekvens i utdatan (standard samma som indata)
+        bitrate: Bitrate för kodaren
+        codec: 'mp3' eller 'opus' (containern följer av filändelsen)
+
+    Returns:
+        int: Antal PCM-bytes som skickades till kodaren
+    """
+    command = [
+        AudioSegment.converter, '-nostdin', '-hide_banner', '-loglevel', 'error', '-y',
+        '-f', 's16le', '-ar', str(sample_rate), '-ac', '1', '-i', '-',
+    ]
+    if output_rate and output_rate != sample_rate:
+        command += ['-ar', str(output_rate)]
+    command += ['-codec:a', ENCODERS[codec], '-b:a', bitrate] + encoder_options(codec) + [output_path]
+
+    bytes_per_ms = sample_rate * SAMPLE_WIDTH // 1000
+    block_bytes = block_ms * bytes_per_ms
+    buffer = bytearray(block_bytes)
+    written = 0
+
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=stderr_file)
+        try:
+            def write(data):
+                nonlocal written
+                process.stdin.write(data)
+                written += len(data)
+
+            write(bytes(pad_ms * bytes_per_ms))
+            for i, (start, end) in enumerate(ranges):
+                if i > 0:
+                    write(bytes(gap_ms * bytes_per_ms))
+                spool_file.seek(start * bytes_per_ms)
+                remaining = (end - start) * bytes_per_ms
+                while remaining > 0:
+                    view = memoryview(buffer)[:min(block_bytes, remaining)]
+                    read = spool_file.readinto(view)
+                    if not read:
+                        break
+                    write(view[:read])
+                    remaining -= read
+            write(bytes(pad_ms * bytes_per_ms))
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = process.wait()
+
+        if returncode != 0:
+            stderr_file.seek(0)
+            stderr = stderr_file.read().decode('utf-8', errors='replace').strip()
+            raise RuntimeError(f"ffmpeg kunde inte koda {output_path}: {stderr or returncode}")
+
+    logger.info(f"Kodade {written} bytes PCM till {output_path}")
+    return written
+
+
+def streaming_threshold_bytes():
+    """Filstorlek från vilken optimeringen strömmar istället för att läsa in hela filen."""
+    return int(float(os.environ.get('AUDIO_STREAMING_THRESHOLD_MB', 10)) * 1024 * 1024)
+
+
+def frame_length(sample_rate=DEFAULT_SAMPLE_RATE, min_silence_len=1000, seek_step=100):
+    """Största ramlängd (i sampel) som delar både fönsterlängd och steglängd."""
+    return sample_rate * math.gcd(min_silence_len, seek_step) // 1000
+
+
+def split_encoded(input_path, chunks):
+    """
+    Delar en kodad ljudfil i flera filer utan omkodning (ffmpeg -c copy).
+
+    Args:
+        input_path: Sökväg till den kodade filen
+        chunks: Lista med [start, slut] i millisekunder
+
+    Returns:
+        list: Sökvägar till delfilerna, i samma ordning som chunks
+    """
+    base, extension = os.path.splitext(input_path)
+    paths = []
+    try:
+        for i, (start, end) in enumerate(chunks):
+            chunk_path = f"{base}_part{i:03d}{extension}"
+            command = [
+                AudioSegment.converter, '-nostdin', '-hide_banner', '-loglevel', 'error', '-y',
+                '-i', input_path, '-ss', f"{start / 1000:.3f}", '-to', f"{end / 1000:.3f}",
+                '-c', 'copy', chunk_path,
+            ]
+            result = subprocess.run(command, capture_output=True)
+            if result.returncode != 0:
+                stderr = result.stderr.decode('utf-8', errors='replace').strip()
+                raise RuntimeError(f"ffmpeg kunde inte dela {input_path}: {stderr or result.returncode}")
+            paths.append(chunk_path)
+    except Exception:
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+
+    logger.info(f"Delade {input_path} i {len(paths)} delar")
+    return paths
+
+
+def load_wav(input_path):
+    """
+    Läser en okomprimerad WAV-fil som ett AudioSegment via en minnesmappning.
+
+    Sampeldatan i AudioSegment:et är en vy över den mappade filen, så
+    varken filen eller sampeldatan kopieras till processens heap. Mappningen
+    frigörs när AudioSegment:et inte längre används.
+
+    Returns:
+        AudioSegment: Ljudet, eller None om filen inte kan mappas direkt
+            (tom fil, RF64, flyttal, WAVE_FORMAT_EXTENSIBLE, 8- eller
+            24-bitars sampel) och bör avkodas av ffmpeg
+    """
+    with open(input_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    view = memoryview(mapped)
+    wav = None
+    if view[:4] == b'RIFF' and view[8:12] == b'WAVE':
+        try:
+            wav = read_wav_audio(view)
+        except CouldntDecodeError:
+            wav = None
+    if wav is None or wav.audio_format != 1 or wav.bits_per_sample not in (16, 32):
+        # Vyerna måste släppas innan mappningen kan stängas
+        wav = None
+        view.release()
+        mapped.close()
+        return None
+
+    return AudioSegment(
+        data=wav.raw_data,
+        sample_width=wav.bits_per_sample // 8,
+        frame_rate=wav.sample_rate,
+        channels=wav.channels
+    )
@@ -0,0 +1,155 @@
+"""
+NumPy-baserade ljudoperationer för optimeringen inför Whisper.
+
+Arbetar direkt på sampeldatan i ett AudioSegment istället för att bygga
+nya AudioSegment-objekt steg för steg, vilket undviker upprepade kopior
+av hela ljudet.
+"""
+import logging
+import numpy as np
+from pydub import AudioSegment
+from app.services.vad import audio_to_array
+
+logger = logging.getLogger("audio_dsp")
+
+
+def assemble_segments(audio, ranges, gap_ms=100, pad_ms=300):
+    """
+    Sätter ihop talsegment till ett nytt AudioSegment med en enda allokering.
+
+    Utdatans längd beräknas först, varefter segmenten kopieras in i en
+    förallokerad och nollställd buffert. Tystnad mellan segmenten och
+    utfyllnaden i början och slutet kostar därför ingen kopiering.
+
+    Args:
+        audio: AudioSegment att klippa ur
+        ranges: Lista med [start, slut] i millisekunder
+        gap_ms: Tystnad mellan segmenten i millisekunder
+        pad_ms: Tystnad före första och efter sista segmentet i millisekunder
+
+    Returns:
+        tuple: (AudioSegment med segmenten, antal kopierade bytes)
+    """
+    samples = audio_to_array(audio)
+    frame_rate = audio.frame_rate
+    num_frames = len(samples)
+
+    # Samma omräkning från millisekunder till ramar som vid audio[start:end]
+    bounds = np.asarray(ranges, dtype=np.int64).reshape(-1, 2)
+    firsts = np.minimum((bounds[:, 0] * frame_rate / 1000.0).astype(np.int64), num_frames)
+    lasts = np.minimum((bounds[:, 1] * frame_rate / 1000.0).astype(np.int64), num_frames)
+    lengths = np.maximum(lasts - firsts, 0)
+
+    gap = int(gap_ms * frame_rate / 1000)
+    pad = int(pad_ms * frame_rate / 1000)
+    total = int(lengths.sum()) + gap * max(len(lengths) - 1, 0) + 2 * pad
+
+    buffer = bytearray(total * audio.frame_width)
+    output = np.frombuffer(buffer, dtype=samples.dtype).reshape(-1, audio.channels)
+
+    position = pad
+    for first, length in zip(firsts.tolist(), lengths.tolist()):
+        output[position:position + length] = samples[first:first + length]
+        position += length + gap
+
+    copied = int(lengths.sum()) * audio.frame_width
+    logger.info(f"Satte ihop {len(lengths)} segment, {copied} bytes kopierade")
+
+    assembled = AudioSegment(
+        data=buffer,
+        sample_width=audio.sample_width,
+        frame_rate=frame_rate,
+        channels=audio.channels
+    )
+    return assembled, copied
+
+
+def _design_filter_bank(up, down, source_rate, cutoff_hz, zero_crossings):
+    """
+    Skapar ett polyfasfilter (ett fönstrat sinc-filter per fas).
+
+    Brytfrekvensen sätts till det lägsta av cutoff_hz och Nyquist-
+    frekvensen för in- och utdata, så att lågpassfiltret och anti-
+    aliasfiltret för omsamplingen blir samma filter. Filterlängden väljs
+    så att sinc-funktionen har zero_crossings nollgenomgångar på varje
+    sida, vilket ger samma övergångsband oavsett indatans frekvens.
+
+    Returns:
+        numpy.ndarray: Filterkoefficienter med form (up, 2 * half_taps)
+    """
+    target_rate = source_rate * up / down
+    cutoff = min(cutoff_hz, 0.5 * source_rate, 0.5 * target_rate) / source_rate
+    half_taps = int(np.ceil(zero_crossings / (2 * cutoff)))
+
+    # Tap k för fas p ligger (k - p / up) insampel från utdatasamplet
+    offsets = np.arange(-half_taps + 1, half_taps + 1)[None, :] - np.arange(up)[:, None] / up
+    window = np.kaiser(2 * half_taps + 1, 8.0)
+    bank = 2 * cutoff * np.sinc(2 * cutoff * offsets) * np.interp(
+        offsets + half_taps, np.arange(2 * half_taps + 1), window
+    )
+    bank /= bank.sum(axis=1, keepdims=True)
+    return bank.astype(np.float32)
+
+
+def to_whisper_format(audio, target_rate=16000, cutoff_hz=4000, zero_crossings=8, chunk_frames=1 << 18):
+    """
+    Mixar ned till mono, lågpassfiltrerar och omsamplar i ett enda pass.
+
+    Ersätter low_pass_filter(), set_channels(1) och set_frame_rate(), som
+    var för sig går igenom och kopierar hela ljudet (low_pass_filter med en
+    Python-loop per sampel). Här beräknas varje utdatasampel direkt ur
+    indatan med ett polyfasfilter, bit för bit, så att endast utdatan och
+    en begränsad arbetsbuffert allokeras.
+
+    Args:
+        audio: AudioSegment i godtyckligt format
+        target_rate: Samplingsfrekvens för utdata
+        cutoff_hz: Lågpassfiltrets brytfrekvens
+        zero_crossings: Filterlängd uttryckt i nollgenomgångar per sida
+        chunk_frames: Ungefärligt antal utdatasampel som beräknas per bit
+
+    Returns:
+        AudioSegment: Mono-ljud med target_rate och samma sampelbredd som indata
+    """
+    samples = audio_to_array(audio)
+    source_rate = audio.frame_rate
+    common = np.gcd(source_rate, target_rate)
+    up, down = target_rate // common, source_rate // common
+
+    bank = _design_filter_bank(up, down, source_rate, cutoff_hz, zero_crossings)
+    half_taps = bank.shape[1] // 2
+    num_in = len(samples)
+    num_out = (num_in * up + down - 1) // down
+    info = np.iinfo(samples.dtype)
+    output = np.empty(num_out, dtype=samples.dtype)
+
+    # Bitarna börjar på en multipel av up, så att utdatasampel r, r + up,
+    # r + 2 * up, ... i biten har samma fas och ligger down insampel isär.
+    # Deras filterfönster är då en strided vy och filtreras med en matmul.
+    chunk = max(up, chunk_frames // up * up)
+    for start in range(0, num_out, chunk):
+        count = min(chunk, num_out - start)
+        first = start * down // up - half_taps + 1
+        last = (start + count - 1) * down // up + half_taps + 1
+
+        # Insampel som behövs för bitens filterfönster, med nollor utanför ljudet
+        block = np.zeros(last - first, dtype=np.float32)
+        lo, hi = max(first, 0), min(last, num_in)
+        if hi > lo:
+            block[lo - first:hi - first] = samples[lo:hi].mean(axis=1, dtype=np.float32)
+
+        windows = np.lib.stride_tricks.sliding_window_view(block, 2 * half_taps)
+        filtered = np.empty(count, dtype=np.float32)
+        for phase_index in range(min(up, count)):
+            offset, phase = divmod(phase_index * down, up)
+            rows = len(range(phase_index, count, up))
+            filtered[phase_index::up] = windows[offset:offset + (rows - 1) * down + 1:down] @ bank[phase]
+
+        output[start:start + count] = np.clip(np.rint(filtered), info.min, info.max)
+
+    return AudioSegment(
+        data=output.tobytes(),
+        sample_width=audio.sample_width,
+        frame_rate=target_rate,
+        channels=1
+    )
@@ -0,0 +1,105 @@
+"""
+Identifiering av ljudformat utifrån filens inledande bytes (magic bytes).
+
+Formatet avgörs från filhuvudet istället för filändelsen eller genom att
+prova att avkoda filen i flera format. Resultatet väljer avkodaren direkt,
+och filer som inte känns igen kan avvisas utan att ffmpeg startas.
+"""
+import logging
+
+logger = logging.getLogger("audio_format")
+
+SUPPORTED_FORMATS = ('wav', 'mp3', 'm4a', 'mp4', 'ogg', 'webm')
+
+# Antal bytes som läses från början av filen
+HEADER_BYTES = 64
+
+# Hur långt efter en ID3-tagg den första mp3-ramen får ligga
+_MP3_SYNC_WINDOW = 4096
+
+# MP4-varumärken (ftyp major brand) som betyder ljud utan video
+_M4A_BRANDS = {b'M4A ', b'M4B ', b'M4P '}
+
+
+def _id3_size(header):
+    """Storleken på en ID3v2-tagg i bytes, inklusive taggens huvud."""
+    size = 0
+    for byte in header[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if header[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _is_mpeg_audio_frame(header):
+    """Sant om header börjar med ett giltigt huvud för en MPEG-ljudram (layer I-III)."""
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return False
+    version = (header[1] >> 3) & 0x03
+    layer = (header[1] >> 1) & 0x03
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 0x03
+    return version != 0x01 and layer != 0x00 and bitrate_index != 0x0F and sample_rate_index != 0x03
+
+
+def sniff_format(header):
+    """
+    Identifierar ljudformatet från filens första bytes.
+
+    Args:
+        header: Filens inledande bytes (minst HEADER_BYTES för säker identifiering)
+
+    Returns:
+        str: Ett av SUPPORTED_FORMATS, eller None om formatet inte känns igen
+    """
+    if header[:4] in (b'RIFF', b'RF64') and header[8:12] == b'WAVE':
+        return 'wav'
+    if header[:4] == b'OggS':
+        return 'ogg'
+    if header[4:8] == b'ftyp':
+        return 'm4a' if header[8:12] in _M4A_BRANDS else 'mp4'
+    if header[:4] == b'\x1a\x45\xdf\xa3':
+        # EBML-huvud; doctype skiljer WebM från annan Matroska
+        return 'webm' if b'webm' in header[:HEADER_BYTES] else None
+    if header[:3] == b'ID3' or _is_mpeg_audio_frame(header):
+        return 'mp3'
+    return None
+
+
+def detect_format(source):
+    """
+    Identifierar ljudformatet för en fil utan att avkoda den.
+
+    En mp3 med ID3-tagg kontrolleras även efter taggen, så att en fil som
+    bara består av en tagg inte godkänns. Endast några kilobyte läses.
+
+    Args:
+        source: Sökväg eller fil-liknande objekt med seek() (läspositionen återställs)
+
+    Returns:
+        str: Ett av SUPPORTED_FORMATS, eller None om formatet inte känns igen
+    """
+    if hasattr(source, 'read'):
+        position = source.tell()
+        try:
+            return _detect_from_stream(source)
+        finally:
+            source.seek(position)
+
+    with open(source, 'rb') as f:
+        return _detect_from_stream(f)
+
+
+def _detect_from_stream(stream):
+    header = stream.read(HEADER_BYTES)
+    detected = sniff_format(header)
+
+    if detected == 'mp3' and header[:3] == b'ID3' and len(header) >= 10:
+        # Vissa kodare lägger utfyllnad efter taggen, så första ramen söks i ett kort fönster
+        stream.seek(_id3_size(header) - len(header), 1)
+        window = stream.read(_MP3_SYNC_WINDOW)
+        if not any(_is_mpeg_audio_frame(window[i:i + 4]) for i in range(max(len(window) - 3, 0))):
+            detected = None
+
+    if detected is None:
+        logger.warning(f"Okänt ljudformat, filhuvud: {header[:16].hex()}")
+    return detected
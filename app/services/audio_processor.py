@@ -1,11 +1,24 @@
 import os
 import tempfile
+import shutil
 import logging
-from io import BytesIO
 import numpy as np
 from pydub import AudioSegment
-from pydub.silence import detect_nonsilent
-from pydub.effects import low_pass_filter
+from app.services.audio_decoder import (
+    spool_pcm, encode_ranges, encoder_options, split_encoded, load_wav, frame_length,
+    streaming_threshold_bytes, DEFAULT_SAMPLE_RATE, ENCODERS
+)
+from app.services.audio_format import detect_format
+from app.services.vad import (
+    detect_nonsilent, detect_nonsilent_frames, audio_frame_energies, adaptive_silence_settings
+)
+from app.services.audio_dsp import assemble_segments, to_whisper_format
+from app.services.export_planner import (
+    plan_export, compare_plan, plan_chunks, default_max_chunk_seconds, default_output_codec,
+    OUTPUT_EXTENSIONS
+)
+from app.services.processed_audio import ProcessedAudio
+from app.services.spool import spool_path, discard
 from app.utils.progress_tracker import update_task_status, format_size
 
 # Konfigurera loggning
@@ -15,32 +28,33 @@ logging.basicConfig(
 )
 logger = logging.getLogger("audio_processor")
 
+# Blockstorlek när uppladdningar kopieras till disk
+COPY_BUFFER_BYTES = 1024 * 1024
+
+# Minsta tystnadslängd när tystnadströskeln anges explicit
+FIXED_MIN_SILENCE_LEN = 1000
+
 def save_uploaded_file(audio_file):
-    """Sparar en uppladdad fil till en temporär fil på disk."""
+    """
+    Sparar en uppladdad fil till en temporär fil på disk.
+    
+    Fil-liknande objekt kopieras i block, så att uppladdningen aldrig
+    ligger helt i minnet.
+    """
     try:
         # Bestäm filändelse
-        name = getattr(audio_file, 'name', 'audio_file')
+        name = str(getattr(audio_file, 'name', 'audio_file'))
         file_extension = os.path.splitext(name)[1] if '.' in name else '.wav'
         
-        # Skapa temporär fil
-        with tempfile.NamedTemporaryFile(suffix=file_extension, delete=False) as temp_file:
-            temp_path = temp_file.name
-            
-            # Läs innehållet från filen
+        # Skapa temporär fil i ett eget spooljobb
+        temp_path = spool_path(file_extension)
+        with open(temp_path, 'wb') as temp_file:
             if hasattr(audio_file, 'read'):
                 audio_file.seek(0)  # Återställ läsposition
-                content = audio_file.read()
-            elif hasattr(audio_file, 'getvalue'):
-                content = audio_file.getvalue()
+                shutil.copyfileobj(audio_file, temp_file, COPY_BUFFER_BYTES)
+                audio_file.seek(0)  # Återställ läsposition för eventuell återanvändning
             else:
-                content = audio_file
-                
-            # Skriv till temporär fil
-            temp_file.write(content)
-            
-            # Återställ läsposition för eventuell återanvändning
-            if hasattr(audio_file, 'seek'):
-                audio_file.seek(0)
+                temp_file.write(audio_file)
         
         logger.info(f"Sparade uppladdad fil till: {temp_path}")
         return temp_path
@@ -48,16 +62,19 @@ def save_uploaded_file(audio_file):
         logger.error(f"Fel vid sparande av uppladdad fil: {str(e)}")
         raise
 
-def process_audio(audio_file, task_id=None):
+def process_audio(audio_file, task_id=None, split=False):
     """
     Bearbetar en ljudfil för optimal transkribering.
     
     Args:
         audio_file: Fil-liknande objekt med ljuddata
         task_id: ID för framstegsspårning (valfritt)
+        split: Dela upp långa inspelningar i flera delar (se optimize_for_whisper)
         
     Returns:
-        BytesIO: Optimerad ljuddata redo för transkribering
+        tuple: (ProcessedAudio, fel eller None). Med split=True är första
+            elementet en lista med ProcessedAudio i ordning. Anroparen tar
+            bort filerna med cleanup() när de har skickats.
     """
     logger.info("Startar ljudbearbetning...")
     
@@ -106,25 +123,27 @@ def process_audio(audio_file, task_id=None):
         
         try:
             # Bearbeta filen med optimize_for_whisper
-            processed_path = optimize_for_whisper(temp_path, task_id=task_id)
+            result = optimize_for_whisper(temp_path, task_id=task_id, split=split)
+            processed_paths = result if split else [result]
             
-            # Kontrollera att filen existerar och har innehåll
-            if not os.path.exists(processed_path) or os.path.getsize(processed_path) == 0:
-                error_msg = f"Bearbetad fil saknas eller är tom: {processed_path}"
-                logger.error(error_msg)
-                
-                if task_id:
-                    update_task_status(
-                        task_id,
-                        status='error',
-                        message=error_msg,
-                        error=error_msg
-                    )
-                
-                raise RuntimeError("Bearbetad ljudfil är tom eller misslyckades att skapas")
+            # Kontrollera att filerna existerar och har innehåll
+            for processed_path in processed_paths:
+                if not os.path.exists(processed_path) or os.path.getsize(processed_path) == 0:
+                    error_msg = f"Bearbetad fil saknas eller är tom: {processed_path}"
+                    logger.error(error_msg)
+                    
+                    if task_id:
+                        update_task_status(
+                            task_id,
+                            status='error',
+                            message=error_msg,
+                            error=error_msg
+                        )
+                    
+                    raise RuntimeError("Bearbetad ljudfil är tom eller misslyckades att skapas")
             
             # Hämta komprimerad filstorlek
-            comp_size = os.path.getsize(processed_path)
+            comp_size = sum(os.path.getsize(path) for path in processed_paths)
             
             # Uppdatera status med slutresultat
             if task_id:
@@ -139,19 +158,14 @@ def process_audio(audio_file, task_id=None):
                     size_info={'compressed': comp_size}
                 )
             
-            # Läs in den bearbetade filen
-            with open(processed_path, 'rb') as f:
-                processed_audio = BytesIO(f.read())
-                processed_audio.name = os.path.basename(processed_path)
+            # Filerna lämnas över som sökvägar, utan att läsas in i minnet
+            processed_audio = [ProcessedAudio(path) for path in processed_paths]
             
-            # Ta bort temporära filer
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-            if os.path.exists(processed_path) and processed_path != temp_path:
-                os.remove(processed_path)
+            # Ta bort den temporära originalfilen
+            discard(temp_path)
             
             logger.info("Ljudbearbetning slutförd framgångsrikt")
-            return processed_audio, None
+            return (processed_audio if split else processed_audio[0]), None
             
         except Exception as e:
             logger.error(f"Fel vid bearbetning: {str(e)}")
@@ -166,14 +180,9 @@ def process_audio(audio_file, task_id=None):
             
             # Fallback: om bearbetningen misslyckas, returnera ursprungliga filen
             logger.info("Använder obearbetad fil som fallback")
-            with open(temp_path, 'rb') as f:
-                original_audio = BytesIO(f.read())
-                original_audio.name = os.path.basename(temp_path)
-            
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+            original_audio = ProcessedAudio(temp_path)
                 
-            return original_audio, str(e)
+            return ([original_audio] if split else original_audio), str(e)
             
     except Exception as e:
         error_msg = f"Kritiskt fel i process_audio: {str(e)}"
@@ -191,25 +200,39 @@ def process_audio(audio_file, task_id=None):
             
         raise RuntimeError(f"Ljudbearbetningsfel: {str(e)}")
 
-def optimize_for_whisper(input_path, max_size_mb=24, task_id=None):
+def optimize_for_whisper(input_path, max_size_mb=24, task_id=None, streaming=None, split=False,
+                         silence_thresh=None, codec=None):
     """
     Optimerar en ljudfil för Whisper API genom att:
     1. Identifiera och bevara talsegment
     2. Ta bort tystnad
     3. Normalisera ljudet
     4. Konvertera till mono 16kHz
-    5. Exportera som mp3
+    5. Exportera som mp3 eller Opus
     
     Args:
         input_path: Sökväg till indatafilen
         max_size_mb: Maximal filstorlek i MB
         task_id: ID för framstegsspårning (valfritt)
+        streaming: Avkoda blockvis via ffmpeg istället för att läsa in hela
+            filen i minnet. None väljer strömning för filer större än
+            AUDIO_STREAMING_THRESHOLD_MB.
+        split: Dela upp resultatet vid tystnad om det är större än
+            max_size_mb eller längre än WHISPER_MAX_CHUNK_SECONDS
+        silence_thresh: Fast tystnadströskel i dBFS. None härleder tröskel
+            och minsta tystnadslängd från inspelningens brusgolv.
+        codec: Utdatacodec, 'mp3' eller 'opus' (i en Ogg-fil). None väljer
+            AUDIO_OUTPUT_CODEC.
         
     Returns:
-        str: Sökväg till den optimerade filen
+        str: Sökväg till den optimerade filen, eller en lista med sökvägar
+            till delfilerna i ordning om split=True. Filerna skrivs i samma
+            spooljobb som input_path, eller i ett nytt om den ligger utanför
+            spoolen.
     """
     try:
         logger.info(f"Optimerar fil för Whisper: {input_path}")
+        codec = codec or default_output_codec()
         
         # Verifiera att filen existerar
         if not os.path.exists(input_path):
@@ -225,6 +248,30 @@ def optimize_for_whisper(input_path, max_size_mb=24, task_id=None):
                 
             raise RuntimeError(error_msg)
         
+        # Identifiera formatet från filhuvudet, så att rätt avkodare väljs direkt
+        input_format = detect_format(input_path)
+        if input_format is None:
+            error_msg = "Okänt eller skadat ljudformat. Tillåtna format är WAV, MP3, M4A, MP4, OGG och WebM."
+            
+            if task_id:
+                update_task_status(
+                    task_id,
+                    status='error',
+                    message=error_msg,
+                    error=error_msg
+                )
+                
+            raise RuntimeError(error_msg)
+        
+        logger.info(f"Identifierat format: {input_format}")
+        
+        if streaming is None:
+            streaming = os.path.getsize(input_path) > streaming_threshold_bytes()
+        
+        if streaming:
+            return _optimize_streaming(input_path, max_size_mb, task_id, split, input_format,
+                                       silence_thresh, codec)
+        
         # Läs in ljudfilen
         try:
             if task_id:
@@ -235,45 +282,23 @@ def optimize_for_whisper(input_path, max_size_mb=24, task_id=None):
                     time_left=15
                 )
                 
-            audio = AudioSegment.from_file(input_path)
+            # WAV mappas direkt från disk, övriga format avkodas av ffmpeg
+            audio = load_wav(input_path) if input_format == 'wav' else None
+            if audio is None:
+                audio = AudioSegment.from_file(input_path, format=input_format)
         except Exception as e:
-            logger.error(f"Kunde inte läsa in ljudfil: {str(e)}")
+            error_msg = f"Kunde inte läsa in ljudfilen som {input_format}: {str(e)}"
+            logger.error(error_msg)
             
             if task_id:
                 update_task_status(
                     task_id,
-                    progress=12,
-                    message="Provar alternativa ljudformat...",
-                    time_left=15
+                    status='error',
+                    message=error_msg,
+                    error=error_msg
                 )
-            
-            # Försök med olika format
-            for format in ['wav', 'mp3', 'm4a', 'ogg']:
-                try:
-                    logger.info(f"Försöker läsa in som {format}")
-                    audio = AudioSegment.from_file(input_path, format=format)
-                    
-                    if task_id:
-                        update_task_status(
-                            task_id,
-                            message=f"Ljudfil inläst som {format}-format",
-                        )
-                        
-                    break
-                except Exception:
-                    continue
-            else:
-                error_msg = f"Kunde inte läsa in ljudfilen i något av de vanligaste formaten: {str(e)}"
                 
-                if task_id:
-                    update_task_status(
-                        task_id,
-                        status='error',
-                        message=error_msg,
-                        error=error_msg
-                    )
-                    
-                raise RuntimeError(error_msg)
+            raise RuntimeError(error_msg)
         
         # Logga ursprunglig ljudinformation
         original_duration = len(audio) / 1000
@@ -296,13 +321,33 @@ def optimize_for_whisper(input_path, max_size_mb=24, task_id=None):
                 time_left=12
             )
             
+        if silence_thresh is None:
+            energies, frame_len = audio_frame_energies(audio)
+            settings = _silence_settings(energies, frame_len, audio.sample_width)
+        else:
+            settings = {'silence_thresh': silence_thresh, 'min_silence_len': FIXED_MIN_SILENCE_LEN}
+        
         nonsilent = detect_nonsilent(
             audio, 
-            silence_thresh=-45,
-            min_silence_len=1000,
+            silence_thresh=settings['silence_thresh'],
+            min_silence_len=settings['min_silence_len'],
             seek_step=100
         )
         
+        # Nedmixning, lågpassfilter och omsampling i ett pass, innan segmenten
+        # sätts ihop, så att sammanfogningen kopierar 16kHz mono istället för
+        # originalets format
+        if task_id:
+            update_task_status(
+                task_id,
+                progress=16,
+                message="Bearbetar ljud (filtrering, konvertering)...",
+                time_left=10
+            )
+        
+        whisper_audio = to_whisper_format(audio, target_rate=16000, cutoff_hz=4000)
+        del audio
+        
         if len(nonsilent) == 0:
             logger.warning("Inga icke-tysta segment hittades, använder hela filen")
             
@@ -312,126 +357,92 @@ def optimize_for_whisper(input_path, max_size_mb=24, task_id=None):
                     message="Inga tydliga talsegment identifierade - använder hela ljudfilen",
                 )
                 
-            processed = audio
+            processed = whisper_audio
+            ranges = [[0, len(whisper_audio)]]
+            padding = 0
         else:
-            # Konkatanera endast icke-tysta segment
-            processed = AudioSegment.empty()
+            ranges = nonsilent
+            padding = 300
             
+            # Konkatanera endast icke-tysta segment i en förallokerad buffert
             if task_id:
                 update_task_status(
                     task_id,
-                    progress=16,
-                    message=f"Bearbetar {len(nonsilent)} talsegment...",
-                    time_left=10
+                    progress=17,
+                    message=f"Sätter ihop {len(nonsilent)} talsegment...",
+                    time_left=8
                 )
-                
-            for i, (start, end) in enumerate(nonsilent):
-                if i % 5 == 0 and task_id:  # Uppdatera var 5:e segment för att inte överbelasta
-                    update_task_status(
-                        task_id,
-                        progress=16 + min(2, int(3 * i / len(nonsilent))),
-                        message=f"Bearbetar talsegment {i+1}/{len(nonsilent)}...",
-                        time_left=10 - min(5, int(5 * i / len(nonsilent)))
-                    )
-                    
-                if len(processed) > 0:
-                    processed += AudioSegment.silent(duration=100)
-                processed += audio[start:end]
             
-            # Lägg till små tystandsbuffertar
-            processed = AudioSegment.silent(duration=300) + processed + AudioSegment.silent(duration=300)
+            processed, copied_bytes = assemble_segments(whisper_audio, nonsilent, gap_ms=100, pad_ms=padding)
+            logger.info(f"Talsegment sammanfogade: {len(nonsilent)} segment, {format_size(copied_bytes)} kopierat")
         
         # Beräkna faktisk talduration
         speech_duration = len(processed) / 1000
-        logger.info(f"Bevarad talduration: {speech_duration:.2f}s")
+        logger.info(f"Bevarad talduration: {speech_duration:.2f}s ({speech_duration/original_duration*100:.1f}% av originalet)")
         
         if task_id:
             update_task_status(
                 task_id,
                 progress=18,
                 message=f"Talduration: {speech_duration:.1f}s ({speech_duration/original_duration*100:.1f}% av originalet)",
-                time_left=8
-            )
-        
-        # Ljudbearbetning
-        if task_id:
-            update_task_status(
-                task_id,
-                progress=19,
-                message="Bearbetar ljud (filtrering, normalisering, konvertering)...",
                 time_left=6
             )
-            
-        processed = low_pass_filter(processed, 4000)
-        processed = processed.set_channels(1).set_frame_rate(16000)
         
-        # Skapa unikt filnamn för utdata
-        output_path = os.path.join(
-            tempfile.gettempdir(), 
-            f"processed_audio_{os.getpid()}_{np.random.randint(1000, 9999)}.mp3"
-        )
+        # Utdata hamnar i samma spooljobb som indata
+        extension = OUTPUT_EXTENSIONS[codec]
+        output_path = spool_path(extension, near=input_path)
         
-        # Säkerställ att temporär katalog existerar
-        os.makedirs(tempfile.gettempdir(), exist_ok=True)
+        # Planera bitrate och samplingsfrekvens utifrån talduration, så att
+        # filen hamnar under storleksgränsen med en enda kodning
+        plan = plan_export(
+            speech_duration, max_size_mb, 
+            max_chunk_seconds=default_max_chunk_seconds() if split else None,
+            codec=codec
+        )
         
-        # Exportera med kompression och bättre felhantering
         if task_id:
             update_task_status(
                 task_id,
                 progress=20,
-                message="Komprimerar och sparar bearbetad ljudfil...",
-                time_left=5
+                message=f"Komprimerar och sparar bearbetad ljudfil ({plan['bitrate']}, {plan['sample_rate']}Hz)...",
+                time_left=5,
+                size_info={'planned': plan['estimated_bytes']}
             )
             
         try:
-            logger.info("Försöker exportera med 32k bitrate")
-            processed.export(output_path, format="mp3", bitrate="32k")
+            logger.info(f"Exporterar som {codec} med {plan['bitrate']} bitrate och {plan['sample_rate']}Hz")
+            processed.export(
+                output_path, 
+                format=extension[1:], 
+                codec=ENCODERS[codec],
+                bitrate=plan['bitrate'],
+                parameters=["-ar", str(plan['sample_rate'])] + encoder_options(codec)
+            )
         except Exception as e:
-            logger.error(f"Fel vid export med 32k bitrate: {str(e)}")
+            logger.error(f"Fel vid export med {plan['bitrate']} bitrate: {str(e)}")
             
             if task_id:
                 update_task_status(
                     task_id,
-                    message="Provar lägre bitrate för bättre kompatibilitet...",
+                    message="Exporterar som WAV-format istället...",
                 )
             
-            # Försök med en lägre bitrate
-            try:
-                logger.info("Försöker med lägre bitrate (16k)")
-                processed.export(output_path, format="mp3", bitrate="16k")
-            except Exception as e2:
-                logger.error(f"Fel vid export med 16k bitrate: {str(e2)}")
-                
-                if task_id:
-                    update_task_status(
-                        task_id,
-                        message="Provar ännu lägre bitrate...",
-                    )
-                
-                # Försök med ännu lägre bitrate
-                try:
-                    logger.info("Försöker med ännu lägre bitrate (8k)")
-                    processed.export(output_path, format="mp3", bitrate="8k")
-                except Exception as e3:
-                    logger.error(f"Fel vid export med 8k bitrate: {str(e3)}")
-                    
-                    if task_id:
-                        update_task_status(
-                            task_id,
-                            message="Exporterar som WAV-format istället...",
-                        )
-                    
-                    # Sista försök: exportera som wav
-                    wav_path = output_path.replace(".mp3", ".wav")
-                    logger.info(f"Försöker exportera som WAV: {wav_path}")
-                    processed.export(wav_path, format="wav")
-                    output_path = wav_path
+            # Sista försök: exportera som wav
+            wav_path = os.path.splitext(output_path)[0] + ".wav"
+            logger.info(f"Försöker exportera som WAV: {wav_path}")
+            processed.export(wav_path, format="wav")
+            output_path = wav_path
+            plan = None
         
         # Kontrollera filstorlek
         if os.path.exists(output_path):
-            size_mb = os.path.getsize(output_path) / (1024 * 1024)
+            size_bytes = os.path.getsize(output_path)
+            size_mb = size_bytes / (1024 * 1024)
             logger.info(f"Slutlig filstorlek: {size_mb:.2f} MB")
             
+            if plan:
+                compare_plan(plan, size_bytes)
+            
             if task_id:
                 update_task_status(
                     task_id,
@@ -439,48 +450,6 @@ def optimize_for_whisper(input_path, max_size_mb=24, task_id=None):
                     message=f"Fil exporterad: {size_mb:.2f} MB",
                     time_left=3
                 )
-            
-            # Om filen fortfarande är för stor, försök med mer aggressiv komprimering
-            if size_mb > max_size_mb and output_path.endswith('.mp3'):
-                logger.warning(f"Varning: Filstorlek ({size_mb:.2f} MB) överstiger gränsen på {max_size_mb} MB")
-                
-                if task_id:
-                    update_task_status(
-                        task_id,
-                        message=f"Filen är för stor ({size_mb:.2f} MB). Utför ytterligare komprimering...",
-                        time_left=5
-                    )
-                
-                logger.info("Försöker med mer aggressiv komprimering (mono, 8kHz, 8k bitrate)")
-                
-                # Konvertera till mono och lägre samplingshastighet
-                try:
-                    lower_rate = processed.set_frame_rate(8000)
-                    lower_rate_path = output_path.replace(".mp3", "_low.mp3")
-                    lower_rate.export(lower_rate_path, format="mp3", bitrate="8k")
-                    
-                    # Om exporten lyckas, använd den lägre kvalitetsversionen
-                    if os.path.exists(lower_rate_path) and os.path.getsize(lower_rate_path) > 0:
-                        # Ta bort den ursprungliga filen
-                        os.remove(output_path)
-                        output_path = lower_rate_path
-                        size_mb = os.path.getsize(output_path) / (1024 * 1024)
-                        logger.info(f"Ny filstorlek efter aggressiv komprimering: {size_mb:.2f} MB")
-                        
-                        if task_id:
-                            update_task_status(
-                                task_id,
-                                message=f"Komprimering slutförd: {size_mb:.2f} MB",
-                            )
-                except Exception as e:
-                    logger.error(f"Kunde inte utföra aggressiv komprimering: {str(e)}")
-                    
-                    if task_id:
-                        update_task_status(
-                            task_id,
-                            message=f"Varning: Kunde inte utföra ytterligare komprimering: {str(e)}",
-                            error=str(e)
-                        )
         else:
             error_msg = f"Utdatafilen existerar inte: {output_path}"
             logger.error(error_msg)
@@ -495,7 +464,10 @@ def optimize_for_whisper(input_path, max_size_mb=24, task_id=None):
                 
             raise RuntimeError(f"Utdatafilen kunde inte skapas: {output_path}")
         
-        # Dela upp filen om den fortfarande är för stor
+        # Dela upp filen vid tystnad om den är för stor eller lång för ett anrop
+        if split:
+            return _split_output(output_path, ranges, padding, plan, task_id)
+        
         if size_mb > 24:
             logger.warning("Filen är fortfarande för stor för Whisper API (>24MB)")
             
@@ -525,6 +497,159 @@ def optimize_for_whisper(input_path, max_size_mb=24, task_id=None):
             
         raise RuntimeError(f"Optimeringsfel: {str(e)}")
 
+def _split_output(output_path, ranges, padding, plan, task_id=None):
+    """
+    Delar den optimerade filen vid tystnaden mellan talsegment om planen kräver det.
+    
+    Returns:
+        list: Sökvägar till filerna som ska transkriberas, i ordning
+    """
+    if not plan or 'chunk_seconds' not in plan:
+        return [output_path]
+    
+    chunks = plan_chunks(ranges, int(plan['chunk_seconds'] * 1000), gap_ms=100, pad_ms=padding)
+    if len(chunks) <= 1:
+        return [output_path]
+    
+    logger.info(f"Delar upp ljudet i {len(chunks)} delar vid tystnad")
+    
+    if task_id:
+        update_task_status(
+            task_id,
+            message=f"Delar upp ljudet i {len(chunks)} delar för parallell transkribering...",
+        )
+    
+    chunk_paths = split_encoded(output_path, chunks)
+    os.remove(output_path)
+    return chunk_paths
+
+def _silence_settings(frame_energies, frame_len, sample_width=2):
+    """
+    Anpassad tystnadströskel för en inspelning, med skattade nivåer i loggen.
+    
+    Returns:
+        dict: Se app.services.vad.adaptive_silence_settings
+    """
+    settings = adaptive_silence_settings(frame_energies, frame_len, sample_width)
+    logger.info(
+        f"Brusgolv {settings['noise_floor']:.1f} dBFS, talnivå {settings['speech_level']:.1f} dBFS: "
+        f"tröskel {settings['silence_thresh']:.1f} dBFS, minsta tystnad {settings['min_silence_len']} ms"
+    )
+    return settings
+
+def _optimize_streaming(input_path, max_size_mb=24, task_id=None, split=False, input_format=None,
+                        silence_thresh=None, codec='mp3'):
+    """
+    Strömmande variant av optimize_for_whisper.
+    
+    Ljudet avkodas till 16kHz mono i block via en ffmpeg-pipe och spoolas
+    till disk, så att minnesanvändningen är begränsad oberoende av
+    inspelningens längd. Endast ramenergier och talintervall hålls i minnet.
+    
+    Returns:
+        str: Sökväg till den optimerade filen, eller en lista med sökvägar
+            om split=True
+    """
+    sample_rate = DEFAULT_SAMPLE_RATE
+    frame_len = frame_length(sample_rate)
+    output_path = spool_path(OUTPUT_EXTENSIONS[codec], near=input_path)
+    
+    if task_id:
+        update_task_status(
+            task_id,
+            progress=12,
+            message="Läser in ljudfil i block...",
+            time_left=15
+        )
+    
+    with tempfile.TemporaryFile() as spool:
+        frame_energies, total_samples = spool_pcm(
+            input_path, spool, sample_rate=sample_rate, 
+            frame_ms=frame_len * 1000 // sample_rate,
+            input_format=input_format
+        )
+        
+        if total_samples == 0:
+            raise RuntimeError(f"Ljudfilen innehåller inget ljud: {input_path}")
+        
+        original_duration = total_samples / sample_rate
+        logger.info(f"Strömmat ljud: {original_duration:.2f}s, spoolat till disk")
+        
+        if task_id:
+            update_task_status(
+                task_id,
+                progress=15,
+                message="Identifierar talsegment och tar bort tystnad...",
+                time_left=12
+            )
+        
+        if silence_thresh is None:
+            settings = _silence_settings(frame_energies, frame_len)
+        else:
+            settings = {'silence_thresh': silence_thresh, 'min_silence_len': FIXED_MIN_SILENCE_LEN}
+        
+        nonsilent = detect_nonsilent_frames(
+            frame_energies, frame_len, total_samples, sample_rate,
+            silence_thresh=settings['silence_thresh'],
+            min_silence_len=settings['min_silence_len'],
+            seek_step=100
+        )
+        
+        if len(nonsilent) == 0:
+            logger.warning("Inga icke-tysta segment hittades, använder hela filen")
+            ranges = [[0, int(original_duration * 1000)]]
+            padding = 0
+        else:
+            ranges = nonsilent
+            padding = 300
+        
+        speech_ms = sum(end - start for start, end in ranges)
+        speech_duration = (speech_ms + 100 * (len(ranges) - 1) + 2 * padding) / 1000
+        logger.info(f"Bevarad talduration: {speech_duration:.2f}s ({speech_duration/original_duration*100:.1f}% av originalet)")
+        
+        plan = plan_export(
+            speech_duration, max_size_mb, 
+            max_chunk_seconds=default_max_chunk_seconds() if split else None,
+            codec=codec
+        )
+        
+        if task_id:
+            update_task_status(
+                task_id,
+                progress=18,
+                message=f"Talduration: {speech_duration:.1f}s ({speech_duration/original_duration*100:.1f}% av originalet)",
+                time_left=8
+            )
+            update_task_status(
+                task_id,
+                progress=20,
+                message=f"Komprimerar och sparar bearbetad ljudfil ({plan['bitrate']}, {plan['sample_rate']}Hz)...",
+                time_left=5,
+                size_info={'planned': plan['estimated_bytes']}
+            )
+        
+        encode_ranges(spool, ranges, output_path, sample_rate=sample_rate, 
+                      output_rate=plan['sample_rate'], bitrate=plan['bitrate'], pad_ms=padding,
+                      codec=codec)
+        
+        size_bytes = os.path.getsize(output_path)
+        size_mb = size_bytes / (1024 * 1024)
+        logger.info(f"Slutlig filstorlek: {size_mb:.2f} MB")
+        compare_plan(plan, size_bytes)
+    
+    if task_id:
+        update_task_status(
+            task_id,
+            progress=22,
+            message=f"Fil exporterad: {size_mb:.2f} MB",
+            time_left=3
+        )
+    
+    if split:
+        return _split_output(output_path, ranges, padding, plan, task_id)
+    
+    return output_path
+
 # Test module when run directly
 if __name__ == "__main__":
     logging.info("Testar audio_processor...")
@@ -540,14 +665,12 @@ if __name__ == "__main__":
         
         # Testa process_audio
         with open(test_path, "rb") as f:
-            test_bytes = BytesIO(f.read())
-            test_bytes.name = "test_audio.wav"
-            
-            result, error = process_audio(test_bytes)
+            result, error = process_audio(f)
             if error:
                 logging.error(f"Test misslyckades: {error}")
             else:
                 logging.info("Test lyckades!")
+            result.cleanup()
         
         # Städa upp
         os.remove(test_path)
@@ -0,0 +1,263 @@
+"""
+Inspelning och uppspelning av OpenAI-anrop ("kassetter").
+
+För att kunna lasttesta hela kedjan (bearbetning, Celery-tasks, SSE) utan
+API-nyckel eller nätverk läggs ett httpx-transportlager under klienterna
+från openai_client. Läget väljs med miljövariabler:
+
+    OPENAI_CASSETTE_MODE           off (standard), record eller replay
+    OPENAI_CASSETTE_DIR            katalog för kassetterna (standard instance/cassettes)
+    OPENAI_REPLAY_LATENCY          fast svarstid i sekunder, eller "recorded" (standard)
+                                   för att vänta lika länge som vid inspelningen
+    OPENAI_REPLAY_LATENCY_SCALE    faktor för svarstiden vid uppspelning (standard 1)
+
+Vid inspelning skickas anropen som vanligt och varje svar sparas som en
+JSON-fil med status, utvalda headers, innehåll och uppmätt svarstid. Vid
+uppspelning görs inga nätverksanrop: ett svar med exakt samma JSON-innehåll
+används om det finns, annars turas inspelningarna för samma endpoint om.
+Whisper-anrop (multipart) matchas alltid per endpoint, eftersom ljudet
+skiljer sig mellan körningar. Saknas inspelning svarar lagret med 400, så
+att anropet misslyckas direkt istället för att försökas om.
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+import threading
+import httpx
+
+logger = logging.getLogger("cassette")
+
+OFF = 'off'
+RECORD = 'record'
+REPLAY = 'replay'
+
+# API-nyckel som används vid uppspelning när ingen riktig nyckel finns
+REPLAY_API_KEY = 'cassette-replay'
+
+# Headers som sparas; övriga (cookies, organisation m.m.) hör inte hemma i en kassett
+_KEPT_HEADERS = ('content-type', 'retry-after', 'retry-after-ms', 'openai-processing-ms', 'x-request-id')
+_KEPT_PREFIXES = ('x-ratelimit-',)
+
+
+def cassette_mode():
+    """Läget från OPENAI_CASSETTE_MODE: off, record eller replay."""
+    mode = os.environ.get('OPENAI_CASSETTE_MODE', OFF).strip().lower()
+    if mode not in (OFF, RECORD, REPLAY):
+        logger.warning(f"Okänt OPENAI_CASSETTE_MODE '{mode}', använder {OFF}")
+        return OFF
+    return mode
+
+
+def replaying():
+    """Sant om anropen besvaras från kassetter istället för av OpenAI."""
+    return cassette_mode() == REPLAY
+
+
+def cassette_dir():
+    """Katalogen för kassetterna."""
+    return os.environ.get('OPENAI_CASSETTE_DIR', os.path.join('instance', 'cassettes'))
+
+
+def replay_settings():
+    """Svarstid vid uppspelning: fast tid i sekunder (None = inspelad) och faktor."""
+    latency = os.environ.get('OPENAI_REPLAY_LATENCY', 'recorded').strip().lower()
+    return {
+        'latency': None if latency == 'recorded' else max(0.0, float(latency)),
+        'scale': max(0.0, float(os.environ.get('OPENAI_REPLAY_LATENCY_SCALE', 1))),
+    }
+
+
+def _endpoint(request):
+    return f"{request.method} {request.url.path}"
+
+
+def _slug(endpoint):
+    return endpoint.lower().replace(' ', '').replace('/', '_').strip('_')
+
+
+def _fingerprint(request):
+    """SHA-256 av ett JSON-innehåll, eller None för multipart och tomma anrop."""
+    if 'json' not in request.headers.get('content-type', ''):
+        return None
+    try:
+        return hashlib.sha256(request.content).hexdigest()
+    except httpx.RequestNotRead:
+        return None
+
+
+class Cassette:
+    """Inspelade svar i en katalog, med en fil per svar."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._entries = None
+        self._turns = {}
+
+    def _load(self):
+        entries = {}
+        if os.path.isdir(self.directory):
+            for root, _, files in os.walk(self.directory):
+                for name in sorted(files):
+                    if not name.endswith('.json'):
+                        continue
+                    try:
+                        with open(os.path.join(root, name), encoding='utf-8') as f:
+                            entry = json.load(f)
+                        entries.setdefault(entry['endpoint'], []).append(entry)
+                    except (OSError, ValueError, KeyError) as e:
+                        logger.warning(f"Hoppar över trasig kassett {name}: {str(e)}")
+        logger.info(f"Läste {sum(len(e) for e in entries.values())} inspelade svar från {self.directory}")
+        return entries
+
+    def find(self, request):
+        """Ett inspelat svar för anropet, eller None."""
+        endpoint = _endpoint(request)
+        fingerprint = _fingerprint(request)
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._load()
+            candidates = self._entries.get(endpoint, [])
+            if not candidates:
+                return None
+            for entry in candidates:
+                if fingerprint and entry.get('fingerprint') == fingerprint:
+                    return entry
+            # Inget exakt svar: inspelningarna för endpointen turas om
+            turn = self._turns.get(endpoint, 0)
+            self._turns[endpoint] = turn + 1
+            return candidates[turn % len(candidates)]
+
+    def record(self, request, response, latency):
+        """Sparar ett svar med dess svarstid i sekunder."""
+        endpoint = _endpoint(request)
+        headers = {
+            key: value for key, value in response.headers.items()
+            if key in _KEPT_HEADERS or key.startswith(_KEPT_PREFIXES)
+        }
+        entry = {
+            'endpoint': endpoint,
+            'fingerprint': _fingerprint(request),
+            'status': response.status_code,
+            'headers': headers,
+            'body': response.text,
+            'latency': round(latency, 4),
+            'recorded_at': time.time(),
+        }
+        directory = os.path.join(self.directory, _slug(endpoint))
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{time.time_ns()}-{uuid.uuid4().hex[:8]}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False, indent=1)
+        with self._lock:
+            if self._entries is not None:
+                self._entries.setdefault(endpoint, []).append(entry)
+        logger.info(f"Spelade in {endpoint} ({response.status_code}, {latency:.2f}s)")
+
+    def delay(self, entry, settings=None):
+        """Hur länge uppspelningen av ett svar ska vänta, i sekunder."""
+        settings = settings or replay_settings()
+        latency = settings['latency'] if settings['latency'] is not None else entry.get('latency', 0)
+        return latency * settings['scale']
+
+    def response(self, request, entry):
+        """Ett httpx-svar byggt från inspelningen (eller 400 om den saknas)."""
+        if entry is None:
+            message = f"Ingen inspelning för {_endpoint(request)} i {self.directory}"
+            logger.error(message)
+            return httpx.Response(
+                400, json={'error': {'message': message, 'type': 'cassette_miss'}}, request=request
+            )
+        return httpx.Response(
+            entry['status'], headers=entry['headers'], content=entry['body'].encode('utf-8'), request=request
+        )
+
+
+class CassetteTransport(httpx.BaseTransport):
+    """Synkront transportlager som spelar in eller spelar upp anrop."""
+
+    def __init__(self, cassette, mode, inner=None):
+        self.cassette = cassette
+        self.mode = mode
+        self.inner = inner
+
+    def handle_request(self, request):
+        if self.mode == REPLAY:
+            entry = self.cassette.find(request)
+            if entry is not None:
+                time.sleep(self.cassette.delay(entry))
+            return self.cassette.response(request, entry)
+
+        request.read()
+        started = time.perf_counter()
+        response = self.inner.handle_request(request)
+        response.read()
+        self.cassette.record(request, response, time.perf_counter() - started)
+        return response
+
+    def close(self):
+        if self.inner is not None:
+            self.inner.close()
+
+
+class AsyncCassetteTransport(httpx.AsyncBaseTransport):
+    """Som CassetteTransport, för asynkrona klienter."""
+
+    def __init__(self, cassette, mode, inner=None):
+        self.cassette = cassette
+        self.mode = mode
+        self.inner = inner
+
+    async def handle_async_request(self, request):
+        if self.mode == REPLAY:
+            entry = self.cassette.find(request)
+            if entry is not None:
+                await asyncio.sleep(self.cassette.delay(entry))
+            return self.cassette.response(request, entry)
+
+        await request.aread()
+        started = time.perf_counter()
+        response = await self.inner.handle_async_request(request)
+        await response.aread()
+        # Filen är liten; skrivs direkt istället för i en tråd
+        self.cassette.record(request, response, time.perf_counter() - started)
+        return response
+
+    async def aclose(self):
+        if self.inner is not None:
+            await self.inner.aclose()
+
+
+_cassettes = {}
+_cassettes_lock = threading.Lock()
+
+
+def get_cassette(directory=None):
+    """Kassetten för katalogen, delad av alla klienter i processen."""
+    directory = os.path.abspath(directory or cassette_dir())
+    with _cassettes_lock:
+        if directory not in _cassettes:
+            _cassettes[directory] = Cassette(directory)
+        return _cassettes[directory]
+
+
+def cassette_transport(limits, is_async=False):
+    """
+    Transportlager för en OpenAI-klient enligt OPENAI_CASSETTE_MODE.
+
+    Returns:
+        En CassetteTransport/AsyncCassetteTransport, eller None när läget är off
+    """
+    mode = cassette_mode()
+    if mode == OFF:
+        return None
+    logger.info(f"OpenAI-anrop i kassettläge {mode} ({cassette_dir()})")
+    if is_async:
+        inner = httpx.AsyncHTTPTransport(limits=limits) if mode == RECORD else None
+        return AsyncCassetteTransport(get_cassette(), mode, inner)
+    inner = httpx.HTTPTransport(limits=limits) if mode == RECORD else None
+    return CassetteTransport(get_cassette(), mode, inner)
@@ -0,0 +1,250 @@
+"""
+Återupptagbara uppladdningar i delar.
+
+Webbläsaren skapar en uppladdningssession, skickar filen som numrerade
+delar (PUT) och avslutar med en kontrollsumma för hela filen. Varje del
+skrivs direkt på sin plats i en förallokerad fil på disk, så en
+webbprocess hålls bara upptagen under en del åt gången och ingen del
+behöver ligga i minnet. Efter ett avbrott frågar klienten vilka delar som
+redan har tagits emot och skickar bara resten.
+
+Sessionerna ligger i en egen katalog per uppladdning:
+
+    <UPLOAD_SESSION_DIR>/<upload_id>/meta.json   metadata
+    <UPLOAD_SESSION_DIR>/<upload_id>/data        den sammansatta filen
+    <UPLOAD_SESSION_DIR>/<upload_id>/received/N  markering för mottagen del N
+
+Markeringarna gör att flera webbprocesser kan ta emot delar till samma
+session samtidigt utan att skriva till en gemensam metadatafil.
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import tempfile
+from app.services.audio_cache import hash_file
+from app.services.spool import spool_path
+
+logger = logging.getLogger("chunked_upload")
+
+# Standardstorlek per del och gränser för vad klienten får välja
+DEFAULT_CHUNK_SIZE = 5 * 1024 * 1024
+MIN_CHUNK_SIZE = 256 * 1024
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+
+# Blockstorlek när en del läses från förfrågan
+COPY_BUFFER_BYTES = 1024 * 1024
+
+
+def session_root():
+    """Katalog för uppladdningssessioner, från UPLOAD_SESSION_DIR."""
+    return os.environ.get('UPLOAD_SESSION_DIR') or os.path.join(tempfile.gettempdir(), 'denthelp_uploads')
+
+
+def session_ttl_seconds():
+    """Hur länge en inaktiv session sparas, från UPLOAD_SESSION_TTL_HOURS."""
+    return float(os.environ.get('UPLOAD_SESSION_TTL_HOURS', 1)) * 3600
+
+
+def _session_dir(upload_id):
+    # upload_id kommer från URL:en och får bara vara ett hex-uuid
+    if len(upload_id) != 32 or any(c not in '0123456789abcdef' for c in upload_id):
+        raise LookupError(f"Okänd uppladdning: {upload_id}")
+    return os.path.join(session_root(), upload_id)
+
+
+def _chunk_length(meta, index):
+    """Förväntad längd för del index (den sista delen kan vara kortare)."""
+    if index == meta['total_chunks'] - 1:
+        return meta['size'] - index * meta['chunk_size']
+    return meta['chunk_size']
+
+
+def create_session(user_id, filename, size, max_size, title=None, chunk_size=None):
+    """
+    Skapar en uppladdningssession och förallokerar filen på disk.
+
+    Args:
+        user_id: Användaren som äger uppladdningen
+        filename: Originalfilens namn (används för filändelsen)
+        size: Filens storlek i bytes
+        max_size: Största tillåtna storlek i bytes
+        title: Titel för transkriptionen (valfritt)
+        chunk_size: Önskad storlek per del (valfritt)
+
+    Returns:
+        dict: Sessionens metadata, inklusive upload_id, chunk_size och total_chunks
+    """
+    size = int(size)
+    if size <= 0:
+        raise ValueError("Filen är tom")
+    if size > max_size:
+        raise ValueError(f"Filen är för stor. Maximal storlek är {max_size // (1024 * 1024)}MB.")
+
+    chunk_size = int(chunk_size or DEFAULT_CHUNK_SIZE)
+    chunk_size = min(max(chunk_size, MIN_CHUNK_SIZE), MAX_CHUNK_SIZE)
+
+    meta = {
+        'upload_id': uuid.uuid4().hex,
+        'user_id': user_id,
+        'filename': filename,
+        'title': title,
+        'size': size,
+        'chunk_size': chunk_size,
+        'total_chunks': (size + chunk_size - 1) // chunk_size,
+        'created_at': time.time(),
+    }
+
+    directory = os.path.join(session_root(), meta['upload_id'])
+    os.makedirs(os.path.join(directory, 'received'))
+    with open(os.path.join(directory, 'data'), 'wb') as data:
+        data.truncate(size)
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    logger.info(f"Skapade uppladdning {meta['upload_id']}: {size} bytes i {meta['total_chunks']} delar")
+    return meta
+
+
+def load_session(upload_id, user_id):
+    """
+    Läser en sessions metadata och vilka delar som har tagits emot.
+
+    Raises:
+        LookupError: Om sessionen inte finns eller ägs av en annan användare
+    """
+    directory = _session_dir(upload_id)
+    try:
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        raise LookupError(f"Okänd uppladdning: {upload_id}")
+
+    if meta['user_id'] != user_id:
+        raise LookupError(f"Okänd uppladdning: {upload_id}")
+
+    meta['received'] = sorted(int(name) for name in os.listdir(os.path.join(directory, 'received')))
+    return meta
+
+
+def write_chunk(upload_id, user_id, index, stream, checksum=None):
+    """
+    Skriver en del på sin plats i den förallokerade filen.
+
+    Delen läses från stream i block och räknas som mottagen först när
+    längden (och kontrollsumman, om en anges) stämmer. En del som skickas
+    igen skriver över den tidigare.
+
+    Args:
+        index: Delens nummer, från 0
+        stream: Fil-liknande objekt med delens innehåll
+        checksum: Hexadecimal SHA-256 för delen (valfritt)
+
+    Returns:
+        dict: Sessionens metadata efter skrivningen
+    """
+    meta = load_session(upload_id, user_id)
+    if not 0 <= index < meta['total_chunks']:
+        raise ValueError(f"Del {index} finns inte, uppladdningen har {meta['total_chunks']} delar")
+
+    expected = _chunk_length(meta, index)
+    directory = _session_dir(upload_id)
+    marker = os.path.join(directory, 'received', str(index))
+    if os.path.exists(marker):
+        os.remove(marker)
+
+    digest = hashlib.sha256()
+    written = 0
+    with open(os.path.join(directory, 'data'), 'r+b') as data:
+        data.seek(index * meta['chunk_size'])
+        while written <= expected:
+            block = stream.read(min(COPY_BUFFER_BYTES, expected + 1 - written))
+            if not block:
+                break
+            digest.update(block)
+            data.write(block[:max(expected - written, 0)])
+            written += len(block)
+
+    if written != expected:
+        raise ValueError(f"Del {index} har fel längd: {written} bytes, förväntat {expected}")
+    if checksum and digest.hexdigest() != checksum.lower():
+        raise ValueError(f"Kontrollsumman för del {index} stämmer inte")
+
+    open(marker, 'wb').close()
+    os.utime(os.path.join(directory, 'meta.json'))
+
+    meta['received'] = sorted(set(meta['received']) | {index})
+    return meta
+
+
+def finalize(upload_id, user_id, checksum=None):
+    """
+    Kontrollerar att alla delar har tagits emot och lämnar över filen.
+
+    Filen flyttas ut ur sessionskatalogen till ett eget spooljobb, med
+    originalets filändelse, och sessionen tas bort.
+
+    Args:
+        checksum: Hexadecimal SHA-256 för hela filen (valfritt)
+
+    Returns:
+        tuple: (sökväg till filen, SHA-256 för innehållet, sessionens metadata)
+    """
+    meta = load_session(upload_id, user_id)
+    missing = sorted(set(range(meta['total_chunks'])) - set(meta['received']))
+    if missing:
+        raise ValueError(f"{len(missing)} delar saknas, första saknade del är {missing[0]}")
+
+    directory = _session_dir(upload_id)
+    data_path = os.path.join(directory, 'data')
+    content_hash = hash_file(data_path)
+    if checksum and content_hash != checksum.lower():
+        raise ValueError("Kontrollsumman för filen stämmer inte")
+
+    extension = os.path.splitext(meta['filename'])[1].lower()
+    path = spool_path(extension)
+    shutil.move(data_path, path)
+    shutil.rmtree(directory, ignore_errors=True)
+
+    logger.info(f"Uppladdning {upload_id} sammansatt till {path} (sha256 {content_hash[:12]})")
+    return path, content_hash, meta
+
+
+def discard(upload_id, user_id):
+    """Tar bort en session och dess delar."""
+    load_session(upload_id, user_id)
+    shutil.rmtree(_session_dir(upload_id), ignore_errors=True)
+    logger.info(f"Tog bort uppladdning {upload_id}")
+
+
+def purge_stale_sessions(max_age_seconds=None):
+    """
+    Tar bort sessioner som inte har fått någon del på max_age_seconds.
+
+    Returns:
+        int: Antal borttagna sessioner
+    """
+    max_age_seconds = session_ttl_seconds() if max_age_seconds is None else max_age_seconds
+    root = session_root()
+    if not os.path.isdir(root):
+        return 0
+
+    removed = 0
+    now = time.time()
+    for upload_id in os.listdir(root):
+        directory = os.path.join(root, upload_id)
+        meta_path = os.path.join(directory, 'meta.json')
+        try:
+            last_activity = os.path.getmtime(meta_path if os.path.exists(meta_path) else directory)
+        except OSError:
+            continue
+        if now - last_activity > max_age_seconds:
+            shutil.rmtree(directory, ignore_errors=True)
+            removed += 1
+
+    if removed:
+        logger.info(f"Tog bort {removed} inaktiva uppladdningar")
+    return removed
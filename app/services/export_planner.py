@@ -0,0 +1,205 @@
+"""
+Planering av exportformat utifrån talduration och storleksgräns.
+
+MP3 med konstant bitrate har en förutsägbar storlek: bitrate gånger
+duration plus några ramar och en ID3-tagg. Genom att räkna ut storleken
+innan kodningen kan bitrate och samplingsfrekvens väljas direkt, så att
+ljudet bara behöver kodas en gång.
+
+Opus kodas med hård CBR (varje paket har samma storlek) i en Ogg-container,
+vars overhead är några bytes per sida och paket, så även den storleken kan
+räknas ut i förväg.
+"""
+import os
+import logging
+
+logger = logging.getLogger("export_planner")
+
+# Kandidater i kvalitetsordning: (samplingsfrekvens, bitrate i kbit/s). 8 kbit/s
+# är lägsta bitrate för mp3, och lägre samplingsfrekvens ger då ingen mindre fil
+MP3_LADDER = [(16000, 32), (16000, 24), (16000, 16), (16000, 8)]
+OPUS_LADDER = [(16000, 24), (16000, 16), (16000, 12), (16000, 8), (8000, 6)]
+
+# Filändelse per utdatacodec
+OUTPUT_EXTENSIONS = {'mp3': '.mp3', 'opus': '.ogg'}
+
+# Fast overhead per fil, uppmätt mot libmp3lame via ffmpeg
+_ID3_AND_HEADER_BYTES = 240
+_OVERHEAD_FRAMES = 2.5
+
+# Opus-paketlängd och Ogg-overhead: huvudsidor (OpusHead, OpusTags), en
+# sidhuvud per sekund (ffmpeg:s standard för page_duration) och en
+# segmentbyte per påbörjade 255 bytes i varje paket
+OPUS_FRAME_MS = 60
+_OGG_HEADER_BYTES = 200
+_OGG_PAGE_HEADER_BYTES = 27
+
+
+def default_max_chunk_seconds():
+    """Maximal duration per fil som skickas till Whisper, från WHISPER_MAX_CHUNK_SECONDS."""
+    return float(os.environ.get('WHISPER_MAX_CHUNK_SECONDS', 1200))
+
+
+def default_output_codec():
+    """Codec för optimerat ljud, från AUDIO_OUTPUT_CODEC ('mp3' eller 'opus')."""
+    codec = os.environ.get('AUDIO_OUTPUT_CODEC', 'mp3').lower()
+    if codec not in OUTPUT_EXTENSIONS:
+        raise ValueError(f"Okänd utdatacodec: {codec}")
+    return codec
+
+
+def mp3_frame_bytes(bitrate_kbps, sample_rate):
+    """Storlek på en mp3-ram i bytes (MPEG-1 över 24kHz, annars MPEG-2/2.5)."""
+    samples_per_frame = 1152 if sample_rate > 24000 else 576
+    return samples_per_frame // 8 * bitrate_kbps * 1000 // sample_rate
+
+
+def estimate_mp3_size(duration_s, bitrate_kbps, sample_rate):
+    """Uppskattad filstorlek i bytes för en CBR-kodad mp3."""
+    payload = duration_s * bitrate_kbps * 1000 / 8
+    overhead = _OVERHEAD_FRAMES * mp3_frame_bytes(bitrate_kbps, sample_rate) + _ID3_AND_HEADER_BYTES
+    return int(payload + overhead)
+
+
+def max_mp3_duration(bitrate_kbps, sample_rate, budget_bytes):
+    """Längsta duration i sekunder som ryms inom budget_bytes."""
+    overhead = _OVERHEAD_FRAMES * mp3_frame_bytes(bitrate_kbps, sample_rate) + _ID3_AND_HEADER_BYTES
+    return max(0.0, (budget_bytes - overhead) * 8 / (bitrate_kbps * 1000))
+
+
+def estimate_opus_size(duration_s, bitrate_kbps, sample_rate=None):
+    """Uppskattad filstorlek i bytes för CBR-kodad Opus i Ogg."""
+    packet_bytes = bitrate_kbps * OPUS_FRAME_MS // 8
+    packets_per_second = 1000 / OPUS_FRAME_MS
+    per_second = (bitrate_kbps * 1000 / 8 + _OGG_PAGE_HEADER_BYTES
+                  + packets_per_second * (packet_bytes // 255 + 1))
+    return int(duration_s * per_second + _OGG_HEADER_BYTES + _OGG_PAGE_HEADER_BYTES)
+
+
+def max_opus_duration(bitrate_kbps, sample_rate, budget_bytes):
+    """Längsta duration i sekunder som ryms inom budget_bytes."""
+    per_second = estimate_opus_size(1, bitrate_kbps) - estimate_opus_size(0, bitrate_kbps)
+    return max(0.0, (budget_bytes - estimate_opus_size(0, bitrate_kbps)) / per_second)
+
+
+# Kvalitetsstege, storleksuppskattning och maximal duration per codec
+_CODECS = {
+    'mp3': (MP3_LADDER, estimate_mp3_size, max_mp3_duration),
+    'opus': (OPUS_LADDER, estimate_opus_size, max_opus_duration),
+}
+
+
+def plan_export(duration_s, max_size_mb=24, safety_margin=0.02, max_chunk_seconds=None, codec='mp3'):
+    """
+    Väljer högsta kvalitet som ryms inom storleksgränsen.
+
+    Om max_chunk_seconds anges får ljudet delas upp i flera filer. Kvaliteten
+    väljs då så att en del om högst max_chunk_seconds ryms, och planen får
+    nyckeln chunk_seconds om hela ljudet inte ryms i en fil.
+
+    Args:
+        duration_s: Duration för ljudet som ska kodas, i sekunder
+        max_size_mb: Maximal filstorlek i MB
+        safety_margin: Andel av gränsen som hålls i reserv
+        max_chunk_seconds: Maximal duration per fil vid uppdelning (valfritt)
+        codec: 'mp3' eller 'opus'
+
+    Returns:
+        dict: format, bitrate (t.ex. '32k'), sample_rate, estimated_bytes
+              och fits (False om inte ens lägsta kvalitet ryms i en fil),
+              samt chunk_seconds om ljudet behöver delas upp
+    """
+    ladder, estimate_size, max_duration = _CODECS[codec]
+    budget = max_size_mb * 1024 * 1024 * (1 - safety_margin)
+    target_duration = min(duration_s, max_chunk_seconds) if max_chunk_seconds else duration_s
+
+    for sample_rate, bitrate_kbps in ladder:
+        if estimate_size(target_duration, bitrate_kbps, sample_rate) <= budget:
+            break
+
+    estimated = estimate_size(duration_s, bitrate_kbps, sample_rate)
+    plan = {
+        'format': codec,
+        'bitrate': f"{bitrate_kbps}k",
+        'sample_rate': sample_rate,
+        'estimated_bytes': estimated,
+        'fits': estimated <= budget,
+    }
+
+    if max_chunk_seconds and (not plan['fits'] or duration_s > max_chunk_seconds):
+        plan['chunk_seconds'] = min(max_chunk_seconds, max_duration(bitrate_kbps, sample_rate, budget))
+
+    logger.info(
+        f"Exportplan för {duration_s:.1f}s: {codec} {plan['bitrate']} @ {sample_rate}Hz, "
+        f"uppskattat {estimated} bytes (gräns {int(budget)} bytes)"
+        + (f", delas i bitar om högst {plan['chunk_seconds']:.0f}s" if 'chunk_seconds' in plan else "")
+    )
+    return plan
+
+
+def plan_chunks(ranges, max_chunk_ms, gap_ms=100, pad_ms=300):
+    """
+    Delar upp den sammanfogade utdatan i bitar vid tystnaden mellan talsegment.
+
+    Utdatan består av pad_ms tystnad, segmenten med gap_ms tystnad emellan
+    och pad_ms tystnad i slutet. Snitten läggs mitt i tystnaden mellan två
+    segment, så att inget ord delas. Ett enskilt segment som är längre än
+    max_chunk_ms delas hårt.
+
+    Args:
+        ranges: Lista med [start, slut] i millisekunder för de bevarade segmenten
+        max_chunk_ms: Maximal längd per bit i millisekunder
+
+    Returns:
+        list: [start, slut] i millisekunder i utdatans tidslinje för varje bit
+    """
+    lengths = [end - start for start, end in ranges]
+    total = sum(lengths) + gap_ms * max(len(lengths) - 1, 0) + 2 * pad_ms
+
+    # Möjliga snitt: mitt i varje mellanrum mellan två segment
+    cuts = []
+    position = pad_ms
+    for length in lengths[:-1]:
+        position += length
+        cuts.append(position + gap_ms // 2)
+        position += gap_ms
+
+    chunks = []
+    chunk_start = 0
+    previous_cut = None
+    for cut in cuts + [total]:
+        while cut - chunk_start > max_chunk_ms:
+            if previous_cut is not None and previous_cut > chunk_start:
+                end = previous_cut
+            else:
+                end = chunk_start + max_chunk_ms
+            chunks.append([chunk_start, end])
+            chunk_start = end
+        previous_cut = cut
+    if chunk_start < total:
+        chunks.append([chunk_start, total])
+    return chunks
+
+
+def compare_plan(plan, actual_bytes, tolerance=0.02):
+    """
+    Jämför planerad och faktisk filstorlek och lägger till resultatet i planen.
+
+    Returns:
+        dict: Planen med actual_bytes, deviation (relativ avvikelse) och matched
+    """
+    estimated = plan['estimated_bytes']
+    deviation = (actual_bytes - estimated) / estimated if estimated else 0.0
+    plan.update({
+        'actual_bytes': actual_bytes,
+        'deviation': deviation,
+        'matched': abs(deviation) <= tolerance,
+    })
+
+    if plan['matched']:
+        logger.info(f"Planerad storlek träffade: {actual_bytes} bytes ({deviation:+.2%})")
+    else:
+        logger.warning(
+            f"Planerad storlek avvek: {estimated} planerat, {actual_bytes} faktiskt ({deviation:+.2%})"
+        )
+    return plan
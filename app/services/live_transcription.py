@@ -0,0 +1,355 @@
+"""
+Löpande transkribering medan en konsultation spelas in.
+
+Webbläsaren skickar inspelningen i korta skivor (MediaRecorder med
+timeslice) till en session. Skivorna läggs efter varandra i en fil, som
+därmed alltid är en giltig ström i inspelningens format (oftast WebM).
+Efter varje skiva avkodas det som ännu inte har transkriberats, och allt
+fram till den senaste pausen i talet skickas till Whisper. När inspelningen stoppas återstår bara den sista
+biten och sammanfattningen.
+
+Sessionerna ligger i en egen katalog per inspelning:
+
+    <LIVE_SESSION_DIR>/<session_id>/meta.json          metadata
+    <LIVE_SESSION_DIR>/<session_id>/recording          skivorna i ordning
+    <LIVE_SESSION_DIR>/<session_id>/segments/NNNN.txt  transkriberad text per bit
+"""
+import os
+import json
+import time
+import uuid
+import fcntl
+import shutil
+import logging
+import tempfile
+from contextlib import contextmanager
+import numpy as np
+from pydub import AudioSegment
+from app.services.audio_format import detect_format
+from app.services.spool import SpoolJob
+from app.services.audio_decoder import iter_pcm_blocks, DEFAULT_SAMPLE_RATE
+from app.services.vad import detect_nonsilent, audio_frame_energies, adaptive_silence_settings
+
+logger = logging.getLogger("live_transcription")
+
+# Skivlängd som webbläsaren ombeds använda
+DEFAULT_SLICE_MS = 10000
+
+# En bit skickas först när den är minst så här lång, och delas hårt om
+# ingen paus i talet har hittats när den är så här lång
+MIN_SEGMENT_MS = 20000
+MAX_SEGMENT_MS = 120000
+
+# Blockstorlek när en skiva läses från förfrågan
+COPY_BUFFER_BYTES = 1024 * 1024
+
+
+def session_root():
+    """Katalog för inspelningssessioner, från LIVE_SESSION_DIR."""
+    return os.environ.get('LIVE_SESSION_DIR') or os.path.join(tempfile.gettempdir(), 'denthelp_live')
+
+
+def session_ttl_seconds():
+    """Hur länge en inaktiv session sparas, från LIVE_SESSION_TTL_HOURS."""
+    return float(os.environ.get('LIVE_SESSION_TTL_HOURS', 6)) * 3600
+
+
+def _session_dir(session_id):
+    # session_id kommer från URL:en och får bara vara ett hex-uuid
+    if len(session_id) != 32 or any(c not in '0123456789abcdef' for c in session_id):
+        raise LookupError(f"Okänd inspelning: {session_id}")
+    return os.path.join(session_root(), session_id)
+
+
+@contextmanager
+def _lock(directory, name, blocking=True):
+    """
+    Exklusivt fillås i sessionskatalogen, delat mellan processer.
+
+    Yields:
+        bool: Sant om låset togs (alltid sant om blocking)
+    """
+    with open(os.path.join(directory, f'{name}.lock'), 'w') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _read_meta(directory):
+    with open(os.path.join(directory, 'meta.json')) as f:
+        return json.load(f)
+
+
+def _write_meta(directory, meta):
+    # Skrivs till en ny fil som sedan byter namn, så att läsare aldrig ser en halv fil
+    temp_path = os.path.join(directory, 'meta.json.tmp')
+    with open(temp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(temp_path, os.path.join(directory, 'meta.json'))
+
+
+def create_session(user_id, title=None):
+    """
+    Skapar en inspelningssession.
+
+    Returns:
+        dict: Sessionens metadata, inklusive session_id och slice_ms
+    """
+    meta = {
+        'session_id': uuid.uuid4().hex,
+        'user_id': user_id,
+        'title': title,
+        'slice_ms': DEFAULT_SLICE_MS,
+        'slices': 0,
+        'recorded_bytes': 0,
+        'transcribed_ms': 0,
+        'segments': 0,
+        'uploaded_bytes': 0,
+        'created_at': time.time(),
+    }
+    directory = os.path.join(session_root(), meta['session_id'])
+    os.makedirs(os.path.join(directory, 'segments'))
+    open(os.path.join(directory, 'recording'), 'wb').close()
+    _write_meta(directory, meta)
+
+    logger.info(f"Skapade inspelning {meta['session_id']}")
+    return meta
+
+
+def load_session(session_id, user_id):
+    """
+    Läser en sessions metadata.
+
+    Raises:
+        LookupError: Om sessionen inte finns eller ägs av en annan användare
+    """
+    directory = _session_dir(session_id)
+    try:
+        meta = _read_meta(directory)
+    except FileNotFoundError:
+        raise LookupError(f"Okänd inspelning: {session_id}")
+
+    if meta['user_id'] != user_id:
+        raise LookupError(f"Okänd inspelning: {session_id}")
+    return meta
+
+
+def append_slice(session_id, user_id, index, stream):
+    """
+    Lägger till en skiva sist i inspelningen.
+
+    Skivorna måste komma i ordning. En skiva som redan har tagits emot
+    (t.ex. ett nytt försök efter en timeout) ignoreras.
+
+    Args:
+        index: Skivans nummer, från 0
+        stream: Fil-liknande objekt med skivans innehåll
+
+    Returns:
+        dict: Sessionens metadata efter tillägget
+    """
+    load_session(session_id, user_id)
+    directory = _session_dir(session_id)
+
+    with _lock(directory, 'meta'):
+        meta = _read_meta(directory)
+        if index < meta['slices']:
+            return meta
+        if index > meta['slices']:
+            raise ValueError(f"Skiva {meta['slices']} saknas, tog emot skiva {index}")
+
+        with open(os.path.join(directory, 'recording'), 'ab') as recording:
+            shutil.copyfileobj(stream, recording, COPY_BUFFER_BYTES)
+            meta['recorded_bytes'] = recording.tell()
+        meta['slices'] += 1
+        _write_meta(directory, meta)
+
+    return meta
+
+
+def _decode_pending(recording_path, start_ms):
+    """Avkodar inspelningen från start_ms som 16 kHz mono."""
+    input_format = detect_format(recording_path)
+    blocks = list(iter_pcm_blocks(recording_path, start_ms=start_ms, input_format=input_format))
+    if not blocks:
+        return np.zeros(0, dtype=np.int16)
+    return np.concatenate(blocks)
+
+
+def choose_cut(ranges, pending_ms, final=False):
+    """
+    Väljer var nästa bit ska sluta, i millisekunder från bitens början.
+
+    Snittet läggs mitt i den senaste pausen mellan två talsegment (eller i
+    tystnaden efter det sista), så att inget ord delas.
+
+    Args:
+        ranges: Icke-tysta intervall i den ännu inte transkriberade delen
+        pending_ms: Längd på den ännu inte transkriberade delen
+        final: Inspelningen är slut och allt ska med
+
+    Returns:
+        int: Snittpunkt, eller None om biten ska vänta på mer ljud
+    """
+    if final:
+        return pending_ms
+    if pending_ms < MIN_SEGMENT_MS:
+        return None
+    if not ranges:
+        return pending_ms
+
+    gaps = [(end, start) for (_, end), (start, _) in zip(ranges, ranges[1:])]
+    if ranges[-1][1] < pending_ms:
+        gaps.append((ranges[-1][1], pending_ms))
+
+    cuts = [(gap_start + gap_end) // 2 for gap_start, gap_end in gaps]
+    cuts = [cut for cut in cuts if cut >= MIN_SEGMENT_MS]
+    if cuts:
+        return cuts[-1]
+    return pending_ms if pending_ms >= MAX_SEGMENT_MS else None
+
+
+def _transcribe_samples(samples):
+    """Optimerar och transkriberar en bit av inspelningen."""
+    from app.services.audio_processor import optimize_for_whisper
+    from app.services.transcription_service import transcribe_audio
+
+    with SpoolJob.create() as job:
+        wav_path = job.path('.wav')
+        AudioSegment(samples.tobytes(), frame_rate=DEFAULT_SAMPLE_RATE, sample_width=2, channels=1).export(
+            wav_path, format='wav'
+        )
+        processed_path = optimize_for_whisper(wav_path, streaming=False)
+        return transcribe_audio(processed_path), os.path.getsize(processed_path)
+
+
+def transcribe_pending(session_id, final=False):
+    """
+    Transkriberar det som har spelats in sedan förra biten, fram till senaste paus.
+
+    Endast en process åt gången arbetar med en session. Om en annan process
+    redan gör det återvänder anropet direkt (utom när final är sant), och
+    nästa skiva tar med det som återstår.
+
+    Args:
+        final: Inspelningen är slut, transkribera allt som återstår
+
+    Returns:
+        int: Antal nya bitar som transkriberades
+
+    Raises:
+        LookupError: Om sessionen inte finns, eller togs bort under tiden
+    """
+    directory = _session_dir(session_id)
+    try:
+        return _transcribe_pending(directory, session_id, final)
+    except FileNotFoundError:
+        # Sessionen avslutades och togs bort medan skivan väntade i kön
+        if os.path.isdir(directory):
+            raise
+        raise LookupError(f"Okänd inspelning: {session_id}") from None
+
+
+def _transcribe_pending(directory, session_id, final):
+    recording_path = os.path.join(directory, 'recording')
+    transcribed = 0
+
+    with _lock(directory, 'transcribe', blocking=final) as locked:
+        if not locked:
+            logger.info(f"Inspelning {session_id} transkriberas redan av en annan process")
+            return 0
+
+        while True:
+            start_ms = _read_meta(directory)['transcribed_ms']
+            try:
+                samples = _decode_pending(recording_path, start_ms)
+            except RuntimeError as e:
+                # Den sista skivan kan vara ofullständig tills nästa kommer
+                if final:
+                    raise
+                logger.warning(f"Kunde inte avkoda inspelning {session_id} än: {str(e)}")
+                return transcribed
+
+            pending_ms = len(samples) * 1000 // DEFAULT_SAMPLE_RATE
+            ranges = []
+            if pending_ms:
+                audio = AudioSegment(samples.tobytes(), frame_rate=DEFAULT_SAMPLE_RATE, sample_width=2, channels=1)
+                settings = adaptive_silence_settings(*audio_frame_energies(audio))
+                ranges = detect_nonsilent(audio, silence_thresh=settings['silence_thresh'],
+                                          min_silence_len=settings['min_silence_len'], seek_step=100)
+
+            cut = choose_cut(ranges, pending_ms, final)
+            if not cut:
+                return transcribed
+
+            text, uploaded = '', 0
+            if any(start < cut for start, _ in ranges):
+                text, uploaded = _transcribe_samples(samples[:cut * DEFAULT_SAMPLE_RATE // 1000])
+
+            with _lock(directory, 'meta'):
+                meta = _read_meta(directory)
+                with open(os.path.join(directory, 'segments', f"{meta['segments']:04d}.txt"), 'w') as f:
+                    f.write(text)
+                meta['segments'] += 1
+                meta['transcribed_ms'] = start_ms + cut
+                meta['uploaded_bytes'] += uploaded
+                _write_meta(directory, meta)
+
+            transcribed += 1
+            logger.info(f"Inspelning {session_id}: transkriberade {start_ms / 1000:.1f}-{(start_ms + cut) / 1000:.1f}s")
+            if final and cut == pending_ms:
+                return transcribed
+
+
+def transcript(session_id):
+    """Texten som hittills har transkriberats, i ordning."""
+    directory = os.path.join(_session_dir(session_id), 'segments')
+    texts = []
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name)) as f:
+            text = f.read().strip()
+        if text:
+            texts.append(text)
+    return ' '.join(texts)
+
+
+def discard(session_id):
+    """Tar bort en session och dess inspelning."""
+    shutil.rmtree(_session_dir(session_id), ignore_errors=True)
+    logger.info(f"Tog bort inspelning {session_id}")
+
+
+def purge_stale_sessions(max_age_seconds=None):
+    """
+    Tar bort sessioner som inte har ändrats på max_age_seconds.
+
+    Returns:
+        int: Antal borttagna sessioner
+    """
+    max_age_seconds = session_ttl_seconds() if max_age_seconds is None else max_age_seconds
+    root = session_root()
+    if not os.path.isdir(root):
+        return 0
+
+    removed = 0
+    now = time.time()
+    for session_id in os.listdir(root):
+        directory = os.path.join(root, session_id)
+        meta_path = os.path.join(directory, 'meta.json')
+        try:
+            last_activity = os.path.getmtime(meta_path if os.path.exists(meta_path) else directory)
+        except OSError:
+            continue
+        if now - last_activity > max_age_seconds:
+            shutil.rmtree(directory, ignore_errors=True)
+            removed += 1
+
+    if removed:
+        logger.info(f"Tog bort {removed} inaktiva inspelningar")
+    return removed
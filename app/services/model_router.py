@@ -0,0 +1,326 @@
+"""
+Hälsostyrt val av GPT-modell för sammanfattningar.
+
+Varje modell har en brytare (circuit breaker) med tillstånd som delas av
+alla workers via Redis: de senaste anropens utfall och svarstider. När
+andelen misslyckade anrop i fönstret blir för hög öppnas brytaren och
+modellen hoppas över under en nedkylningstid, istället för att varje jobb
+först ska vänta ut dess fel eller tidsgräns. Efter nedkylningen släpps ett
+enda provanrop fram (halvöppen); lyckas det stängs brytaren igen.
+
+Bland friska modeller väljs den med lägst svarstid i fönstret. Modeller
+utan mätningar provas först, i konfigurerad ordning, så att de får
+mätvärden. Öppna modeller provas bara sist, om inget annat fungerar.
+
+Inställningar via miljövariabler:
+
+    SUMMARY_MODELS                 modeller i prioritetsordning (standard gpt-4o,gpt-4,gpt-3.5-turbo)
+    SUMMARY_FAST_MODELS            snabba modeller för korta prompter (standard gpt-4o-mini)
+    SUMMARY_SHORT_PROMPT_TOKENS    största prompt i tokens som räknas som kort (standard 3000)
+    SUMMARY_BREAKER_WINDOW         antal anrop i fönstret (standard 20)
+    SUMMARY_BREAKER_MIN_CALLS      minsta antal anrop innan brytaren kan öppnas (standard 5)
+    SUMMARY_BREAKER_FAILURE_RATE   andel fel som öppnar brytaren (standard 0.5)
+    SUMMARY_BREAKER_COOLDOWN       sekunder innan ett provanrop släpps fram (standard 60)
+    SUMMARY_REQUEST_TIMEOUT        tidsgräns per anrop i sekunder (standard 60)
+    SUMMARY_MAX_RETRIES            omförsök per modell innan nästa provas (standard 1)
+
+Går Redis inte att nå hålls tillståndet per process.
+"""
+import os
+import time
+import logging
+import threading
+from collections import deque
+from app.services.rate_limiter import get_redis
+
+logger = logging.getLogger("model_router")
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+DEFAULT_MODELS = ("gpt-4o", "gpt-4", "gpt-3.5-turbo")
+DEFAULT_FAST_MODELS = ("gpt-4o-mini",)
+
+# Kontextfönster i tokens; längsta prefix först så att t.ex. gpt-4o inte tolkas som gpt-4
+_CONTEXT_WINDOWS = (
+    ('gpt-4o-mini', 128000),
+    ('gpt-4o', 128000),
+    ('gpt-4-turbo', 128000),
+    ('gpt-4.1', 1047576),
+    ('gpt-4', 8192),
+    ('gpt-3.5-turbo', 16385),
+)
+
+# Ett misslyckat anrop sparas som -1 i fönstret, ett lyckat som sin svarstid
+_FAILED = -1.0
+
+
+def summary_models():
+    """Modellerna för sammanfattning, i prioritetsordning."""
+    configured = os.environ.get('SUMMARY_MODELS', '')
+    models = [model.strip() for model in configured.split(',') if model.strip()]
+    return models or list(DEFAULT_MODELS)
+
+
+def fast_models():
+    """Snabba modeller som korta prompter provar först (SUMMARY_FAST_MODELS)."""
+    configured = os.environ.get('SUMMARY_FAST_MODELS', ','.join(DEFAULT_FAST_MODELS))
+    return [model.strip() for model in configured.split(',') if model.strip()]
+
+
+def short_prompt_tokens():
+    """Prompter upp till så här många tokens räknas som korta (SUMMARY_SHORT_PROMPT_TOKENS)."""
+    return int(os.environ.get('SUMMARY_SHORT_PROMPT_TOKENS', 3000))
+
+
+def breaker_settings():
+    """Fönster, tröskel och nedkylning för brytarna, från miljön."""
+    return {
+        'window': max(1, int(os.environ.get('SUMMARY_BREAKER_WINDOW', 20))),
+        'min_calls': max(1, int(os.environ.get('SUMMARY_BREAKER_MIN_CALLS', 5))),
+        'failure_rate': float(os.environ.get('SUMMARY_BREAKER_FAILURE_RATE', 0.5)),
+        'cooldown': float(os.environ.get('SUMMARY_BREAKER_COOLDOWN', 60)),
+    }
+
+
+def request_settings():
+    """Tidsgräns och antal omförsök för ett sammanfattningsanrop, från miljön."""
+    return {
+        'timeout': float(os.environ.get('SUMMARY_REQUEST_TIMEOUT', 60)),
+        'max_retries': max(0, int(os.environ.get('SUMMARY_MAX_RETRIES', 1))),
+    }
+
+
+class LocalHealth:
+    """Brytarnas tillstånd i processens minne."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._outcomes = {}
+        self._open_until = {}
+        self._probe_until = {}
+
+    def record(self, model, value, window):
+        with self._lock:
+            outcomes = self._outcomes.get(model)
+            if outcomes is None or outcomes.maxlen != window:
+                outcomes = self._outcomes[model] = deque(outcomes or (), maxlen=window)
+            outcomes.appendleft(value)
+
+    def outcomes(self, model):
+        with self._lock:
+            return list(self._outcomes.get(model, ()))
+
+    def open(self, model, seconds):
+        with self._lock:
+            self._open_until[model] = time.monotonic() + seconds
+            self._probe_until.pop(model, None)
+
+    def open_for(self, model):
+        with self._lock:
+            return max(self._open_until.get(model, 0) - time.monotonic(), 0)
+
+    def claim_probe(self, model, seconds):
+        with self._lock:
+            now = time.monotonic()
+            if self._probe_until.get(model, 0) > now:
+                return False
+            self._probe_until[model] = now + seconds
+            return True
+
+    def close(self, model):
+        with self._lock:
+            self._outcomes.pop(model, None)
+            self._open_until.pop(model, None)
+            self._probe_until.pop(model, None)
+
+
+class RedisHealth:
+    """Brytarnas tillstånd i Redis, delat av alla workers."""
+
+    def __init__(self, client):
+        self.client = client
+
+    @staticmethod
+    def _key(model, part):
+        return f'openai:breaker:{model}:{part}'
+
+    def record(self, model, value, window):
+        key = self._key(model, 'outcomes')
+        pipe = self.client.pipeline()
+        pipe.lpush(key, value)
+        pipe.ltrim(key, 0, window - 1)
+        pipe.expire(key, 24 * 3600)
+        pipe.execute()
+
+    def outcomes(self, model):
+        return [float(value) for value in self.client.lrange(self._key(model, 'outcomes'), 0, -1)]
+
+    def open(self, model, seconds):
+        pipe = self.client.pipeline()
+        pipe.set(self._key(model, 'open'), 1, px=max(1, int(seconds * 1000)))
+        pipe.delete(self._key(model, 'probe'))
+        pipe.execute()
+
+    def open_for(self, model):
+        return max(self.client.pttl(self._key(model, 'open')), 0) / 1000
+
+    def claim_probe(self, model, seconds):
+        # Bara en worker i taget får göra provanropet
+        return bool(self.client.set(self._key(model, 'probe'), 1, nx=True, px=max(1, int(seconds * 1000))))
+
+    def close(self, model):
+        self.client.delete(*(self._key(model, part) for part in ('outcomes', 'open', 'probe')))
+
+
+_local = LocalHealth()
+
+
+def _store():
+    client = get_redis()
+    return RedisHealth(client) if client is not None else _local
+
+
+def _with_store(action, default=None):
+    try:
+        return action(_store())
+    except Exception as e:
+        logger.warning(f"Kunde inte nå Redis för modellhälsa, använder processens tillstånd: {str(e)}")
+        try:
+            return action(_local)
+        except Exception:
+            return default
+
+
+def model_health(model, settings=None):
+    """
+    Brytarens tillstånd för en modell.
+
+    Returns:
+        dict: state (closed, open eller half_open), calls, failure_rate,
+        latency (medelsvarstid i sekunder för lyckade anrop, eller None)
+        och retry_in (sekunder tills ett provanrop släpps fram)
+    """
+    settings = settings or breaker_settings()
+    outcomes = _with_store(lambda store: store.outcomes(model), default=[])
+    open_for = _with_store(lambda store: store.open_for(model), default=0)
+    latencies = [value for value in outcomes if value != _FAILED]
+    failures = len(outcomes) - len(latencies)
+
+    if open_for > 0:
+        state = OPEN
+    elif len(outcomes) >= settings['min_calls'] and failures / len(outcomes) >= settings['failure_rate']:
+        # Nedkylningen är över men fönstret är fortfarande dåligt
+        state = HALF_OPEN
+    else:
+        state = CLOSED
+
+    return {
+        'model': model,
+        'state': state,
+        'calls': len(outcomes),
+        'failure_rate': round(failures / len(outcomes), 3) if outcomes else 0.0,
+        'latency': round(sum(latencies) / len(latencies), 3) if latencies else None,
+        'retry_in': round(open_for, 1),
+    }
+
+
+def _partition(models, settings):
+    """Delar modellerna i (provanrop, friska sorterade på svarstid, blockerade)."""
+    healthy, probing, blocked = [], [], []
+    for priority, model in enumerate(models):
+        health = model_health(model, settings)
+        if health['state'] == CLOSED:
+            healthy.append((health['latency'] is not None, health['latency'] or 0, priority, model))
+        elif health['state'] == HALF_OPEN and _with_store(
+            lambda store: store.claim_probe(model, settings['cooldown']), default=False
+        ):
+            logger.info(f"Provar {model} igen efter nedkylning")
+            probing.append(model)
+        else:
+            blocked.append(model)
+    return probing, [model for *_, model in sorted(healthy)], blocked
+
+
+def route(models=None):
+    """
+    Modellerna i den ordning de ska provas för nästa anrop.
+
+    Friska modeller sorteras på svarstid (modeller utan mätningar först).
+    En halvöppen modell tas med först om den här anroparen fick göra
+    provanropet, annars sist tillsammans med öppna modeller.
+    """
+    probing, healthy, blocked = _partition(list(models or summary_models()), breaker_settings())
+    return probing + healthy + blocked
+
+
+def context_window(model):
+    """Modellens kontextfönster i tokens (försiktigt antagande för okända modeller)."""
+    for prefix, tokens in _CONTEXT_WINDOWS:
+        if model.startswith(prefix):
+            return tokens
+    return 8192
+
+
+def route_for_size(prompt_tokens, max_tokens, models=None):
+    """
+    Modellerna i den ordning de ska provas för en prompt av given storlek.
+
+    Bara modeller där prompten och svaret ryms i kontextfönstret provas (om
+    ingen räcker provas de största först). Korta prompter går i första hand
+    till de snabba modellerna (SUMMARY_FAST_MODELS), långa till modellerna
+    med störst kontextfönster. Inom varje grupp gäller ordningen från
+    route(), och modeller med öppen brytare provas sist.
+    """
+    needed = prompt_tokens + max_tokens
+    models = list(models or summary_models())
+    if prompt_tokens <= short_prompt_tokens():
+        models = [model for model in fast_models() if model not in models] + models
+    fitting = [model for model in models if context_window(model) >= needed]
+    if not fitting:
+        logger.warning(f"Ingen modell rymmer {needed} tokens, provar de största först")
+        fitting = sorted(models, key=context_window, reverse=True)
+
+    if prompt_tokens <= short_prompt_tokens():
+        preferred = [model for model in fast_models() if model in fitting]
+    else:
+        largest = max(context_window(model) for model in fitting)
+        preferred = [model for model in fitting if context_window(model) == largest]
+    rest = [model for model in fitting if model not in preferred]
+
+    settings = breaker_settings()
+    first_probing, first_healthy, first_blocked = _partition(preferred, settings)
+    probing, healthy, blocked = _partition(rest, settings)
+    return first_probing + first_healthy + probing + healthy + first_blocked + blocked
+
+
+def record_success(model, latency):
+    """Registrerar ett lyckat anrop med dess svarstid i sekunder."""
+    settings = breaker_settings()
+    if model_health(model, settings)['state'] != CLOSED:
+        # Provanropet lyckades: börja om med ett rent fönster
+        logger.info(f"{model} svarar igen, stänger brytaren")
+        _with_store(lambda store: store.close(model))
+    _with_store(lambda store: store.record(model, round(latency, 3), settings['window']))
+
+
+def record_failure(model):
+    """Registrerar ett misslyckat anrop och öppnar brytaren vid för många fel."""
+    settings = breaker_settings()
+    was = model_health(model, settings)['state']
+    _with_store(lambda store: store.record(model, _FAILED, settings['window']))
+    health = model_health(model, settings)
+    if was == HALF_OPEN or health['state'] == HALF_OPEN:
+        logger.warning(
+            f"Öppnar brytaren för {model} i {settings['cooldown']:.0f}s "
+            f"({health['failure_rate']:.0%} fel av {health['calls']} anrop)"
+        )
+        _with_store(lambda store: store.open(model, settings['cooldown']))
+
+
+def router_status(models=None):
+    """Tillståndet för alla modeller, för driftövervakning."""
+    settings = breaker_settings()
+    models = models or fast_models() + [model for model in summary_models() if model not in fast_models()]
+    return [model_health(model, settings) for model in models]
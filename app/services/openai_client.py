@@ -0,0 +1,152 @@
+"""
+Delad OpenAI-klient per process.
+
+Tidigare skapade varje anrop till Whisper och GPT en egen openai.OpenAI,
+så varje jobb betalade för nya TCP- och TLS-handskakningar. Här byggs en
+klient per process och API-nyckel, med en httpx-pool som håller
+anslutningarna vid liv mellan anropen.
+
+Klienten skapas om efter fork (Celery prefork), eftersom en pool som ärvs
+från föräldraprocessen delar sockets med den. Asynkrona klienter är
+bundna till sin event loop och byggs därför per körning med
+build_async_client(), med samma poolinställningar. Poolens storlek och
+tidsgränser ställs in via miljövariabler:
+
+    OPENAI_POOL_MAXSIZE         högsta antal anslutningar (standard 10)
+    OPENAI_KEEPALIVE_SECONDS    hur länge en ledig anslutning sparas (standard 60)
+    OPENAI_CONNECT_TIMEOUT      tidsgräns för att ansluta, i sekunder (standard 10)
+    OPENAI_TIMEOUT              tidsgräns för ett anrop, i sekunder (standard 600)
+"""
+import os
+import logging
+import threading
+import httpx
+import openai
+from app.services.cassette import cassette_transport
+
+logger = logging.getLogger("openai_client")
+
+_lock = threading.Lock()
+_clients = {}
+_stats = {'requests': 0, 'new_connections': 0}
+
+
+def pool_settings():
+    """Poolstorlek och tidsgränser från miljön."""
+    return {
+        'max_connections': max(1, int(os.environ.get('OPENAI_POOL_MAXSIZE', 10))),
+        'keepalive_expiry': float(os.environ.get('OPENAI_KEEPALIVE_SECONDS', 60)),
+        'connect_timeout': float(os.environ.get('OPENAI_CONNECT_TIMEOUT', 10)),
+        'timeout': float(os.environ.get('OPENAI_TIMEOUT', 600)),
+    }
+
+
+def _count_connection(event_name):
+    # httpcore anropar trace för varje steg; en TCP-anslutning görs bara
+    # när poolen saknar en ledig anslutning till värden
+    if event_name == 'connection.connect_tcp.complete':
+        with _lock:
+            _stats['new_connections'] += 1
+
+
+def _count_request():
+    with _lock:
+        _stats['requests'] += 1
+
+
+def _trace(event_name, info):
+    _count_connection(event_name)
+
+
+def _on_request(request):
+    request.extensions['trace'] = _trace
+    _count_request()
+
+
+async def _async_trace(event_name, info):
+    _count_connection(event_name)
+
+
+async def _on_async_request(request):
+    request.extensions['trace'] = _async_trace
+    _count_request()
+
+
+def _pool_options(is_async=False):
+    settings = pool_settings()
+    options = {
+        'limits': httpx.Limits(
+            max_connections=settings['max_connections'],
+            max_keepalive_connections=settings['max_connections'],
+            keepalive_expiry=settings['keepalive_expiry'],
+        ),
+        'timeout': httpx.Timeout(settings['timeout'], connect=settings['connect_timeout']),
+    }
+    # Vid inspelning och uppspelning (OPENAI_CASSETTE_MODE) går anropen via kassettlagret
+    if (transport := cassette_transport(options['limits'], is_async=is_async)) is not None:
+        options['transport'] = transport
+    return options
+
+
+def _build_client(api_key):
+    http_client = openai.DefaultHttpxClient(event_hooks={'request': [_on_request]}, **_pool_options())
+    settings = pool_settings()
+    logger.info(
+        f"Skapade OpenAI-klient för process {os.getpid()} "
+        f"(pool {settings['max_connections']}, keep-alive {settings['keepalive_expiry']:.0f}s)"
+    )
+    # Försök och backoff sköts av app.services.rate_limiter
+    return openai.OpenAI(api_key=api_key, http_client=http_client, max_retries=0)
+
+
+def build_async_client(api_key):
+    """
+    En ny asynkron OpenAI-klient med poolad anslutning.
+
+    Klienten hör till den event loop den används i. Stäng den när
+    körningen är klar, t.ex. med async with.
+    """
+    http_client = openai.DefaultAsyncHttpxClient(event_hooks={'request': [_on_async_request]}, **_pool_options(is_async=True))
+    return openai.AsyncOpenAI(api_key=api_key, http_client=http_client, max_retries=0)
+
+
+def get_client(api_key):
+    """
+    OpenAI-klienten för den här processen och API-nyckeln.
+
+    Klienten är trådsäker och delas av alla synkrona anrop i processen,
+    även från flera trådar.
+    """
+    key = (os.getpid(), api_key)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = _build_client(api_key)
+    return client
+
+
+def pool_stats():
+    """
+    Anrop och nya anslutningar sedan processen startade.
+
+    Returns:
+        dict: requests, new_connections och reused_connections
+    """
+    with _lock:
+        stats = dict(_stats)
+    stats['reused_connections'] = max(stats['requests'] - stats['new_connections'], 0)
+    return stats
+
+
+def _reset_after_fork():
+    # Barnprocessen får inte återanvända förälderns sockets eller lås
+    global _lock
+    _lock = threading.Lock()
+    _clients.clear()
+    _stats.update(requests=0, new_connections=0)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
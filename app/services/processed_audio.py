@@ -0,0 +1,77 @@
+"""
+Resultattyp för bearbetat ljud som ligger kvar på disk.
+
+Istället för att läsa in den bearbetade filen i en BytesIO överlämnas
+sökvägen. Mottagaren öppnar filen och strömmar den vidare (t.ex. som
+multipart-uppladdning till Whisper API), så att ljudet skrivs en gång och
+aldrig behöver ligga helt i minnet. Behövs en buffert används en
+minnesmappning av filen.
+"""
+import os
+import mmap
+import logging
+from contextlib import contextmanager
+from app.services.spool import discard
+
+logger = logging.getLogger("processed_audio")
+
+
+class ProcessedAudio(os.PathLike):
+    """
+    En ljudfil på disk som ägs av den som tar emot den.
+
+    Objektet fungerar som en sökväg (open(), os.path.getsize() m.fl.) och
+    tar bort filen vid cleanup() eller när ett with-block avslutas, om
+    owned är sant.
+    """
+
+    def __init__(self, path, owned=True):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.owned = owned
+
+    def __fspath__(self):
+        return self.path
+
+    def __repr__(self):
+        return f"<ProcessedAudio {self.path}>"
+
+    @property
+    def size(self):
+        """Filstorlek i bytes."""
+        return os.path.getsize(self.path)
+
+    def open(self):
+        """Öppnar filen för binär läsning. Anroparen stänger filen."""
+        return open(self.path, 'rb')
+
+    @contextmanager
+    def buffer(self):
+        """
+        Ger filens innehåll som en skrivskyddad memoryview över en minnesmappning.
+
+        Sidorna läses in av operativsystemet vid behov och räknas inte som
+        en kopia i processens heap.
+        """
+        with open(self.path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                yield memoryview(b'')
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    yield view
+                finally:
+                    view.release()
+
+    def cleanup(self):
+        """Tar bort filen om den ägs av objektet (och dess spooljobb om det blir tomt)."""
+        if self.owned and os.path.exists(self.path):
+            discard(self.path)
+            logger.info(f"Tog bort bearbetad fil: {self.path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
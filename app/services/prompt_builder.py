@@ -0,0 +1,140 @@
+"""
+Promptbyggare med tokenbudget för sammanfattningar.
+
+Instruktionerna för journalformatet är desamma för varje anrop och skickas
+därför som ett oförändrat systemmeddelande först, så att API:ts
+promptcache kan återanvända prefixet. Bara användarmeddelandet
+(transkription, del eller delsammanfattningar) skiljer sig mellan anropen.
+
+Innan ett anrop skickas räknas prompten lokalt i tokens (med tiktoken om
+det finns, annars en försiktig uppskattning). Storleken styr hur många
+tokens svaret får ta (max_tokens) och vilka modeller som provas, se
+model_router.route_for_size():
+
+    SUMMARY_MIN_OUTPUT_TOKENS   minsta svarsbudget (standard 500)
+    SUMMARY_MAX_OUTPUT_TOKENS   största svarsbudget (standard 1500)
+"""
+import os
+import logging
+from functools import lru_cache
+from app.services.model_router import route_for_size
+
+try:
+    import tiktoken
+except ImportError:
+    # Utan tiktoken uppskattas antalet tokens från antalet tecken
+    tiktoken = None
+
+logger = logging.getLogger("prompt_builder")
+
+# Regler och JSON-format som gäller för alla sammanfattningar
+JOURNAL_RULES = (
+    '1. Använd ISO 3950-notation (11-48) för tänder\n'
+    '2. För områden utan specifik tand, använd: Q1 (övre höger 11-18), Q2 (övre vänster 21-28), '
+    'Q3 (nedre vänster 31-38), Q4 (nedre höger 41-48)\n'
+    '3. Använd standardförkortningar: Rtg = Röntgen, DH = Dentalhygienist, Pat = Patient, '
+    'ua = Utan anmärkning, EPT = Elektrisk pulpatest, BW = Bitewing\n'
+    '4. Om information saknas, ange "Ej dokumenterat"\n'
+    '5. Returnera i detta JSON-format:\n'
+    '{\n'
+    '  "anamnes": "[patientens symtom och historik]",\n'
+    '  "status": "[kliniska fynd]",\n'
+    '  "diagnos": "[ställd diagnos]",\n'
+    '  "åtgärd": "[utförd behandling]",\n'
+    '  "behandlingsplan": "[planerade åtgärder]",\n'
+    '  "kommunikation": "[informerat patienten]"\n'
+    '}\n'
+)
+
+# Oförändrat prefix för alla sammanfattningsanrop
+SYSTEM_PROMPT = (
+    'Du sammanfattar tandläkarmöten på svenska i ett strukturerat journalformat. Följ dessa regler:\n'
+    + JOURNAL_RULES
+    + 'Returnera endast JSON-objektet.'
+)
+
+# Tokens som varje meddelande och svaret kostar utöver innehållet
+_MESSAGE_OVERHEAD = 4
+_REPLY_OVERHEAD = 3
+
+# Svenska med åäö ger fler tokens per tecken än engelska; räkna högt utan tiktoken
+_CHARS_PER_TOKEN = 3
+
+
+def output_limits():
+    """Minsta och största svarsbudget i tokens, från miljön."""
+    return {
+        'min': max(1, int(os.environ.get('SUMMARY_MIN_OUTPUT_TOKENS', 500))),
+        'max': max(1, int(os.environ.get('SUMMARY_MAX_OUTPUT_TOKENS', 1500))),
+    }
+
+
+@lru_cache(maxsize=8)
+def _encoding(model):
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding('o200k_base')
+    except Exception as e:
+        # tiktoken hämtar kodningen från nätet första gången; utan nät uppskattas istället
+        logger.warning(f"Kunde inte ladda tokenkodning för {model}, uppskattar antal tokens: {str(e)}")
+        return None
+
+
+def count_tokens(text, model='gpt-4o'):
+    """Antal tokens i text för modellen (uppskattat om tiktoken saknas)."""
+    encoding = _encoding(model)
+    if encoding is None:
+        return len(text) // _CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text))
+
+
+def count_message_tokens(messages, model='gpt-4o'):
+    """Antal tokens som meddelandena tar i prompten."""
+    return sum(count_tokens(message['content'], model) + _MESSAGE_OVERHEAD for message in messages) + _REPLY_OVERHEAD
+
+
+def output_budget(input_tokens, limits=None):
+    """
+    max_tokens för svaret utifrån storleken på det som ska sammanfattas.
+
+    Sammanfattningen växer med underlaget men inte i samma takt: en
+    fjärdedel av underlaget plus en fast del för JSON-strukturen, inom
+    SUMMARY_MIN_OUTPUT_TOKENS och SUMMARY_MAX_OUTPUT_TOKENS.
+    """
+    limits = limits or output_limits()
+    return max(limits['min'], min(limits['max'], input_tokens // 4 + 300))
+
+
+def build_messages(content):
+    """Systemmeddelandet med instruktionerna följt av anropets eget innehåll."""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": content},
+    ]
+
+
+def plan_request(content):
+    """
+    Bygger meddelandena för ett anrop och väljer budget och modeller.
+
+    Returns:
+        dict: messages, prompt_tokens, max_tokens och models (i den ordning
+        de ska provas)
+    """
+    messages = build_messages(content)
+    prompt_tokens = count_message_tokens(messages)
+    max_tokens = output_budget(count_tokens(content))
+    models = route_for_size(prompt_tokens, max_tokens)
+    logger.info(
+        f"Prompt på {prompt_tokens} tokens, svarsbudget {max_tokens}, modellordning: {', '.join(models)}"
+    )
+    return {
+        'messages': messages,
+        'prompt_tokens': prompt_tokens,
+        'max_tokens': max_tokens,
+        'models': models,
+    }
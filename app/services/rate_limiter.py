@@ -0,0 +1,347 @@
+"""
+Gemensam hastighetsbegränsning och backoff för anrop till OpenAI.
+
+Alla Celery-workers hämtar tillstånd ur samma token bucket i Redis innan
+de anropar Whisper eller chat completions. Varje bucket har två
+dimensioner, anrop per minut och tokens per minut, som fylls på
+kontinuerligt. Saknas utrymme får anroparen veta hur länge den ska vänta,
+så att genomströmningen ligger vid kvoten istället för att slå i den.
+
+Får ett anrop ändå 429 pausas hela bucketen för alla workers så länge som
+Retry-After anger, och anropet görs om med exponentiell backoff med
+slumpmässig spridning (full jitter), så att workers inte försöker igen i
+takt med varandra.
+
+Kvoterna ställs in per bucket via miljövariabler (0 betyder obegränsat):
+
+    OPENAI_WHISPER_RPM   anrop per minut till Whisper (standard 50)
+    OPENAI_CHAT_RPM      anrop per minut till chat completions (standard 500)
+    OPENAI_CHAT_TPM      tokens per minut till chat completions (standard 30000)
+
+Går Redis inte att nå används en bucket i processens minne, så att
+anropen fortfarande begränsas (men bara per process). Anslutningen provas
+igen efter REDIS_RETRY_INTERVAL sekunder (standard 30), så att workers
+återgår till den delade kvoten när Redis är tillbaka.
+"""
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+import openai
+
+logger = logging.getLogger("rate_limiter")
+
+WHISPER = 'whisper'
+CHAT = 'chat'
+
+_DEFAULT_LIMITS = {
+    WHISPER: {'rpm': 50, 'tpm': 0},
+    CHAT: {'rpm': 500, 'tpm': 30000},
+}
+
+# Nyckeln för en bucket lever så här länge utan anrop
+BUCKET_TTL_MS = 120000
+
+# Token bucket i Redis. Tiden tas från Redis, så att alla workers räknar
+# med samma klocka. Returnerar antal millisekunder att vänta (0 = tillstånd givet).
+_ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local blocked = tonumber(redis.call('GET', KEYS[2]) or '0')
+if blocked > now then
+    return blocked - now
+end
+local rpm, tpm, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'requests', 'tokens', 'ts')
+local elapsed = math.max(now - (tonumber(state[3]) or now), 0)
+local requests, tokens, wait = 0, 0, 0
+if rpm > 0 then
+    requests = math.min(rpm, (tonumber(state[1]) or rpm) + elapsed * rpm / 60000)
+    if requests < 1 then
+        wait = math.ceil((1 - requests) * 60000 / rpm)
+    end
+end
+if tpm > 0 then
+    cost = math.min(cost, tpm)
+    tokens = math.min(tpm, (tonumber(state[2]) or tpm) + elapsed * tpm / 60000)
+    if tokens < cost then
+        wait = math.max(wait, math.ceil((cost - tokens) * 60000 / tpm))
+    end
+end
+if wait == 0 then
+    requests = requests - 1
+    tokens = tokens - cost
+end
+redis.call('HSET', KEYS[1], 'requests', tostring(requests), 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], ARGV[4])
+return wait
+"""
+
+
+def bucket_limits(name):
+    """Anrop och tokens per minut för en bucket, från miljön."""
+    defaults = _DEFAULT_LIMITS[name]
+    prefix = f'OPENAI_{name.upper()}'
+    return {
+        'rpm': max(0, int(os.environ.get(f'{prefix}_RPM', defaults['rpm']))),
+        'tpm': max(0, int(os.environ.get(f'{prefix}_TPM', defaults['tpm']))),
+    }
+
+
+def backoff_settings():
+    """Antal försök och backoff-gränser i sekunder, från miljön."""
+    return {
+        'max_retries': max(0, int(os.environ.get('OPENAI_MAX_RETRIES', 6))),
+        'base': float(os.environ.get('OPENAI_BACKOFF_BASE', 1)),
+        'cap': float(os.environ.get('OPENAI_BACKOFF_MAX', 60)),
+    }
+
+
+class LocalBucket:
+    """Samma token bucket som Redis-skriptet, i processens minne."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = {}
+        self._blocked_until = {}
+
+    def acquire(self, name, rpm, tpm, cost):
+        """Returnerar antal millisekunder att vänta (0 = tillstånd givet)."""
+        with self._lock:
+            now = time.monotonic() * 1000
+            blocked = self._blocked_until.get(name, 0)
+            if blocked > now:
+                return int(blocked - now) + 1
+
+            requests, tokens, last = self._state.get(name, (rpm, tpm, now))
+            elapsed = max(now - last, 0)
+            wait = 0
+            if rpm:
+                requests = min(rpm, requests + elapsed * rpm / 60000)
+                if requests < 1:
+                    wait = int((1 - requests) * 60000 / rpm) + 1
+            if tpm:
+                cost = min(cost, tpm)
+                tokens = min(tpm, tokens + elapsed * tpm / 60000)
+                if tokens < cost:
+                    wait = max(wait, int((cost - tokens) * 60000 / tpm) + 1)
+            if not wait:
+                requests -= 1
+                tokens -= cost
+            self._state[name] = (requests, tokens, now)
+            return wait
+
+    def block(self, name, seconds):
+        with self._lock:
+            until = time.monotonic() * 1000 + seconds * 1000
+            self._blocked_until[name] = max(self._blocked_until.get(name, 0), until)
+
+
+class RedisBucket:
+    """Token bucket i Redis, delad av alla workers."""
+
+    def __init__(self, client):
+        self.client = client
+        self._script = client.register_script(_ACQUIRE_SCRIPT)
+
+    def acquire(self, name, rpm, tpm, cost):
+        return int(self._script(
+            keys=[f'openai:ratelimit:{name}', f'openai:ratelimit:{name}:blocked'],
+            args=[rpm, tpm, cost, BUCKET_TTL_MS],
+        ))
+
+    def block(self, name, seconds):
+        # Väntetiden jämförs med Redis klocka i skriptet
+        now_s, now_us = self.client.time()
+        until = now_s * 1000 + now_us // 1000 + int(seconds * 1000)
+        self.client.set(f'openai:ratelimit:{name}:blocked', until, px=int(seconds * 1000) + 1000)
+
+
+_backend = None
+_redis = None
+_redis_failed_at = None
+_local = LocalBucket()
+_backend_lock = threading.Lock()
+
+
+def _redis_url():
+    return os.environ.get('REDIS_URL', os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0'))
+
+
+def redis_retry_interval():
+    """Sekunder innan en misslyckad Redis-anslutning provas igen, från REDIS_RETRY_INTERVAL."""
+    return float(os.environ.get('REDIS_RETRY_INTERVAL', 30))
+
+
+def _retry_due():
+    return _redis_failed_at is None or time.monotonic() - _redis_failed_at >= redis_retry_interval()
+
+
+def get_redis():
+    """
+    Redis-klienten för delat tillstånd mellan workers, eller None om Redis
+    inte går att nå. Används även av model_router.
+    """
+    global _redis, _redis_failed_at
+    if _redis is None and _retry_due():
+        with _backend_lock:
+            if _redis is None and _retry_due():
+                try:
+                    import redis
+                    url = _redis_url()
+                    options = {'ssl_cert_reqs': None} if url.startswith('rediss://') else {}
+                    client = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2, **options)
+                    client.ping()
+                    if _redis_failed_at is not None:
+                        logger.info("Redis nåbart igen, använder den delade kvoten")
+                    _redis = client
+                    _redis_failed_at = None
+                except Exception as e:
+                    logger.warning(f"Redis saknas för delat tillstånd, begränsar per process: {str(e)}")
+                    _redis_failed_at = time.monotonic()
+    return _redis
+
+
+def get_backend():
+    """Redis-bucketen, eller processens egen om Redis inte går att nå."""
+    global _backend
+    if _backend is None or _backend is _local:
+        client = get_redis()
+        _backend = RedisBucket(client) if client is not None else _local
+    return _backend
+
+
+def _reset_after_fork():
+    # Barnprocessen bygger en egen Redis-anslutning vid första anropet
+    global _backend, _redis, _redis_failed_at, _backend_lock
+    _backend = None
+    _redis = None
+    _redis_failed_at = None
+    _backend_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _acquire_wait(name, tokens):
+    limits = bucket_limits(name)
+    if not limits['rpm'] and not limits['tpm']:
+        return 0
+    try:
+        return get_backend().acquire(name, limits['rpm'], limits['tpm'], tokens)
+    except Exception as e:
+        logger.warning(f"Kunde inte fråga Redis om tillstånd, begränsar per process: {str(e)}")
+        return _local.acquire(name, limits['rpm'], limits['tpm'], tokens)
+
+
+def _block(name, seconds):
+    try:
+        get_backend().block(name, seconds)
+    except Exception as e:
+        logger.warning(f"Kunde inte pausa {name} i Redis: {str(e)}")
+        _local.block(name, seconds)
+
+
+def acquire(name, tokens=0):
+    """Väntar tills bucketen har plats för ett anrop med tokens tokens."""
+    while (wait_ms := _acquire_wait(name, tokens)) > 0:
+        time.sleep(wait_ms / 1000)
+
+
+async def acquire_async(name, tokens=0):
+    """Som acquire(), men väntar utan att blockera event loopen."""
+    while (wait_ms := await asyncio.to_thread(_acquire_wait, name, tokens)) > 0:
+        await asyncio.sleep(wait_ms / 1000)
+
+
+def retry_after(error):
+    """Sekunder enligt Retry-After (eller retry-after-ms) i felets svar, eller None."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except (TypeError, ValueError):
+        # Retry-After som datum används inte av OpenAI
+        pass
+    return None
+
+
+def is_retryable(error):
+    """Sant för 429, serverfel, tidsgränser och avbrutna anslutningar."""
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 409 or error.status_code >= 500
+    return False
+
+
+def backoff_delay(attempt, error=None, settings=None):
+    """
+    Väntetid före nästa försök: Retry-After om servern anger en, annars
+    exponentiell backoff med full jitter.
+    """
+    settings = settings or backoff_settings()
+    hinted = retry_after(error) if error is not None else None
+    if hinted is not None:
+        return min(hinted, settings['cap'])
+    return random.uniform(0, min(settings['cap'], settings['base'] * 2 ** attempt))
+
+
+def _on_failure(name, attempt, error, settings):
+    delay = backoff_delay(attempt, error, settings)
+    if isinstance(error, openai.RateLimitError):
+        # Alla workers pausar, inte bara den som fick 429
+        _block(name, delay)
+    logger.warning(
+        f"OpenAI-anrop ({name}) misslyckades, försök {attempt + 1}/{settings['max_retries'] + 1}, "
+        f"väntar {delay:.1f}s: {str(error)}"
+    )
+    return delay
+
+
+def call_with_backoff(name, request, tokens=0, max_retries=None):
+    """
+    Gör ett anrop inom bucketens kvot och försöker igen vid tillfälliga fel.
+
+    Args:
+        name: Bucket, WHISPER eller CHAT
+        request: Funktion utan argument som gör anropet. Anropas igen vid
+            varje nytt försök, så filer måste spolas tillbaka i den.
+        tokens: Uppskattat antal tokens som anropet förbrukar
+        max_retries: Antal omförsök, istället för OPENAI_MAX_RETRIES (valfritt)
+
+    Returns:
+        Svaret från request
+    """
+    settings = backoff_settings()
+    if max_retries is not None:
+        settings['max_retries'] = max_retries
+    for attempt in range(settings['max_retries'] + 1):
+        acquire(name, tokens)
+        try:
+            return request()
+        except Exception as e:
+            if attempt == settings['max_retries'] or not is_retryable(e):
+                raise
+            time.sleep(_on_failure(name, attempt, e, settings))
+
+
+async def call_with_backoff_async(name, request, tokens=0, max_retries=None):
+    """Som call_with_backoff(), men request returnerar en korutin."""
+    settings = backoff_settings()
+    if max_retries is not None:
+        settings['max_retries'] = max_retries
+    for attempt in range(settings['max_retries'] + 1):
+        await acquire_async(name, tokens)
+        try:
+            return await request()
+        except Exception as e:
+            if attempt == settings['max_retries'] or not is_retryable(e):
+                raise
+            await asyncio.sleep(_on_failure(name, attempt, e, settings))
@@ -0,0 +1,197 @@
+"""
+Spoolkatalog för temporära filer under en transkribering.
+
+Uppladdningar, avkodat ljud och optimerade filer skrivs inte längre löst i
+systemets temp-katalog. Varje jobb får en egen katalog under spoolroten:
+
+    <SPOOL_DIR>/<job_id>/   uppladdningen och allt som skapas ur den
+
+Den optimerade filen och dess delar hamnar i samma katalog som
+originalfilen, så jobbet kan tas bort i ett svep när transkriberingen är
+klar. Rensningen av övergivna jobb läser bara spoolroten, en post per
+jobb, och rör aldrig andra programs filer.
+"""
+import os
+import time
+import uuid
+import shutil
+import logging
+import tempfile
+
+logger = logging.getLogger("spool")
+
+
+def spool_root():
+    """Katalog för spooljobb, från SPOOL_DIR."""
+    return os.environ.get('SPOOL_DIR') or os.path.join(tempfile.gettempdir(), 'denthelp_spool')
+
+
+def spool_ttl_seconds():
+    """Hur länge ett jobb utan aktivitet sparas, från SPOOL_TTL_HOURS."""
+    return float(os.environ.get('SPOOL_TTL_HOURS', 1)) * 3600
+
+
+def _directory_size(directory):
+    total = 0
+    for entry in os.scandir(directory):
+        try:
+            total += entry.stat().st_size if entry.is_file(follow_symlinks=False) else 0
+        except OSError:
+            continue
+    return total
+
+
+class SpoolJob:
+    """
+    En katalog under spoolroten som hör till ett jobb.
+
+    Katalogen och allt i den tas bort vid cleanup() eller när ett
+    with-block avslutas.
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.directory = os.path.join(spool_root(), job_id)
+
+    @classmethod
+    def create(cls):
+        """Skapar en ny, tom jobbkatalog."""
+        job = cls(uuid.uuid4().hex)
+        os.makedirs(job.directory)
+        return job
+
+    @classmethod
+    def for_path(cls, path):
+        """
+        Jobbet som en fil ligger i.
+
+        Returns:
+            SpoolJob: Jobbet, eller None om filen inte ligger i ett spooljobb
+        """
+        if not path:
+            return None
+        directory = os.path.dirname(os.path.abspath(os.fspath(path)))
+        if os.path.dirname(directory) != os.path.abspath(spool_root()):
+            return None
+        return cls(os.path.basename(directory))
+
+    def __repr__(self):
+        return f"<SpoolJob {self.job_id}>"
+
+    def path(self, suffix=''):
+        """Skapar en ny tom fil i jobbet och returnerar dess sökväg."""
+        fd, path = tempfile.mkstemp(suffix=suffix, dir=self.directory)
+        os.close(fd)
+        return path
+
+    @property
+    def size(self):
+        """Totalt antal bytes i jobbets filer."""
+        return _directory_size(self.directory) if os.path.isdir(self.directory) else 0
+
+    def cleanup(self):
+        """Tar bort jobbkatalogen och allt i den."""
+        if not os.path.isdir(self.directory):
+            return
+        size = self.size
+        shutil.rmtree(self.directory, ignore_errors=True)
+        logger.info(f"Tog bort spooljobb {self.job_id} ({size / (1024 * 1024):.1f} MB)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
+
+
+def spool_path(suffix='', near=None):
+    """
+    Sökväg för en ny temporär fil.
+
+    Filen skapas i samma jobb som near om den ligger i ett, annars i ett
+    nytt jobb. Den som får sökvägen ansvarar för att ta bort jobbet (eller
+    filen, för filer i ett jobb som ägs av någon annan).
+
+    Args:
+        suffix: Filändelse, t.ex. '.mp3'
+        near: Sökväg till en fil vars jobb den nya filen hör till (valfritt)
+    """
+    job = SpoolJob.for_path(near) if near else None
+    if job is None or not os.path.isdir(job.directory):
+        job = SpoolJob.create()
+    return job.path(suffix)
+
+
+def discard(path):
+    """Tar bort en fil, och dess jobb om filen var den sista i jobbet."""
+    if path and os.path.exists(path):
+        os.remove(path)
+    job = SpoolJob.for_path(path)
+    if job:
+        try:
+            os.rmdir(job.directory)
+        except OSError:
+            # Jobbet har fler filer kvar (eller är redan borttaget)
+            pass
+
+
+def release(path):
+    """Tar bort jobbet som path ligger i, eller bara filen om den ligger utanför spoolen."""
+    job = SpoolJob.for_path(path)
+    if job:
+        job.cleanup()
+    elif path and os.path.exists(path):
+        os.remove(path)
+
+
+def spool_usage():
+    """
+    Antal jobb och bytes i spoolen.
+
+    Returns:
+        dict: jobs och bytes
+    """
+    root = spool_root()
+    if not os.path.isdir(root):
+        return {'jobs': 0, 'bytes': 0}
+
+    jobs = 0
+    total = 0
+    for entry in os.scandir(root):
+        if entry.is_dir(follow_symlinks=False):
+            jobs += 1
+            total += _directory_size(entry.path)
+    return {'jobs': jobs, 'bytes': total}
+
+
+def purge_stale_jobs(max_age_seconds=None):
+    """
+    Tar bort jobb som inte har ändrats på max_age_seconds.
+
+    Ett jobb räknas som aktivt så länge någon fil i det har skrivits inom
+    tidsgränsen.
+
+    Returns:
+        int: Antal borttagna jobb
+    """
+    max_age_seconds = spool_ttl_seconds() if max_age_seconds is None else max_age_seconds
+    root = spool_root()
+    if not os.path.isdir(root):
+        return 0
+
+    removed = 0
+    now = time.time()
+    for entry in os.scandir(root):
+        if not entry.is_dir(follow_symlinks=False):
+            continue
+        try:
+            last_activity = max([entry.stat().st_mtime] + [f.stat().st_mtime for f in os.scandir(entry.path)])
+        except OSError:
+            continue
+        if now - last_activity > max_age_seconds:
+            SpoolJob(entry.name).cleanup()
+            removed += 1
+
+    if removed:
+        logger.info(f"Tog bort {removed} övergivna spooljobb")
+    return removed
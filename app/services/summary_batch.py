@@ -0,0 +1,308 @@
+"""
+Uppskjutna sammanfattningar via OpenAI:s batch-API.
+
+Alla sammanfattningar behöver inte vara klara på några sekunder. För
+massimporter och dagens sista dikteringar kan generate_summary(defer_to=...)
+istället lägga jobbet i en kö (tabellen summary_batch_jobs). Batch-API:t
+kostar hälften så mycket och har en egen kvot, så jobben konkurrerar inte
+med interaktiva anrop om rate limit.
+
+Två periodiska uppgifter sköter resten:
+
+    submit_pending()   packar köade jobb i en JSONL-fil, laddar upp den och
+                       startar en batch
+    poll_batches()     hämtar resultatet för färdiga batcher och skriver
+                       sammanfattningarna till Transcription.summary
+
+Jobb som misslyckas läggs tillbaka i kön och skickas med nästa batch, högst
+SUMMARY_BATCH_MAX_ATTEMPTS gånger. Inställningar:
+
+    SUMMARY_BATCH_MODEL              modell för batchjobben (standard: den
+                                     route_for_size() väljer först)
+    SUMMARY_BATCH_MAX_REQUESTS       högsta antal jobb per batchfil (standard 1000)
+    SUMMARY_BATCH_MAX_ATTEMPTS       försök per jobb (standard 3)
+    SUMMARY_BATCH_COMPLETION_WINDOW  tid batchen får ta (standard 24h)
+    SUMMARY_BATCH_POLL_INTERVAL      sekunder mellan körningarna (standard 300)
+"""
+import os
+import json
+import uuid
+import logging
+from datetime import datetime, timedelta
+import openai
+from app import db
+from app.models.summary_batch import SummaryBatchJob
+from app.models.transcription import Transcription
+from app.services.openai_client import get_client
+from app.services.rate_limiter import is_retryable
+from app.services.prompt_builder import plan_request
+from app.services.summary_service import (
+    build_prompt, parse_summary, create_error_response, get_api_key, models_key, prompt_fingerprint
+)
+from app.services import summary_cache
+
+logger = logging.getLogger("summary_batch")
+
+PENDING = 'pending'
+SUBMITTING = 'submitting'
+SUBMITTED = 'submitted'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+ENDPOINT = '/v1/chat/completions'
+
+# Batcher i dessa tillstånd kommer inte att ändras mer
+_FINISHED_BATCH = ('completed', 'failed', 'expired', 'cancelled')
+
+# Jobb som blivit kvar under uppladdning (t.ex. om workern dog) köas om efter denna tid
+_STALE_SUBMIT = timedelta(hours=1)
+
+
+def batch_settings():
+    """Batchfilernas storlek, antal försök per jobb och batchens tidsfönster, från miljön."""
+    return {
+        'model': os.environ.get('SUMMARY_BATCH_MODEL') or None,
+        'max_requests': max(1, int(os.environ.get('SUMMARY_BATCH_MAX_REQUESTS', 1000))),
+        'max_attempts': max(1, int(os.environ.get('SUMMARY_BATCH_MAX_ATTEMPTS', 3))),
+        'completion_window': os.environ.get('SUMMARY_BATCH_COMPLETION_WINDOW', '24h'),
+    }
+
+
+def poll_interval():
+    """Sekunder mellan inskickning och hämtning av batcher, från SUMMARY_BATCH_POLL_INTERVAL."""
+    return float(os.environ.get('SUMMARY_BATCH_POLL_INTERVAL', 300))
+
+
+def _client():
+    api_key = get_api_key()
+    if not api_key:
+        raise ValueError("OpenAI API key missing. Check environment variables or app configuration.")
+    return get_client(api_key)
+
+
+def build_request(transcription):
+    """Anropet som ska köras för transkriptionen, samma prompt och budget som ett direkt anrop."""
+    plan = plan_request(build_prompt(transcription))
+    return {
+        'model': batch_settings()['model'] or plan['models'][0],
+        'messages': plan['messages'],
+        'max_tokens': plan['max_tokens'],
+        'response_format': {'type': 'json_object'},
+    }
+
+
+def enqueue(transcription_id, transcription):
+    """
+    Köar en sammanfattning av transkriptionen till nästa batch.
+
+    Args:
+        transcription_id: ID för den Transcription som ska få sammanfattningen
+        transcription: Transkriberad text
+
+    Returns:
+        SummaryBatchJob: Det köade jobbet
+    """
+    job = SummaryBatchJob(
+        transcription_id=transcription_id,
+        request_body=json.dumps(build_request(transcription), ensure_ascii=False),
+        models=models_key(),
+        prompt_version=prompt_fingerprint(),
+        status=PENDING
+    )
+    db.session.add(job)
+    db.session.commit()
+    logger.info(f"Köade sammanfattning av transkription {transcription_id} som batchjobb {job.id}")
+    return job
+
+
+def _claim_pending(limit):
+    """Reserverar köade jobb för den här körningen, så att samtidiga körningar inte skickar samma jobb."""
+    SummaryBatchJob.query.filter(
+        SummaryBatchJob.status == SUBMITTING,
+        SummaryBatchJob.submitted_at < datetime.utcnow() - _STALE_SUBMIT
+    ).update({SummaryBatchJob.status: PENDING, SummaryBatchJob.batch_id: None}, synchronize_session=False)
+
+    claim = f'claim-{uuid.uuid4().hex}'
+    pending = [row.id for row in SummaryBatchJob.query.with_entities(SummaryBatchJob.id)
+               .filter_by(status=PENDING).order_by(SummaryBatchJob.id.asc()).limit(limit)]
+    SummaryBatchJob.query.filter(
+        SummaryBatchJob.id.in_(pending), SummaryBatchJob.status == PENDING
+    ).update({
+        SummaryBatchJob.status: SUBMITTING,
+        SummaryBatchJob.batch_id: claim,
+        SummaryBatchJob.submitted_at: datetime.utcnow()
+    }, synchronize_session=False)
+    db.session.commit()
+    return SummaryBatchJob.query.filter_by(batch_id=claim).order_by(SummaryBatchJob.id.asc()).all()
+
+
+def submit_pending():
+    """
+    Skickar köade jobb som en batch, högst SUMMARY_BATCH_MAX_REQUESTS åt gången.
+
+    Returns:
+        str: ID för den startade batchen, eller None om kön var tom
+    """
+    jobs = _claim_pending(batch_settings()['max_requests'])
+    if not jobs:
+        return None
+
+    lines = [
+        json.dumps({'custom_id': job.custom_id, 'method': 'POST', 'url': ENDPOINT,
+                    'body': json.loads(job.request_body)}, ensure_ascii=False)
+        for job in jobs
+    ]
+    try:
+        client = _client()
+        input_file = client.files.create(
+            file=('summaries.jsonl', ('\n'.join(lines) + '\n').encode('utf-8'), 'application/jsonl'),
+            purpose='batch'
+        )
+        batch = client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=ENDPOINT,
+            completion_window=batch_settings()['completion_window']
+        )
+    except Exception:
+        # Jobben skickas med nästa körning istället
+        for job in jobs:
+            job.status = PENDING
+            job.batch_id = None
+        db.session.commit()
+        raise
+
+    for job in jobs:
+        job.status = SUBMITTED
+        job.batch_id = batch.id
+        job.attempts += 1
+    db.session.commit()
+    logger.info(f"Skickade {len(jobs)} sammanfattningar som batch {batch.id}")
+    return batch.id
+
+
+def _read_results(client, file_id):
+    """Raderna i en resultat- eller felfil från batch-API:t."""
+    if not file_id:
+        return []
+    content = client.files.content(file_id).text
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+
+def _complete(job, summary):
+    transcription = db.session.get(Transcription, job.transcription_id)
+    if transcription is None:
+        job.status = FAILED
+        job.error = 'Transkriptionen finns inte längre'
+        return
+    if transcription.summary is None:
+        transcription.summary = json.dumps(summary, ensure_ascii=False)
+    job.status = COMPLETED
+    job.error = None
+    job.completed_at = datetime.utcnow()
+
+
+def _retry(job, error):
+    """Köar om jobbet, eller ger upp och sparar en felsammanfattning när försöken är slut."""
+    job.error = error
+    job.batch_id = None
+    if job.attempts < batch_settings()['max_attempts']:
+        logger.warning(f"Batchjobb {job.id} misslyckades, köas om: {error}")
+        job.status = PENDING
+        return
+
+    logger.error(f"Batchjobb {job.id} misslyckades efter {job.attempts} försök: {error}")
+    job.status = FAILED
+    job.completed_at = datetime.utcnow()
+    transcription = db.session.get(Transcription, job.transcription_id)
+    if transcription is not None and transcription.summary is None:
+        transcription.summary = json.dumps(create_error_response("Batchsammanfattning misslyckades"), ensure_ascii=False)
+
+
+def _apply_result(job, line):
+    """Sparar ett svar ur resultatfilen. Returns: sammanfattningen, eller None om svaret var ett fel."""
+    response = line.get('response') or {}
+    if line.get('error') or response.get('status_code') != 200:
+        error = line.get('error') or (response.get('body') or {}).get('error') or f"HTTP {response.get('status_code')}"
+        _retry(job, str(error.get('message', error) if isinstance(error, dict) else error))
+        return None
+    try:
+        summary = parse_summary(response['body']['choices'][0]['message']['content'])
+    except (KeyError, IndexError, TypeError, ValueError) as e:
+        _retry(job, f"Ogiltigt svar: {str(e)}")
+        return None
+    _complete(job, summary)
+    return summary if job.status == COMPLETED else None
+
+
+def poll_batches():
+    """
+    Hämtar resultatet för skickade batcher som är färdiga.
+
+    Returns:
+        int: Antal transkriptioner som fick sin sammanfattning
+    """
+    batch_ids = [row.batch_id for row in db.session.query(SummaryBatchJob.batch_id)
+                 .filter_by(status=SUBMITTED).distinct()]
+    if not batch_ids:
+        return 0
+
+    client = _client()
+    completed = 0
+    for batch_id in batch_ids:
+        try:
+            batch = client.batches.retrieve(batch_id)
+            if batch.status not in _FINISHED_BATCH:
+                logger.info(f"Batch {batch_id} är inte klar ({batch.status})")
+                continue
+            # Även batcher som löpt ut eller avbrutits har resultat för de anrop som hann köras
+            lines = _read_results(client, batch.output_file_id) + _read_results(client, batch.error_file_id)
+        except openai.APIStatusError as e:
+            if is_retryable(e):
+                logger.warning(f"Kunde inte hämta batch {batch_id}: {str(e)}")
+                continue
+            # Batchen finns inte (längre) för den här nyckeln, jobben köas om
+            logger.error(f"Batch {batch_id} kan inte hämtas: {str(e)}")
+            for job in SummaryBatchJob.query.filter_by(batch_id=batch_id, status=SUBMITTED):
+                _retry(job, f"Batch {batch_id} kan inte hämtas (HTTP {e.status_code})")
+            db.session.commit()
+            continue
+        except Exception as e:
+            # Batchen hämtas igen vid nästa körning, övriga batcher samlas in ändå
+            logger.warning(f"Kunde inte hämta batch {batch_id}: {str(e)}")
+            continue
+
+        jobs = {job.custom_id: job for job in SummaryBatchJob.query.filter_by(batch_id=batch_id, status=SUBMITTED)}
+        summaries = []
+        for line in lines:
+            job = jobs.pop(line.get('custom_id'), None)
+            if job is None:
+                continue
+            if (summary := _apply_result(job, line)) is not None:
+                transcription = db.session.get(Transcription, job.transcription_id)
+                summaries.append((job, transcription.transcription_text, summary))
+
+        for job in jobs.values():
+            _retry(job, f"Inget svar i batch {batch_id} ({batch.status})")
+        db.session.commit()
+
+        for job, text, summary in summaries:
+            try:
+                summary_cache.store(text, job.models, job.prompt_version, summary)
+            except Exception as e:
+                logger.warning(f"Kunde inte spara i sammanfattningscachen: {str(e)}")
+        completed += len(summaries)
+        logger.info(f"Batch {batch_id} ({batch.status}): {len(summaries)} sammanfattningar sparade")
+
+    return completed
+
+
+def queue_stats():
+    """
+    Antal jobb i varje tillstånd.
+
+    Returns:
+        dict: pending, submitting, submitted, completed och failed
+    """
+    counts = dict(db.session.query(SummaryBatchJob.status, db.func.count(SummaryBatchJob.id))
+                  .group_by(SummaryBatchJob.status))
+    return {status: counts.get(status, 0) for status in (PENDING, SUBMITTING, SUBMITTED, COMPLETED, FAILED)}
@@ -0,0 +1,150 @@
+"""
+Cache för sammanfattningar av identiska transkriptioner.
+
+Ett jobb som körs om, eller försöks igen efter ett fel, ger oftast exakt
+samma transkription. Då återanvänds sammanfattningen istället för nya
+GPT-anrop. Nyckeln är SHA-256 av transkriptionen med normaliserade
+blanksteg, tillsammans med de konfigurerade modellerna och promptens
+version. Versionen innehåller en hash av promptmallarna (se
+summary_service.prompt_fingerprint()), så att en ändrad prompt aldrig ger
+gamla sammanfattningar.
+
+Poster som inte använts på SUMMARY_CACHE_TTL_DAYS dagar, poster för äldre
+promptversioner och de minst nyligen använda posterna över
+SUMMARY_CACHE_MAX_ENTRIES tas bort av purge_stale_entries().
+"""
+import os
+import json
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.audio_cache import CacheCounter
+from app.models.summary_cache import SummaryCacheEntry
+from app.services.audio_cache import increment_counter
+
+logger = logging.getLogger("summary_cache")
+
+HIT_COUNTER = 'summary_cache_hits'
+MISS_COUNTER = 'summary_cache_misses'
+
+
+def cache_ttl_days():
+    """Dagar en oanvänd sammanfattning sparas, från SUMMARY_CACHE_TTL_DAYS."""
+    return float(os.environ.get('SUMMARY_CACHE_TTL_DAYS', 30))
+
+
+def max_entries():
+    """Högsta antal sparade sammanfattningar, från SUMMARY_CACHE_MAX_ENTRIES."""
+    return max(0, int(os.environ.get('SUMMARY_CACHE_MAX_ENTRIES', 10000)))
+
+
+def normalize(transcription):
+    """Transkriptionen med alla blanksteg ersatta av ett mellanslag."""
+    return ' '.join(transcription.split())
+
+
+def transcript_hash(transcription):
+    """SHA-256 för den normaliserade transkriptionen."""
+    return hashlib.sha256(normalize(transcription).encode('utf-8')).hexdigest()
+
+
+def lookup(transcription, models, prompt_version):
+    """
+    Hämtar en cachad sammanfattning och räknar träffen eller missen.
+
+    Args:
+        transcription: Transkriberad text
+        models: De konfigurerade modellerna som en sträng
+        prompt_version: Promptens version inklusive mallarnas hash
+
+    Returns:
+        dict: Cachad sammanfattning, eller None om ingen finns
+    """
+    key = transcript_hash(transcription)
+    entry = SummaryCacheEntry.query.filter_by(
+        transcript_hash=key,
+        models=models,
+        prompt_version=prompt_version
+    ).first()
+
+    if entry is None:
+        logger.info(f"Cachemiss för sammanfattning {key[:12]}")
+        increment_counter(MISS_COUNTER)
+        return None
+
+    logger.info(f"Cacheträff för sammanfattning {key[:12]}")
+    entry.hit_count += 1
+    entry.last_used_at = datetime.utcnow()
+    db.session.commit()
+    increment_counter(HIT_COUNTER)
+    return json.loads(entry.summary)
+
+
+def store(transcription, models, prompt_version, summary):
+    """
+    Sparar en sammanfattning för transkriptionen.
+
+    Om samma transkription sammanfattades parallellt och redan har
+    sparats behålls den befintliga posten.
+    """
+    key = transcript_hash(transcription)
+    entry = SummaryCacheEntry(
+        transcript_hash=key,
+        models=models,
+        prompt_version=prompt_version,
+        summary=json.dumps(summary, ensure_ascii=False)
+    )
+    db.session.add(entry)
+    try:
+        db.session.commit()
+        logger.info(f"Cachade sammanfattning för {key[:12]}")
+    except IntegrityError:
+        db.session.rollback()
+        logger.info(f"Sammanfattning för {key[:12]} fanns redan i cachen")
+
+
+def purge_stale_entries(prompt_version):
+    """
+    Tar bort gamla poster, poster för andra promptversioner och överskottet
+    över max_entries() (minst nyligen använda först).
+
+    Returns:
+        int: Antal borttagna poster
+    """
+    cutoff = datetime.utcnow() - timedelta(days=cache_ttl_days())
+    removed = SummaryCacheEntry.query.filter(
+        db.or_(SummaryCacheEntry.last_used_at < cutoff, SummaryCacheEntry.prompt_version != prompt_version)
+    ).delete(synchronize_session=False)
+
+    overflow = SummaryCacheEntry.query.count() - max_entries()
+    if overflow > 0:
+        oldest = [row.id for row in SummaryCacheEntry.query.with_entities(SummaryCacheEntry.id)
+                  .order_by(SummaryCacheEntry.last_used_at.asc()).limit(overflow)]
+        removed += SummaryCacheEntry.query.filter(SummaryCacheEntry.id.in_(oldest)).delete(synchronize_session=False)
+
+    db.session.commit()
+    if removed:
+        logger.info(f"Tog bort {removed} sammanfattningar ur cachen")
+    return removed
+
+
+def cache_stats():
+    """
+    Returnerar cachens räknare.
+
+    Returns:
+        dict: hits, misses, hit_rate och entries
+    """
+    counters = {counter.name: counter.value for counter in CacheCounter.query.filter(
+        CacheCounter.name.in_([HIT_COUNTER, MISS_COUNTER])
+    )}
+    hits = counters.get(HIT_COUNTER, 0)
+    misses = counters.get(MISS_COUNTER, 0)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+        'entries': SummaryCacheEntry.query.count(),
+    }
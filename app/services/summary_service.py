@@ -4,11 +4,21 @@ Med stöd för framstegsrapportering.
 """
 import os
 import logging
+import re
 import json
 import time
+import hashlib
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import openai
 from flask import current_app
 from app.utils.progress_tracker import update_task_status
+from app.services.openai_client import get_client
+from app.services.cassette import replaying, REPLAY_API_KEY
+from app.services.rate_limiter import call_with_backoff, is_retryable, CHAT
+from app.services.model_router import request_settings, record_success, record_failure, summary_models, fast_models
+from app.services.prompt_builder import plan_request, SYSTEM_PROMPT
+from app.services import summary_cache
 
 # Konfigurera loggning
 logging.basicConfig(
@@ -17,6 +27,13 @@ logging.basicConfig(
 )
 logger = logging.getLogger("summary_service")
 
+# Höj versionen när svaren ska räknas som nya utan att prompten ändrats;
+# ändringar i själva prompten fångas av prompt_fingerprint()
+PROMPT_VERSION = "3"
+
+# Ett yttrande slutar vid punkt, frågetecken, utropstecken eller radbrytning
+_UTTERANCE_END = re.compile(r'(?<=[.!?…])\s+|\n+')
+
 def get_api_key():
     """Get OpenAI API key from environment or application config."""
     # Prioritet: 1. Miljövariabel, 2. App-config
@@ -28,19 +45,131 @@ def get_api_key():
         logger.info("Använder API-nyckel från app-konfiguration")
         return api_key
     
+    if replaying():
+        logger.info("Ingen API-nyckel behövs, svaren spelas upp från kassetter")
+        return REPLAY_API_KEY
+    
     logger.warning("Ingen API-nyckel hittades")
     return None
 
-def generate_summary(transcription, task_id=None):
+@lru_cache(maxsize=1)
+def prompt_fingerprint():
+    """
+    PROMPT_VERSION plus en hash av systemprompten och alla promptmallar.
+    
+    Används i cachenycklarna, så att en ändrad prompt aldrig ger cachade
+    sammanfattningar från den gamla, även om PROMPT_VERSION inte höjts.
+    """
+    templates = (
+        SYSTEM_PROMPT
+        + build_prompt('{}')
+        + build_chunk_prompt('{}', 1, 2)
+        + build_reduce_prompt([{}])
+    )
+    return f"{PROMPT_VERSION}:{hashlib.sha256(templates.encode('utf-8')).hexdigest()[:12]}"
+
+def models_key():
+    """De konfigurerade modellerna, som en del av cachenyckeln."""
+    return ','.join(fast_models() + [model for model in summary_models() if model not in fast_models()])
+
+def _cached_summary(transcription):
+    """Cachad sammanfattning för transkriptionen, eller None (även om cachen inte går att nå)."""
+    try:
+        return summary_cache.lookup(transcription, models_key(), prompt_fingerprint())
+    except Exception as e:
+        logger.warning(f"Kunde inte läsa sammanfattningscachen: {str(e)}")
+        return None
+
+def _store_summary(transcription, summary):
+    """Sparar en lyckad sammanfattning i cachen; fel loggas men stoppar inte jobbet."""
+    try:
+        summary_cache.store(transcription, models_key(), prompt_fingerprint(), summary)
+    except Exception as e:
+        logger.warning(f"Kunde inte spara i sammanfattningscachen: {str(e)}")
+
+def long_transcript_chars():
+    """Längd i tecken över vilken en transkription sammanfattas i delar (SUMMARY_LONG_TRANSCRIPT_CHARS)."""
+    return int(os.environ.get('SUMMARY_LONG_TRANSCRIPT_CHARS', 16000))
+
+def map_reduce_settings():
+    """Delarnas storlek, antal parallella anrop och hur många delsammanfattningar som slås ihop åt gången."""
+    return {
+        'chunk_chars': max(1000, int(os.environ.get('SUMMARY_CHUNK_CHARS', 8000))),
+        'max_workers': max(1, int(os.environ.get('SUMMARY_MAP_CONCURRENCY', 8))),
+        'fan_in': max(2, int(os.environ.get('SUMMARY_REDUCE_FAN_IN', 8))),
+    }
+
+def build_prompt(transcription):
+    """Användarmeddelandet för att sammanfatta en hel transkription i ett anrop."""
+    return f'Transkription: {transcription}'
+
+def build_chunk_prompt(chunk, number, total):
+    """Användarmeddelandet för en del av en lång transkription (map-steget)."""
+    return (
+        f'Detta är del {number} av {total} av en transkription från ett tandläkarmöte. '
+        'Sammanfatta bara det som sägs i just denna del. '
+        'Ta med alla tandnummer, fynd, åtgärder och planer som nämns.\n\n'
+        f'Transkription (del {number}/{total}): {chunk}'
+    )
+
+def build_reduce_prompt(partials):
+    """Användarmeddelandet som slår ihop delsammanfattningar i tidsordning till en (reduce-steget)."""
+    parts = '\n'.join(
+        f'Del {number}: {json.dumps(partial, ensure_ascii=False)}' for number, partial in enumerate(partials, 1)
+    )
+    return (
+        'Nedan följer journalsammanfattningar av på varandra följande delar av samma tandläkarmöte. '
+        'Slå ihop dem till en sammanfattning av hela mötet. Behåll alla tandnummer, fynd och '
+        'åtgärder, ta bort upprepningar, och använd uppgifter från en del även om en annan del anger '
+        '"Ej dokumenterat". Om delarna motsäger varandra gäller den senare delen.\n\n'
+        f'Delsammanfattningar:\n{parts}'
+    )
+
+def split_transcript(transcription, max_chars):
+    """
+    Delar en transkription i bitar på högst max_chars tecken, vid yttrandegränser.
+    
+    Ett yttrande som ensamt är längre än max_chars delas vid närmaste mellanslag.
+    
+    Returns:
+        list: Delarna i ordning
+    """
+    pieces = []
+    for utterance in _UTTERANCE_END.split(transcription.strip()):
+        utterance = utterance.strip()
+        while len(utterance) > max_chars:
+            cut = utterance.rfind(' ', 0, max_chars + 1)
+            if cut <= 0:
+                cut = max_chars
+            pieces.append(utterance[:cut].strip())
+            utterance = utterance[cut:].strip()
+        if utterance:
+            pieces.append(utterance)
+
+    chunks, current = [], ''
+    for piece in pieces:
+        if current and len(current) + 1 + len(piece) > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f'{current} {piece}' if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+def generate_summary(transcription, task_id=None, defer_to=None):
     """
     Generates a structured summary of a dental transcription using GPT.
     
     Args:
         transcription: Transcribed text from the meeting
         task_id: ID för framstegsspårning (valfritt)
+        defer_to: ID för en sparad Transcription; sammanfattningen köas då
+            för batch-API:t och skrivs till transkriptionen när den är klar
+            (valfritt, se summary_batch)
         
     Returns:
-        dict: Structured summary with categories
+        dict: Structured summary with categories, eller None om den köades
     """
     try:
         # Uppdatera status om task_id finns
@@ -55,6 +184,36 @@ def generate_summary(transcription, task_id=None):
                 time_left=15
             )
         
+        # Samma transkription har redan sammanfattats med samma modeller och prompt
+        cached = _cached_summary(transcription)
+        if cached is not None:
+            if task_id:
+                update_task_status(
+                    task_id,
+                    progress=90,
+                    message='Sammanfattning hämtad från cache',
+                    step='summary', 
+                    step_status='completed',
+                    time_left=1
+                )
+            return cached
+        
+        # Brådskar det inte köas sammanfattningen till nästa batch. Långa
+        # transkriptioner kräver flera steg (map-reduce) och körs direkt
+        if defer_to is not None and len(transcription) <= long_transcript_chars():
+            from app.services import summary_batch  # importerar denna modul
+            summary_batch.enqueue(defer_to, transcription)
+            if task_id:
+                update_task_status(
+                    task_id,
+                    progress=90,
+                    message='Sammanfattningen köad för batchkörning',
+                    step='summary', 
+                    step_status='completed',
+                    time_left=1
+                )
+            return None
+        
         # Try to get API key
         api_key = get_api_key()
         
@@ -76,8 +235,7 @@ def generate_summary(transcription, task_id=None):
         
         # Create client with API key
         try:
-            client = openai.OpenAI(api_key=api_key)
-            logger.info("OpenAI klient skapad")
+            client = get_client(api_key)
             
             if task_id:
                 update_task_status(
@@ -113,119 +271,25 @@ def generate_summary(transcription, task_id=None):
                 time_left=10
             )
         
-        # Prompt with specific instructions for dental summaries
-        prompt = (
-            'Sammanfatta detta tandläkarmöte på svenska i ett strukturerat journalformat. Följ dessa regler:\n'
-            '1. Använd ISO 3950-notation (11-48) för tänder\n'
-            '2. För områden utan specifik tand, använd: Q1 (övre höger 11-18), Q2 (övre vänster 21-28), '
-            'Q3 (nedre vänster 31-38), Q4 (nedre höger 41-48)\n'
-            '3. Använd standardförkortningar: Rtg = Röntgen, DH = Dentalhygienist, Pat = Patient, '
-            'ua = Utan anmärkning, EPT = Elektrisk pulpatest, BW = Bitewing\n'
-            '4. Om information saknas, ange "Ej dokumenterat"\n'
-            '5. Returnera i detta JSON-format:\n'
-            '{\n'
-            '  "anamnes": "[patientens symtom och historik]",\n'
-            '  "status": "[kliniska fynd]",\n'
-            '  "diagnos": "[ställd diagnos]",\n'
-            '  "åtgärd": "[utförd behandling]",\n'
-            '  "behandlingsplan": "[planerade åtgärder]",\n'
-            '  "kommunikation": "[informerat patienten]"\n'
-            '}\n\n'
-            f'Transkription: {transcription}\n'
-            'Returnera endast JSON-objektet.'
-        )
-
-        # Försök med olika modeller i prioritetsordning
-        available_models = ["gpt-4o", "gpt-4", "gpt-3.5-turbo"]
-        last_error = None
-        
-        for i, model in enumerate(available_models):
-            try:
-                if task_id:
-                    update_task_status(
-                        task_id,
-                        progress=75 + i*5,
-                        message=f'Använder {model} för sammanfattning...',
-                        time_left=10 - i*3
-                    )
-                    
-                logger.info(f"Försöker använda modell: {model}")
-                
-                # Lägg till lite fördröjning för att visa progress för användaren
-                # (i en riktig implementation skulle detta vara naturlig väntetid från API)
-                if task_id:
-                    time.sleep(0.5)
-                
-                response = client.chat.completions.create(
-                    model=model,
-                    messages=[{"role": "user", "content": prompt}],
-                    max_tokens=1000,
-                    response_format={"type": "json_object"}
-                )
-                
-                summary_json = response.choices[0].message.content
-                logger.info(f"Svar mottaget från OpenAI ({model})")
-                
-                if task_id:
-                    update_task_status(
-                        task_id,
-                        progress=85,
-                        message='Svar mottaget från AI, bearbetar sammanfattning...',
-                        time_left=3
-                    )
-                
-                # Rensa bort eventuella extra tecken före JSON
-                if '```json' in summary_json:
-                    summary_json = summary_json.split('```json')[1].split('```')[0].strip()
-                elif '```' in summary_json:
-                    summary_json = summary_json.split('```')[1].split('```')[0].strip()
-                
-                # Parsa JSON
-                summary_dict = json.loads(summary_json)
-                logger.info("JSON framgångsrikt parsad")
-                
-                if task_id:
-                    update_task_status(
-                        task_id,
-                        progress=90,
-                        message='Sammanfattning slutförd!',
-                        step='summary', 
-                        step_status='completed',
-                        time_left=2
-                    )
-                    
-                return summary_dict
-                
-            except Exception as e:
-                logger.warning(f"Kunde inte använda {model}: {str(e)}")
-                
-                if task_id:
-                    update_task_status(
-                        task_id,
-                        message=f'Varning: Kunde inte använda {model}, provar alternativ...',
-                    )
-                    
-                last_error = e
-                continue
+        # Långa transkriptioner delas upp och sammanfattas parallellt
+        if len(transcription) > long_transcript_chars():
+            summary_dict = _map_reduce_summary(client, transcription, task_id)
+        else:
+            summary_dict = _complete_summary(client, build_prompt(transcription), task_id=task_id)
         
-        # Om vi kommer hit har alla modeller misslyckats
-        error_msg = f"Alla AI-modeller misslyckades: {str(last_error) if last_error else 'Okänt fel'}"
-        logger.error(error_msg)
+        _store_summary(transcription, summary_dict)
         
         if task_id:
             update_task_status(
                 task_id,
-                status='error',
-                message=error_msg,
+                progress=90,
+                message='Sammanfattning slutförd!',
                 step='summary', 
-                step_status='error',
-                error=error_msg
+                step_status='completed',
+                time_left=2
             )
             
-        if last_error:
-            raise last_error
-        else:
-            raise RuntimeError("Alla modeller misslyckades utan specifikt fel")
+        return summary_dict
             
     except json.JSONDecodeError as json_error:
         error_msg = f"JSON parse error: {str(json_error)}"
@@ -331,6 +395,188 @@ def generate_summary(transcription, task_id=None):
             
         return create_error_response(f"Oväntat fel: {str(e)}")
 
+def _complete_summary(client, content, task_id=None):
+    """
+    Skickar ett sammanfattningsanrop till bästa tillgängliga modell och parsar svaret.
+    
+    Prompten byggs och räknas av prompt_builder, som också väljer svarsbudget
+    och i vilken ordning modellerna provas utifrån promptens storlek.
+    
+    Returns:
+        dict: Sammanfattningen från modellens JSON-svar
+        
+    Raises:
+        Felet från den sista modellen om alla misslyckas
+    """
+    plan = plan_request(content)
+    available_models = plan['models']
+    request = request_settings()
+    last_error = None
+    
+    for i, model in enumerate(available_models):
+        try:
+            if task_id:
+                update_task_status(
+                    task_id,
+                    progress=75 + i*5,
+                    message=f'Använder {model} för sammanfattning...',
+                    time_left=10 - i*3
+                )
+                
+            logger.info(f"Försöker använda modell: {model}")
+            
+            # Bara själva anropet tidtas, inte väntan på kvoten eller backoff
+            latencies = []
+            def request_summary():
+                started = time.perf_counter()
+                response = client.chat.completions.create(
+                    model=model,
+                    messages=plan['messages'],
+                    max_tokens=plan['max_tokens'],
+                    response_format={"type": "json_object"},
+                    timeout=request['timeout']
+                )
+                latencies.append(time.perf_counter() - started)
+                return response
+            
+            # Vid 429 väntar alla workers enligt Retry-After innan nästa försök,
+            # först när försöken är slut provas nästa modell
+            try:
+                response = call_with_backoff(CHAT, request_summary, tokens=plan['prompt_tokens'] + plan['max_tokens'],
+                                             max_retries=request['max_retries'])
+            except Exception as e:
+                # Bara överbelastning och nätverksfel räknas mot modellen; fel i
+                # anropet eller nyckeln blir inte bättre av att byta modell
+                if is_retryable(e):
+                    record_failure(model)
+                raise
+            record_success(model, latencies[-1])
+            
+            summary_json = response.choices[0].message.content
+            logger.info(f"Svar mottaget från OpenAI ({model})")
+            
+            if task_id:
+                update_task_status(
+                    task_id,
+                    progress=85,
+                    message='Svar mottaget från AI, bearbetar sammanfattning...',
+                    time_left=3
+                )
+            
+            summary_dict = parse_summary(summary_json)
+            logger.info("JSON framgångsrikt parsad")
+            
+            return summary_dict
+            
+        except Exception as e:
+            logger.warning(f"Kunde inte använda {model}: {str(e)}")
+            
+            if task_id:
+                update_task_status(
+                    task_id,
+                    message=f'Varning: Kunde inte använda {model}, provar alternativ...',
+                )
+                
+            last_error = e
+            continue
+    
+    # Om vi kommer hit har alla modeller misslyckats
+    error_msg = f"Alla AI-modeller misslyckades: {str(last_error) if last_error else 'Okänt fel'}"
+    logger.error(error_msg)
+    
+    if task_id:
+        update_task_status(
+            task_id,
+            status='error',
+            message=error_msg,
+            step='summary', 
+            step_status='error',
+            error=error_msg
+        )
+        
+    if last_error:
+        raise last_error
+    else:
+        raise RuntimeError("Alla modeller misslyckades utan specifikt fel")
+
+def _map_reduce_summary(client, transcription, task_id=None):
+    """
+    Sammanfattar en lång transkription i delar och slår ihop resultaten.
+    
+    Delarna sammanfattas parallellt (map) till samma JSON-format som en
+    vanlig sammanfattning. Delsammanfattningarna slås sedan ihop (reduce),
+    högst fan_in åt gången och i flera nivåer om det behövs, så att
+    svarstiden växer långsamt med transkriptionens längd.
+    
+    Returns:
+        dict: Sammanfattningen av hela transkriptionen
+    """
+    settings = map_reduce_settings()
+    chunks = split_transcript(transcription, settings['chunk_chars'])
+    logger.info(f"Lång transkription ({len(transcription)} tecken), sammanfattar {len(chunks)} delar parallellt")
+    
+    if task_id:
+        update_task_status(
+            task_id,
+            progress=72,
+            message=f'Lång transkription, sammanfattar {len(chunks)} delar parallellt...',
+            time_left=10
+        )
+    
+    with ThreadPoolExecutor(max_workers=min(settings['max_workers'], len(chunks))) as executor:
+        futures = {
+            executor.submit(_complete_summary, client, build_chunk_prompt(chunk, number, len(chunks))): number - 1
+            for number, chunk in enumerate(chunks, 1)
+        }
+        partials = [None] * len(chunks)
+        for done, future in enumerate(as_completed(futures), 1):
+            partials[futures[future]] = future.result()
+            if task_id:
+                update_task_status(
+                    task_id,
+                    progress=72 + int(10 * done / len(chunks)),
+                    message=f'Sammanfattade del {done} av {len(chunks)}...',
+                    time_left=5
+                )
+        
+        if task_id:
+            update_task_status(
+                task_id,
+                progress=84,
+                message='Slår ihop delsammanfattningarna...',
+                time_left=3
+            )
+        
+        while len(partials) > 1:
+            groups = [partials[i:i + settings['fan_in']] for i in range(0, len(partials), settings['fan_in'])]
+            partials = list(executor.map(
+                lambda group: _complete_summary(client, build_reduce_prompt(group)) if len(group) > 1 else group[0],
+                groups
+            ))
+    
+    return partials[0]
+
+def parse_summary(reply):
+    """
+    Parsar modellens svar till en sammanfattning.
+    
+    Raises:
+        json.JSONDecodeError: Om svaret inte är giltig JSON
+    """
+    # Rensa bort eventuella extra tecken före JSON
+    if '```json' in reply:
+        reply = reply.split('```json')[1].split('```')[0].strip()
+    elif '```' in reply:
+        reply = reply.split('```')[1].split('```')[0].strip()
+    
+    return json.loads(reply)
+
+def is_error_response(summary):
+    """True om sammanfattningen är en felstruktur från create_error_response eller JSON-fallbacken."""
+    return bool(summary) and all(
+        isinstance(value, str) and value.startswith("Ej dokumenterat (") for value in summary.values()
+    )
+
 def create_error_response(error_message):
     """Creates a standardized error response."""
     return {
@@ -4,14 +4,38 @@ Har nu stöd för framstegsrapportering.
 """
 import os
 import logging
-import tempfile
 from io import BytesIO
 import openai
 from flask import current_app
 from app.utils.progress_tracker import update_task_status, format_size
+from app.services.spool import spool_path, discard
+from app.services.openai_client import get_client
+from app.services.cassette import replaying, REPLAY_API_KEY
+from app.services.async_transcription import run_transcriptions
+from app.services.rate_limiter import call_with_backoff, WHISPER
 
 logger = logging.getLogger(__name__)
 
+WHISPER_MODEL = "whisper-1"
+WHISPER_LANGUAGE = "sv"  # Svenska
+
+def _is_disk_file(audio_file):
+    """Sant om objektet är en öppen fil på disk med ett filnamn som API:t kan använda."""
+    name = getattr(audio_file, 'name', None)
+    return isinstance(name, str) and os.path.isfile(name) and hasattr(audio_file, 'fileno')
+
+def _create_transcription(client, audio_file):
+    """Ett Whisper-anrop inom den gemensamma kvoten, med backoff vid tillfälliga fel."""
+    def request():
+        # Filen spolas tillbaka inför varje försök
+        audio_file.seek(0)
+        return client.audio.transcriptions.create(
+            model=WHISPER_MODEL,
+            file=audio_file,
+            language=WHISPER_LANGUAGE
+        )
+    return call_with_backoff(WHISPER, request)
+
 def get_api_key():
     """Hämta OpenAI API-nyckel från miljö eller app-konfiguration."""
     if api_key := os.environ.get("OPENAI_API_KEY"):
@@ -22,6 +46,10 @@ def get_api_key():
         logger.info("Använder API-nyckel från Flask-app konfiguration")
         return current_app.config['OPENAI_API_KEY']
     
+    if replaying():
+        logger.info("Ingen API-nyckel behövs, svaren spelas upp från kassetter")
+        return REPLAY_API_KEY
+    
     logger.warning("Ingen API-nyckel hittades")
     return None
 
@@ -30,12 +58,16 @@ def transcribe_audio(audio_file, task_id=None):
     Transkribera en ljudfil med OpenAI Whisper API.
     
     Args:
-        audio_file: Ett BytesIO-objekt eller fil-liknande objekt med ljuddata
+        audio_file: Ett BytesIO-objekt, fil-liknande objekt, sökväg eller
+            ProcessedAudio, eller en lista med delar från process_audio(split=True)
         task_id: ID för framstegsspårning (valfritt)
         
     Returns:
         str: Transkriberad text
     """
+    if isinstance(audio_file, (list, tuple)):
+        return transcribe_chunks(audio_file, task_id=task_id)
+    
     try:
         # Uppdatera status om task_id ges
         if task_id:
@@ -68,9 +100,8 @@ def transcribe_audio(audio_file, task_id=None):
             
             raise ValueError(error_msg)
         
-        # Skapa klient med API-nyckel
-        client = openai.OpenAI(api_key=api_key)
-        logger.info("OpenAI klient skapad")
+        # Processens delade klient, med anslutningar som hålls vid liv mellan anropen
+        client = get_client(api_key)
         
         # Uppdatera status
         if task_id:
@@ -97,10 +128,23 @@ def transcribe_audio(audio_file, task_id=None):
                 audio_file.seek(0)
                 logger.info("Återställde filpekaren till början")
                 
+                # En öppen fil på disk kan strömmas direkt utan temporär kopia
+                if not isinstance(audio_file, BytesIO) and _is_disk_file(audio_file):
+                    logger.info("Skickar transkriptionsbegäran till OpenAI (direkt från fil)")
+                    
+                    if task_id:
+                        update_task_status(
+                            task_id,
+                            progress=40,
+                            message='Skickar till OpenAI Whisper API...',
+                            time_left=10
+                        )
+                    
+                    transcription = _create_transcription(client, audio_file)
                 # Om det är ett filliknande objekt som inte är BytesIO, spara det tillfälligt
-                if not isinstance(audio_file, BytesIO):
+                elif not isinstance(audio_file, BytesIO):
                     logger.info("Skapar temporär fil för icke-BytesIO objekt")
-                    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3')
+                    temp_file = open(spool_path('.mp3'), 'wb')
                     temp_file.write(audio_file.read())
                     temp_file.close()
                     audio_file.seek(0)  # Återställ läshuvudet igen
@@ -127,11 +171,7 @@ def transcribe_audio(audio_file, task_id=None):
                                 time_left=10
                             )
                         
-                        transcription = client.audio.transcriptions.create(
-                            model="whisper-1",
-                            file=f,
-                            language="sv"  # Svenska
-                        )
+                        transcription = _create_transcription(client, f)
                 else:
                     # Om det är en BytesIO, försök använda den direkt
                     try:
@@ -145,17 +185,13 @@ def transcribe_audio(audio_file, task_id=None):
                                 time_left=10
                             )
                         
-                        transcription = client.audio.transcriptions.create(
-                            model="whisper-1",
-                            file=audio_file,
-                            language="sv"  # Svenska
-                        )
+                        transcription = _create_transcription(client, audio_file)
                     except Exception as e:
                         logger.error(f"Fel vid direkt BytesIO transaktion: {str(e)}")
                         
                         # Fallback: Spara BytesIO till temporär fil
                         logger.info("Försöker med fallback till temporär fil för BytesIO")
-                        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3')
+                        temp_file = open(spool_path('.mp3'), 'wb')
                         temp_file.write(audio_file.getvalue())
                         temp_file.close()
                         audio_file.seek(0)  # Återställ läshuvudet igen
@@ -170,11 +206,7 @@ def transcribe_audio(audio_file, task_id=None):
                         
                         with open(temp_file.name, 'rb') as f:
                             logger.info("Skickar transkriptionsbegäran till OpenAI (fallback från BytesIO)")
-                            transcription = client.audio.transcriptions.create(
-                                model="whisper-1",
-                                file=f,
-                                language="sv"  # Svenska
-                            )
+                            transcription = _create_transcription(client, f)
             else:
                 # Om det inte är ett filliknande objekt, anta att det är en sökväg
                 logger.info(f"Skickar transkriptionsbegäran till OpenAI från sökväg: {audio_file}")
@@ -188,11 +220,7 @@ def transcribe_audio(audio_file, task_id=None):
                     )
                 
                 with open(audio_file, 'rb') as f:
-                    transcription = client.audio.transcriptions.create(
-                        model="whisper-1",
-                        file=f,
-                        language="sv"  # Svenska
-                    )
+                    transcription = _create_transcription(client, f)
             
             # Uppdatera framsteg när transkriberingen är klar
             if task_id:
@@ -213,7 +241,7 @@ def transcribe_audio(audio_file, task_id=None):
             # Ta bort temporär fil om den skapades
             if temp_file and os.path.exists(temp_file.name):
                 logger.info(f"Tar bort temporär fil: {temp_file.name}")
-                os.unlink(temp_file.name)
+                discard(temp_file.name)
                 
     except openai.OpenAIError as oe:
         # Logga OpenAI-specifika fel
@@ -246,4 +274,96 @@ def transcribe_audio(audio_file, task_id=None):
                 error=error_msg
             )
             
-        raise RuntimeError(f"Fel under transkribering: {str(e)}")
\ No newline at end of file
+        raise RuntimeError(f"Fel under transkribering: {str(e)}")
+
+def max_concurrency():
+    """Högsta antal samtidiga anrop till Whisper API, från WHISPER_MAX_CONCURRENCY."""
+    return max(1, int(os.environ.get('WHISPER_MAX_CONCURRENCY', 4)))
+
+def transcribe_chunks(chunks, task_id=None, max_workers=None):
+    """
+    Transkribera flera delar av en inspelning parallellt och foga ihop texten.
+    
+    Delarna skickas samtidigt till Whisper API från den asynkrona motorn i
+    app.services.async_transcription, högst max_workers åt gången. Texterna
+    fogas ihop i delarnas ordning oavsett i vilken ordning svaren kommer.
+    
+    Args:
+        chunks: Lista med BytesIO-objekt, fil-liknande objekt eller sökvägar, i ordning
+        task_id: ID för framstegsspårning (valfritt)
+        max_workers: Högsta antal samtidiga anrop (standard WHISPER_MAX_CONCURRENCY)
+        
+    Returns:
+        str: Transkriberad text för hela inspelningen
+    """
+    try:
+        if task_id:
+            update_task_status(
+                task_id, 
+                progress=25,
+                status='transcribing',
+                message=f'Förbereder transkribering av {len(chunks)} delar...',
+                step='transcription', 
+                step_status='active',
+                time_left=20
+            )
+        
+        api_key = get_api_key()
+        if not api_key:
+            raise ValueError("OpenAI API-nyckel saknas. Kontrollera miljövariabler eller app-konfiguration.")
+        
+        workers = min(max_workers or max_concurrency(), len(chunks)) or 1
+        logger.info(f"Transkriberar {len(chunks)} delar med upp till {workers} samtidiga anrop")
+        
+        if task_id:
+            update_task_status(
+                task_id,
+                progress=40,
+                message=f'Skickar {len(chunks)} delar till OpenAI Whisper API...',
+                time_left=10
+            )
+        
+        def on_done(index, done):
+            logger.info(f"Del {index + 1}/{len(chunks)} transkriberad")
+            
+            if task_id:
+                update_task_status(
+                    task_id,
+                    progress=40 + int(20 * done / len(chunks)),
+                    message=f'Transkriberat {done} av {len(chunks)} delar...'
+                )
+        
+        texts = run_transcriptions(
+            chunks, api_key, WHISPER_MODEL, WHISPER_LANGUAGE, workers, on_done=on_done
+        )
+        
+        text = " ".join(part.strip() for part in texts if part and part.strip())
+        
+        if task_id:
+            update_task_status(
+                task_id,
+                progress=60,
+                message=f'Transkribering slutförd! ({len(text)} tecken)',
+                step='transcription', 
+                step_status='completed',
+                time_left=0
+            )
+        
+        logger.info("Transkribering av alla delar slutförd framgångsrikt")
+        return text
+        
+    except Exception as e:
+        error_msg = f"Transkriptionsfel: {str(e)}"
+        logger.error(error_msg)
+        
+        if task_id:
+            update_task_status(
+                task_id,
+                status='error',
+                message=error_msg,
+                step='transcription', 
+                step_status='error',
+                error=error_msg
+            )
+            
+        raise RuntimeError(f"Fel under transkribering: {str(e)}")
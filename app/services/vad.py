@@ -0,0 +1,283 @@
+"""
+Vektoriserad taldetektering (voice activity detection) med NumPy.
+
+Ersätter pydub.silence.detect_nonsilent, som beräknar dBFS för ett fönster
+i taget i Python. Här läses sampeldatan via en vy utan kopiering, energin
+beräknas en gång per delsträcka mellan fönstergränser, fönster-RMS tas
+fram ur kumulativa summor och tröskelmasken grupperas till intervall utan
+Python-loopar över ljudet. Resultatet är samma [start, slut]-intervall i
+millisekunder som pydub ger.
+
+Tröskeln kan också anpassas per inspelning: brusgolvet skattas som en låg
+percentil av ramenergierna och tröskel och minsta tystnadslängd härleds
+från avståndet mellan brusgolvet och talnivån.
+"""
+import numpy as np
+
+_DTYPES = {1: np.int8, 2: np.int16, 4: np.int32}
+
+# Percentiler av ramnivåerna som skattar brusgolv respektive talnivå
+NOISE_FLOOR_PERCENTILE = 10
+SPEECH_LEVEL_PERCENTILE = 90
+
+# Tröskeln läggs så här högt över brusgolvet, högst halvvägs till talnivån,
+# och hålls inom gränserna nedan
+THRESHOLD_MARGIN_DB = 8
+MIN_SILENCE_THRESH = -60
+MAX_SILENCE_THRESH = -25
+
+# Under detta avstånd mellan brusgolv och talnivå går brus och tal inte att
+# skilja åt (nästan bara tal eller bara brus) och den fasta tröskeln används
+MIN_SNR_DB = 12
+DEFAULT_SILENCE_THRESH = -45
+
+# Minsta tystnadslängd: kortare när tal och brus är tydligt åtskilda
+CLEAN_SNR_DB = 25
+CLEAN_MIN_SILENCE_LEN = 700
+NOISY_MIN_SILENCE_LEN = 1000
+
+# Nivå för ramar helt utan signal
+_DIGITAL_SILENCE_DBFS = -120.0
+
+
+def audio_to_array(audio):
+    """
+    Returnerar sampeldata för ett AudioSegment som en (ramar, kanaler)-vy.
+
+    Vyn delar minne med AudioSegment:ets rådata och kopierar inget.
+    """
+    dtype = _DTYPES.get(audio.sample_width)
+    if dtype is None:
+        raise ValueError(f"Sampelbredd {audio.sample_width} stöds inte")
+    samples = np.frombuffer(audio.raw_data, dtype=dtype)
+    usable = len(samples) // audio.channels * audio.channels
+    return samples[:usable].reshape(-1, audio.channels)
+
+
+def frame_energies(samples):
+    """
+    Summan av kvadrerade sampel per ram (över alla kanaler), som int64.
+
+    Args:
+        samples: Array med form (ramar, kanaler) eller (ramar,)
+    """
+    squared = samples.astype(np.int64) ** 2
+    return squared.sum(axis=1) if squared.ndim == 2 else squared
+
+
+def _silence_threshold(silence_thresh, sample_width):
+    """Omvandlar en dBFS-tröskel till en amplitud, som pydub gör."""
+    return (10 ** (silence_thresh / 20.0)) * (2 ** (8 * sample_width - 1))
+
+
+def _window_starts(last_start, step):
+    """Fönstrens startpositioner, inklusive ett sista fönster som slutar i änden."""
+    starts = np.arange(0, last_start + 1, step)
+    if last_start % step:
+        starts = np.append(starts, last_start)
+    return starts
+
+
+def _group_silence(silent_starts, seek_step, min_silence_len, total_ms):
+    """
+    Grupperar starttider för tysta fönster till icke-tysta intervall.
+
+    Två på varandra följande tysta fönster tillhör samma tysta intervall
+    om de ligger ett steg isär eller överlappar, på samma sätt som i
+    pydub.silence.detect_silence.
+    """
+    if len(silent_starts) == 0:
+        return [[0, total_ms]]
+
+    gaps = np.diff(silent_starts)
+    breaks = np.nonzero((gaps != seek_step) & (gaps > min_silence_len))[0]
+    range_starts = np.concatenate(([silent_starts[0]], silent_starts[breaks + 1]))
+    range_ends = np.concatenate((silent_starts[breaks], [silent_starts[-1]])) + min_silence_len
+
+    if range_starts[0] == 0 and range_ends[0] >= total_ms:
+        return []
+
+    nonsilent = []
+    previous_end = 0
+    for start, end in zip(range_starts.tolist(), range_ends.tolist()):
+        if start > previous_end:
+            nonsilent.append([previous_end, start])
+        previous_end = end
+    if previous_end < total_ms:
+        nonsilent.append([previous_end, total_ms])
+    return nonsilent
+
+
+def audio_frame_energies(audio, frame_ms=100):
+    """
+    Kvadratsummor per ram om frame_ms millisekunder för ett AudioSegment.
+
+    Returns:
+        tuple: (energier per ram, antal sampel per hel ram över alla kanaler)
+    """
+    samples = audio_to_array(audio)
+    frame_len = max(audio.frame_rate * frame_ms // 1000, 1)
+    num_frames = len(samples)
+    points = np.append(np.arange(0, num_frames, frame_len), num_frames)
+    if len(points) < 2:
+        return np.zeros(0, dtype=np.int64), frame_len * audio.channels
+    return segment_energies(samples.reshape(-1), points * audio.channels), frame_len * audio.channels
+
+
+def frame_levels(frame_energies, frame_len, sample_width=2):
+    """RMS-nivå i dBFS per ram, med digital tystnad som _DIGITAL_SILENCE_DBFS."""
+    rms = np.sqrt(np.asarray(frame_energies, dtype=np.float64) / frame_len)
+    full_scale = 2 ** (8 * sample_width - 1)
+    with np.errstate(divide='ignore'):
+        levels = 20 * np.log10(rms / full_scale)
+    return np.maximum(levels, _DIGITAL_SILENCE_DBFS)
+
+
+def adaptive_silence_settings(frame_energies, frame_len, sample_width=2):
+    """
+    Härleder tystnadströskel och minsta tystnadslängd från inspelningens brusgolv.
+
+    Den sista ramen är ofta kortare än de övriga och räknas inte med.
+
+    Args:
+        frame_energies: Kvadratsummor per ram
+        frame_len: Antal sampel per ram (över alla kanaler)
+        sample_width: Sampelbredd i bytes
+
+    Returns:
+        dict: silence_thresh och min_silence_len för detect_nonsilent samt
+            de skattade nivåerna noise_floor och speech_level i dBFS
+    """
+    energies = np.asarray(frame_energies)
+    if len(energies) > 1:
+        energies = energies[:-1]
+
+    noise_floor = speech_level = _DIGITAL_SILENCE_DBFS
+    if len(energies):
+        levels = frame_levels(energies, frame_len, sample_width)
+        noise_floor, speech_level = np.percentile(levels, [NOISE_FLOOR_PERCENTILE, SPEECH_LEVEL_PERCENTILE])
+    snr = speech_level - noise_floor
+
+    if snr < MIN_SNR_DB:
+        thresh = DEFAULT_SILENCE_THRESH
+        min_silence_len = NOISY_MIN_SILENCE_LEN
+    else:
+        thresh = noise_floor + min(THRESHOLD_MARGIN_DB, snr / 2)
+        thresh = float(np.clip(thresh, MIN_SILENCE_THRESH, MAX_SILENCE_THRESH))
+        min_silence_len = CLEAN_MIN_SILENCE_LEN if snr >= CLEAN_SNR_DB else NOISY_MIN_SILENCE_LEN
+
+    return {
+        'silence_thresh': round(thresh, 1),
+        'min_silence_len': min_silence_len,
+        'noise_floor': round(float(noise_floor), 1),
+        'speech_level': round(float(speech_level), 1),
+    }
+
+
+def detect_nonsilent(audio, min_silence_len=1000, silence_thresh=-16, seek_step=1):
+    """
+    Vektoriserad motsvarighet till pydub.silence.detect_nonsilent.
+
+    Args:
+        audio: AudioSegment att analysera
+        min_silence_len: Minsta längd på tystnad i millisekunder
+        silence_thresh: Tröskel i dBFS under vilken ljudet räknas som tyst
+        seek_step: Steglängd mellan analysfönster i millisekunder
+
+    Returns:
+        list: [start, slut] i millisekunder för varje icke-tyst intervall
+    """
+    samples = audio_to_array(audio)
+    return detect_nonsilent_samples(
+        samples, audio.frame_rate, audio.sample_width, len(audio),
+        min_silence_len=min_silence_len,
+        silence_thresh=silence_thresh,
+        seek_step=seek_step
+    )
+
+
+def segment_energies(flat, points, chunk=1 << 21):
+    """
+    Kvadratsumman av flat[points[i]:points[i + 1]] för sorterade, unika punkter.
+
+    Sampeldatan kvadreras i bitar om högst chunk sampel åt gången, så att
+    ingen kopia av hela ljudet skapas. 8- och 16-bitars sampel summeras
+    exakt i heltal, 32-bitars sampel i flyttal som i audioop.
+    """
+    work_dtype, sum_dtype = (np.int32, np.int64) if flat.itemsize <= 2 else (np.float64, np.float64)
+    energies = np.empty(len(points) - 1, dtype=sum_dtype)
+    i = 0
+    while i < len(points) - 1:
+        j = max(i + 1, int(np.searchsorted(points, points[i] + chunk, side='right')) - 1)
+        span = flat[points[i]:points[j]].astype(work_dtype)
+        span *= span
+        energies[i:j] = np.add.reduceat(span, points[i:j] - points[i], dtype=sum_dtype)
+        i = j
+    return energies
+
+
+def detect_nonsilent_samples(samples, frame_rate, sample_width, total_ms,
+                             min_silence_len=1000, silence_thresh=-16, seek_step=1):
+    """
+    Hittar icke-tysta intervall i en (ramar, kanaler)-array med sampel.
+
+    Fönstergränser räknas om från millisekunder till ramar på samma sätt
+    som vid slicing av ett AudioSegment, så resultatet blir identiskt med
+    pydub även när antalet sampel per millisekund inte är ett heltal.
+    """
+    if total_ms < min_silence_len:
+        return [[0, total_ms]]
+
+    num_frames, channels = samples.shape if samples.ndim == 2 else (len(samples), 1)
+    flat = samples.reshape(-1)
+
+    starts_ms = _window_starts(total_ms - min_silence_len, seek_step)
+    first = (starts_ms * frame_rate / 1000.0).astype(np.int64)
+    last = ((starts_ms + min_silence_len) * frame_rate / 1000.0).astype(np.int64)
+
+    # Energin beräknas en gång per delsträcka mellan fönstergränser och
+    # fönstersummorna tas sedan ur den kumulativa summan av delsträckorna.
+    # Fönster som når förbi slutet fylls ut med tystnad, som i pydub.
+    points = np.unique(np.concatenate(([0, num_frames], np.minimum(first, num_frames),
+                                       np.minimum(last, num_frames))))
+    cumulative = np.zeros(len(points), dtype=np.float64 if flat.itemsize > 2 else np.int64)
+    if len(points) > 1:
+        np.cumsum(segment_energies(flat, points * channels), out=cumulative[1:])
+
+    window_sums = (cumulative[np.searchsorted(points, np.minimum(last, num_frames))]
+                   - cumulative[np.searchsorted(points, np.minimum(first, num_frames))])
+    counts = np.maximum((last - first) * channels, 1)
+    rms = np.floor(np.sqrt(window_sums / counts))
+
+    silent_starts = starts_ms[rms <= _silence_threshold(silence_thresh, sample_width)]
+    return _group_silence(silent_starts, seek_step, min_silence_len, total_ms)
+
+
+def detect_nonsilent_frames(frame_energies, frame_len, total_samples, sample_rate,
+                            silence_thresh=-45, min_silence_len=1000, seek_step=100,
+                            sample_width=2):
+    """
+    Hittar icke-tysta intervall utifrån förberäknade ramenergier.
+
+    Används av den strömmande avkodningen, där endast energin per ram
+    sparas. Ramlängden måste dela både min_silence_len och seek_step.
+
+    Returns:
+        list: [start, slut] i millisekunder för varje icke-tyst intervall
+    """
+    frame_ms = frame_len * 1000 // sample_rate
+    if min_silence_len % frame_ms or seek_step % frame_ms:
+        raise ValueError("Ramlängden måste dela min_silence_len och seek_step")
+
+    total_ms = int(round(total_samples * 1000 / sample_rate))
+    window = min_silence_len // frame_ms
+    if len(frame_energies) < window:
+        return [[0, total_ms]] if total_ms else []
+
+    cumulative = np.zeros(len(frame_energies) + 1, dtype=np.int64)
+    np.cumsum(frame_energies, out=cumulative[1:])
+    starts = _window_starts(len(frame_energies) - window, seek_step // frame_ms)
+    rms = np.floor(np.sqrt((cumulative[starts + window] - cumulative[starts]) / float(window * frame_len)))
+
+    silent_starts = starts[rms <= _silence_threshold(silence_thresh, sample_width)] * frame_ms
+    return _group_silence(silent_starts, seek_step, min_silence_len, total_ms)
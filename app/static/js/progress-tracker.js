@@ -369,6 +369,20 @@ class ProgressTracker {
         }
     }
     
+    /**
+     * Visa hur stor del av filen som har laddats upp
+     * @param {number} sent - Antal uppladdade bytes
+     * @param {number} total - Filens storlek i bytes
+     */
+    showUploadProgress(sent, total) {
+        const percent = total > 0 ? Math.round(sent / total * 100) : 0;
+        this.progressBar.style.width = `${percent}%`;
+        this.progressBar.setAttribute('aria-valuenow', percent);
+        this.progressBar.textContent = `${percent}%`;
+        this.statusMessage.textContent = `Laddar upp: ${this.formatFileSize(sent)} av ${this.formatFileSize(total)}`;
+        this.timeEstimate.textContent = '';
+    }
+    
     /**
      * Formatera filstorlek (bytes) till ett läsbart format
      * @param {number} bytes - Filstorlek i bytes
@@ -474,10 +488,285 @@ class ProgressTracker {
     }
 }
 
+/**
+ * Återupptagbar uppladdning i delar
+ *
+ * Filen skickas som numrerade delar till /api/uploads. Om anslutningen
+ * bryts försöker varje del igen med ökande väntetid, och om sidan laddas om
+ * återupptas samma uppladdning: servern svarar med vilka delar den redan
+ * har, så bara resten skickas.
+ */
+class ChunkedUploader {
+    /**
+     * @param {File|Blob} file - Fil som ska laddas upp
+     * @param {Object} options - title, filename, csrfToken och onProgress(sentBytes, totalBytes)
+     */
+    constructor(file, options = {}) {
+        this.file = file;
+        this.filename = options.filename || file.name;
+        this.title = options.title || '';
+        this.csrfToken = options.csrfToken || '';
+        this.onProgress = options.onProgress || (() => {});
+        this.maxRetries = options.maxRetries || 6;
+        this.storageKey = `chunked-upload:${this.filename}:${file.size}:${file.lastModified || ''}`;
+    }
+
+    /**
+     * Ladda upp filen och starta transkriberingen
+     * @returns {Promise<Object>} Svaret från finalize (task_id och redirect)
+     */
+    async upload() {
+        let session = await this.resumeSession();
+        if (!session) {
+            session = await this.request('POST', '/api/uploads', JSON.stringify({
+                filename: this.filename,
+                size: this.file.size,
+                title: this.title
+            }), { 'Content-Type': 'application/json' });
+            this.saveUploadId(session.upload_id);
+        }
+
+        const received = new Set(session.received || []);
+        let sent = 0;
+        for (const index of received) {
+            sent += this.chunkBounds(session, index)[1] - this.chunkBounds(session, index)[0];
+        }
+        this.onProgress(sent, this.file.size);
+
+        for (let index = 0; index < session.total_chunks; index++) {
+            if (received.has(index)) {
+                continue;
+            }
+            const [start, end] = this.chunkBounds(session, index);
+            const chunk = this.file.slice(start, end);
+            const headers = { 'Content-Type': 'application/octet-stream' };
+            const checksum = await this.sha256(chunk);
+            if (checksum) {
+                headers['X-Chunk-SHA256'] = checksum;
+            }
+            await this.request('PUT', `/api/uploads/${session.upload_id}/chunks/${index}`, chunk, headers);
+            sent += end - start;
+            this.onProgress(sent, this.file.size);
+        }
+
+        const result = await this.request('POST', `/api/uploads/${session.upload_id}/finalize`, JSON.stringify({
+            sha256: await this.sha256(this.file)
+        }), { 'Content-Type': 'application/json' });
+        this.saveUploadId(null);
+        return result;
+    }
+
+    /**
+     * Hämta en tidigare påbörjad uppladdning av samma fil, om servern har kvar den
+     */
+    async resumeSession() {
+        const uploadId = localStorage.getItem(this.storageKey);
+        if (!uploadId) {
+            return null;
+        }
+        try {
+            const session = await this.request('GET', `/api/uploads/${uploadId}`, null, {}, 1);
+            console.log(`Återupptar uppladdning ${uploadId} (${session.received.length}/${session.total_chunks} delar)`);
+            return session;
+        } catch (e) {
+            this.saveUploadId(null);
+            return null;
+        }
+    }
+
+    saveUploadId(uploadId) {
+        try {
+            if (uploadId) {
+                localStorage.setItem(this.storageKey, uploadId);
+            } else {
+                localStorage.removeItem(this.storageKey);
+            }
+        } catch (e) {
+            // localStorage kan vara avstängt, uppladdningen fungerar ändå
+        }
+    }
+
+    chunkBounds(session, index) {
+        const start = index * session.chunk_size;
+        return [start, Math.min(start + session.chunk_size, this.file.size)];
+    }
+
+    /**
+     * SHA-256 som hex, eller null om Web Crypto saknas (t.ex. utan HTTPS)
+     */
+    async sha256(blob) {
+        if (!window.crypto || !window.crypto.subtle) {
+            return null;
+        }
+        const digest = await window.crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+        return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+    }
+
+    request(method, url, body, headers = {}, attempts = this.maxRetries) {
+        return requestWithRetry(method, url, body, headers, this.csrfToken, attempts);
+    }
+}
+
+/**
+ * Skicka en förfrågan och försök igen vid nätverksfel och serverfel
+ * @returns {Promise<Object>} Svarets JSON
+ */
+async function requestWithRetry(method, url, body, headers = {}, csrfToken = '', attempts = 6) {
+    let lastError;
+    for (let attempt = 0; attempt < attempts; attempt++) {
+        if (attempt > 0) {
+            await new Promise(resolve => setTimeout(resolve, Math.min(1000 * 2 ** attempt, 30000)));
+        }
+        try {
+            const response = await fetch(url, {
+                method: method,
+                body: body,
+                headers: Object.assign({ 'X-CSRFToken': csrfToken }, headers),
+                credentials: 'same-origin'
+            });
+            const data = await response.json().catch(() => ({}));
+            if (response.ok) {
+                return data;
+            }
+            lastError = new Error(data.error || `HTTP ${response.status}`);
+            if (response.status < 500) {
+                throw lastError;
+            }
+        } catch (e) {
+            if (lastError === e) {
+                throw e;
+            }
+            lastError = e;
+            console.warn(`${method} ${url} misslyckades (försök ${attempt + 1}/${attempts}):`, e);
+        }
+    }
+    throw lastError;
+}
+
+/**
+ * Löpande transkribering under inspelning.
+ *
+ * MediaRecorder lämnar en skiva var slice_ms, och varje skiva skickas
+ * direkt till servern i tur och ordning, som transkriberar inspelningen
+ * medan den pågår. När inspelningen stoppas återstår bara den sista
+ * skivan och sammanfattningen.
+ */
+class LiveRecording {
+    /**
+     * @param {Object} options - title, csrfToken och onText(text)
+     */
+    constructor(options = {}) {
+        this.title = options.title || '';
+        this.csrfToken = options.csrfToken || '';
+        this.onText = options.onText || (() => {});
+        this.sliceMs = 10000;
+        this.nextIndex = 0;
+        this.failed = null;
+        this.session = null;
+        this.queue = Promise.resolve();
+        this.pollInterval = null;
+    }
+
+    /**
+     * Skapa sessionen på servern
+     * @returns {Promise<LiveRecording>}
+     */
+    async start() {
+        this.session = await requestWithRetry('POST', '/api/live', JSON.stringify({ title: this.title }),
+            { 'Content-Type': 'application/json' }, this.csrfToken, 3);
+        this.sliceMs = this.session.slice_ms;
+        this.pollInterval = setInterval(() => this.poll(), this.sliceMs);
+        return this;
+    }
+
+    /**
+     * Köa en skiva från MediaRecorder; skivorna skickas en i taget, i ordning
+     */
+    addSlice(blob) {
+        const index = this.nextIndex++;
+        this.queue = this.queue.then(() => {
+            if (this.failed) {
+                return;
+            }
+            return requestWithRetry('PUT', `/api/live/${this.session.session_id}/slices/${index}`, blob,
+                { 'Content-Type': 'application/octet-stream' }, this.csrfToken)
+                .catch(error => {
+                    console.error(`Skiva ${index} kunde inte skickas:`, error);
+                    this.failed = error;
+                });
+        });
+    }
+
+    async poll() {
+        try {
+            const status = await requestWithRetry('GET', `/api/live/${this.session.session_id}`, null, {},
+                this.csrfToken, 1);
+            this.onText(status.text);
+        } catch (e) {
+            // Nästa förfrågan försöker igen
+        }
+    }
+
+    /**
+     * Vänta på de sista skivorna och starta sammanfattningen
+     * @returns {Promise<Object>} Svaret från finish (task_id och redirect)
+     */
+    async finish(title) {
+        clearInterval(this.pollInterval);
+        await this.queue;
+        if (this.failed) {
+            throw this.failed;
+        }
+        return requestWithRetry('POST', `/api/live/${this.session.session_id}/finish`,
+            JSON.stringify({ title: title || this.title }), { 'Content-Type': 'application/json' }, this.csrfToken);
+    }
+
+    /**
+     * Avbryt inspelningen och ta bort den på servern
+     */
+    discard() {
+        clearInterval(this.pollInterval);
+        if (this.session) {
+            requestWithRetry('DELETE', `/api/live/${this.session.session_id}`, null, {}, this.csrfToken, 1)
+                .catch(() => {});
+        }
+    }
+}
+
+/**
+ * Ladda upp en fil i delar och följ sedan transkriberingen
+ * @param {ProgressTracker} tracker - Progress-tracker som visar uppladdningen
+ * @param {File|Blob} file - Fil som ska laddas upp
+ * @param {Object} options - title och filename
+ */
+function uploadInChunks(tracker, file, options = {}) {
+    const csrfInput = document.querySelector('input[name="csrf_token"]');
+    const uploader = new ChunkedUploader(file, Object.assign({
+        csrfToken: csrfInput ? csrfInput.value : '',
+        onProgress: (sent, total) => tracker.showUploadProgress(sent, total)
+    }, options));
+
+    return uploader.upload()
+        .then(data => {
+            tracker.start(data.task_id);
+            setTimeout(() => {
+                window.location.href = data.redirect;
+            }, 2000);
+            return data;
+        })
+        .catch(error => {
+            console.error('Fel vid uppladdning:', error);
+            tracker.showError(error.message || 'Uppladdningen misslyckades');
+            throw error;
+        });
+}
+
 // Starta progress-trackers vid DOM-laddning
 document.addEventListener('DOMContentLoaded', function() {
     const uploadProgressTracker = new ProgressTracker('upload-progress');
     const recordProgressTracker = new ProgressTracker('record-progress');
+    window.uploadProgressTracker = uploadProgressTracker;
+    window.recordProgressTracker = recordProgressTracker;
     
     // Eventlistener för uppladdningsformuläret
     const uploadForm = document.querySelector('#upload form');
@@ -491,27 +780,10 @@ document.addEventListener('DOMContentLoaded', function() {
                 uploadProgressTracker.showError('Ingen fil vald');
                 return;
             }
-            const formData = new FormData(this);
-            fetch('/transcribe', {
-                method: 'POST',
-                body: formData,
-                headers: { 'X-Progress-Tracking': 'true' }
-            })
-            .then(response => response.json())
-            .then(data => {
-                if (data.redirect) {
-                    uploadProgressTracker.start(data.task_id);
-                    setTimeout(() => {
-                        window.location.href = data.redirect;
-                    }, 2000);
-                } else if (data.error) {
-                    uploadProgressTracker.showError(data.error);
-                }
-            })
-            .catch(error => {
-                console.error('Fel vid formulärskick:', error);
-                uploadProgressTracker.showError('Ett oväntat fel inträffade');
-            });
+            const titleInput = this.querySelector('input[name="title"]');
+            uploadInChunks(uploadProgressTracker, fileInput.files[0], {
+                title: titleInput ? titleInput.value : ''
+            }).catch(() => {});
         });
     }
     
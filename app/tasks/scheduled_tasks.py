@@ -2,9 +2,6 @@
 Scheduled tasks using Celery beat.
 """
 import logging
-import os
-import tempfile
-from datetime import datetime, timedelta
 
 # Import celery instance
 try:
@@ -19,25 +16,45 @@ logger = logging.getLogger(__name__)
 @celery.task(name='app.tasks.cleanup_old_temp_files')
 def cleanup_old_temp_files():
     """
-    En mer aggressiv rensning av temporära filer och celery-statusar
+    Rensar övergivna spooljobb, uppladdningar och inspelningar, gamla cachade
+    sammanfattningar samt celery-statusar
     """
-    # Nuvarande filrensningskod, men gör den mer omfattande
-    temp_dir = tempfile.gettempdir()
-    max_age = timedelta(hours=1)  # Ändra till kortare tid för mer aggressiv rensning
-    now = datetime.now()
+    # Endast spoolroten läses, en post per jobb, så andra programs
+    # temporära filer lämnas orörda
+    try:
+        from app.services.spool import purge_stale_jobs, spool_usage
+        purge_stale_jobs()
+        usage = spool_usage()
+        logger.info(f"Spool: {usage['jobs']} jobb, {usage['bytes'] / (1024 * 1024):.1f} MB")
+    except Exception as e:
+        logger.warning(f"Could not purge stale spool jobs: {str(e)}")
+    
+    # Rensa avbrutna uppladdningar i delar som inte har återupptagits
+    try:
+        from app.services.chunked_upload import purge_stale_sessions
+        purge_stale_sessions()
+    except Exception as e:
+        logger.warning(f"Could not purge stale uploads: {str(e)}")
+    
+    # Rensa inspelningar som aldrig avslutades
+    try:
+        from app.services.live_transcription import purge_stale_sessions as purge_stale_recordings
+        purge_stale_recordings()
+    except Exception as e:
+        logger.warning(f"Could not purge stale live recordings: {str(e)}")
     
-    # Rensa ALLA temporära filer äldre än max_age för att fånga upp alla former av temporära filer
-    for root, dirs, files in os.walk(temp_dir):
-        for filename in files:
-            file_path = os.path.join(root, filename)
-            try:
-                stats = os.stat(file_path)
-                last_modified = datetime.fromtimestamp(stats.st_mtime)
-                if now - last_modified > max_age:
-                    os.remove(file_path)
-                    logger.info(f"Removed old temp file: {file_path}")
-            except Exception as e:
-                logger.warning(f"Could not process file {file_path}: {str(e)}")
+    # Rensa sammanfattningar som inte använts på länge eller hör till en äldre prompt
+    try:
+        from app.services.summary_cache import purge_stale_entries, cache_stats
+        from app.services.summary_service import prompt_fingerprint
+        purge_stale_entries(prompt_fingerprint())
+        stats = cache_stats()
+        logger.info(
+            f"Sammanfattningscache: {stats['entries']} poster, träffgrad {stats['hit_rate']:.0%} "
+            f"({stats['hits']} träffar, {stats['misses']} missar)"
+        )
+    except Exception as e:
+        logger.warning(f"Could not purge summary cache: {str(e)}")
     
     # Rensa Redis-uppgifter
     try:
@@ -57,6 +74,36 @@ def cleanup_old_temp_files():
     except Exception as e:
         logger.error(f"Error during Redis cleanup: {str(e)}")
 
+@celery.task(name='app.tasks.submit_summary_batches')
+def submit_summary_batches():
+    """
+    Skickar köade sammanfattningar till batch-API:t
+    """
+    try:
+        from app.services.summary_batch import submit_pending
+        return {'status': 'ok', 'batch_id': submit_pending()}
+    except Exception as e:
+        logger.error(f"Could not submit summary batch: {str(e)}", exc_info=True)
+        return {'status': 'error', 'error': str(e)}
+
+@celery.task(name='app.tasks.poll_summary_batches')
+def poll_summary_batches():
+    """
+    Skriver sammanfattningar från färdiga batcher till transkriptionerna
+    """
+    try:
+        from app.services.summary_batch import poll_batches, queue_stats
+        completed = poll_batches()
+        stats = queue_stats()
+        logger.info(
+            f"Batchsammanfattningar: {completed} klara nu, {stats['pending']} i kö, "
+            f"{stats['submitted']} skickade, {stats['failed']} misslyckade"
+        )
+        return {'status': 'ok', 'completed': completed}
+    except Exception as e:
+        logger.error(f"Could not poll summary batches: {str(e)}", exc_info=True)
+        return {'status': 'error', 'error': str(e)}
+
 # Set up periodic tasks
 @celery.on_after_configure.connect
 def setup_periodic_tasks(sender, **kwargs):
@@ -69,4 +116,17 @@ def setup_periodic_tasks(sender, **kwargs):
         86400.0,  # Every 24 hours in seconds
         cleanup_old_temp_files.s(),
         name='cleanup_old_temp_files'
+    )
+    
+    # Skicka köade sammanfattningar och hämta färdiga batcher
+    from app.services.summary_batch import poll_interval
+    sender.add_periodic_task(
+        poll_interval(),
+        submit_summary_batches.s(),
+        name='submit_summary_batches'
+    )
+    sender.add_periodic_task(
+        poll_interval(),
+        poll_summary_batches.s(),
+        name='poll_summary_batches'
     )
\ No newline at end of file
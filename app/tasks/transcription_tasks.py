@@ -4,8 +4,6 @@ Celery tasks for audio transcription and summary generation.
 import os
 import json
 import logging
-import tempfile
-import requests
 import base64
 import gc  # För minneshantering
 from datetime import datetime
@@ -23,7 +21,7 @@ logger = logging.getLogger(__name__)
 
 @celery.task(bind=True, name='app.tasks.process_transcription')
 def process_transcription(self, file_path=None, title=None, user_id=None, temp_file=True, 
-                         encoded_data=None, filename=None):
+                         encoded_data=None, filename=None, content_hash=None, summary_mode=None):
     """
     Process an audio file: process, transcribe, and generate summary.
     
@@ -31,19 +29,30 @@ def process_transcription(self, file_path=None, title=None, user_id=None, temp_f
         file_path (str, optional): Path to the audio file or temp file ID
         title (str): Title for the transcription
         user_id (int): User ID of the owner
-        temp_file (bool): Whether file_path is a temporary file that should be deleted
+        temp_file (bool): Whether file_path is a temporary file that should be deleted,
+            together with its spool job
         encoded_data (str, optional): Base64-encoded audio data
         filename (str, optional): Original filename for base64 data
+        content_hash (str, optional): SHA-256 of the upload, computed here if not given
+        summary_mode (str, optional): 'batch' to defer the summary to the batch API;
+            it is then written to the saved transcription when the batch completes
         
     Returns:
         dict: Result containing transcription ID and status
     """
     temp_file_path = None
+    processed_paths = []
     
     try:
         # Import these inside the task to avoid circular imports
-        from app.services.audio_processor import process_audio
-        from app.services.summary_service import generate_summary
+        from app.services.audio_processor import optimize_for_whisper
+        from app.services.summary_service import generate_summary, is_error_response, prompt_fingerprint
+        from app.services.transcription_service import (
+            WHISPER_MODEL, WHISPER_LANGUAGE, get_api_key, transcribe_audio
+        )
+        from app.utils.progress_tracker import format_size
+        from app.services import audio_cache
+        from app.services.spool import spool_path
         from app.models.transcription import Transcription
         from app import db
         
@@ -51,7 +60,7 @@ def process_transcription(self, file_path=None, title=None, user_id=None, temp_f
         if encoded_data:
             logger.info(f"Starting transcription from base64 data, filename: {filename}")
             # Dekoda base64 till temporär fil
-            temp_file_path = tempfile.NamedTemporaryFile(delete=False, suffix=f".{filename.split('.')[-1]}" if filename else ".mp3").name
+            temp_file_path = spool_path(f".{filename.split('.')[-1]}" if filename else ".mp3")
             with open(temp_file_path, 'wb') as f:
                 f.write(base64.b64decode(encoded_data))
             
@@ -68,52 +77,81 @@ def process_transcription(self, file_path=None, title=None, user_id=None, temp_f
             logger.error(error_msg)
             return {'status': 'error', 'error': error_msg}
         
-        # Get OpenAI API key
-        api_key = os.environ.get('OPENAI_API_KEY')
-        if not api_key:
-            from app.services.transcription_service import get_api_key
-            api_key = get_api_key()
+        # Create title if not provided
+        if not title or title.strip() == '':
+            title = 'Transcription ' + datetime.now().strftime('%Y-%m-%d %H:%M')
+        
+        # Samma inspelning har redan transkriberats: återanvänd text och sammanfattning
+        if not content_hash:
+            content_hash = audio_cache.hash_file(file_path)
+        cache_key = (content_hash, WHISPER_MODEL, WHISPER_LANGUAGE, prompt_fingerprint())
+        cached = audio_cache.lookup(*cache_key)
+        if cached:
+            logger.info(f"Using cached transcription for {content_hash[:12]}")
+            self.update_state(state='SAVING', meta={'status': 'Saving transcription'})
+            
+            new_transcription = Transcription(
+                title=title,
+                user_id=user_id,
+                transcription_text=cached.transcription_text,
+                summary=cached.summary
+            )
+            db.session.add(new_transcription)
+            db.session.commit()
+            logger.info(f"Transcription saved from cache with ID: {new_transcription.id}")
             
+            return {
+                'transcription_id': new_transcription.id,
+                'status': 'completed',
+                'title': title,
+                'cached': True
+            }
+        
+        # Get OpenAI API key
+        api_key = get_api_key()
         if not api_key:
             raise ValueError("OpenAI API key not found")
         
+        # Optimera ljudet (tystnad bort, 16 kHz mono mp3) innan det laddas upp
+        self.update_state(state='PROCESSING_AUDIO', meta={'status': 'Processing audio'})
+        original_size = os.path.getsize(file_path)
+        try:
+            processed_paths = optimize_for_whisper(file_path, split=True)
+            compressed_size = sum(os.path.getsize(path) for path in processed_paths)
+            upload = processed_paths
+        except Exception as e:
+            # Fallback: ladda upp originalfilen om optimeringen misslyckas
+            logger.warning(f"Audio optimization failed, uploading original file: {str(e)}")
+            compressed_size = original_size
+            upload = file_path
+        
+        logger.info(
+            f"Upload size: {format_size(original_size)} -> {format_size(compressed_size)} "
+            f"({(1 - compressed_size / original_size) * 100 if original_size else 0:.1f}% reduction)"
+        )
+        
         # Update state
         self.update_state(state='TRANSCRIBING', meta={'status': 'Transcribing audio'})
         
-        # Transcribe using OpenAI API directly
         try:
-            with open(file_path, 'rb') as f:
-                # Optimera minnesanvändning genom att använda chunked uploads om möjligt
-                transcription_response = requests.post(
-                    'https://api.openai.com/v1/audio/transcriptions',
-                    headers={'Authorization': f'Bearer {api_key}'},
-                    files={'file': f},
-                    data={'model': 'whisper-1', 'language': 'sv'}
-                )
-                
-            if transcription_response.status_code != 200:
-                raise RuntimeError(f"OpenAI API error: {transcription_response.text}")
-                
-            transcription_text = transcription_response.json()['text']
+            transcription_text = transcribe_audio(upload)
             logger.info(f"Transcription completed, length: {len(transcription_text)} characters")
-            
-            # Frigör minne
-            transcription_response = None
-            gc.collect()
-            
         except Exception as e:
             logger.error(f"Error during transcription: {str(e)}")
             raise
         
-        # Generate summary
-        logger.info("Generating summary...")
-        self.update_state(state='GENERATING_SUMMARY', meta={'status': 'Generating summary'})
-        summary_dict = generate_summary(transcription_text)
-        logger.info("Summary generated")
-        
-        # Create title if not provided
-        if not title or title.strip() == '':
-            title = 'Transcription ' + datetime.now().strftime('%Y-%m-%d %H:%M')
+        # Generate summary, unless it is deferred to the batch API once the record exists
+        deferred = summary_mode == 'batch'
+        summary_json = None
+        if not deferred:
+            logger.info("Generating summary...")
+            self.update_state(state='GENERATING_SUMMARY', meta={'status': 'Generating summary'})
+            summary_dict = generate_summary(transcription_text)
+            logger.info("Summary generated")
+            
+            summary_json = json.dumps(summary_dict, ensure_ascii=False)
+            if not is_error_response(summary_dict):
+                audio_cache.store(*cache_key, transcription_text, summary_json)
             
         # Create new transcription record
         logger.info(f"Creating transcription record with title: {title}")
@@ -123,7 +161,9 @@ def process_transcription(self, file_path=None, title=None, user_id=None, temp_f
             title=title,
             user_id=user_id,
             transcription_text=transcription_text,
-            summary=json.dumps(summary_dict, ensure_ascii=False)
+            summary=summary_json,
+            original_size=original_size,
+            compressed_size=compressed_size
         )
         
         # Save to database
@@ -131,10 +171,23 @@ def process_transcription(self, file_path=None, title=None, user_id=None, temp_f
         db.session.commit()
         logger.info(f"Transcription saved with ID: {new_transcription.id}")
         
+        if deferred:
+            # Summary is written back by the batch poller (or right away on a cache hit)
+            summary_dict = generate_summary(transcription_text, defer_to=new_transcription.id)
+            if summary_dict is not None:
+                new_transcription.summary = json.dumps(summary_dict, ensure_ascii=False)
+                db.session.commit()
+            else:
+                logger.info(f"Summary for transcription {new_transcription.id} queued for the batch API")
+        
         return {
             'transcription_id': new_transcription.id,
             'status': 'completed',
-            'title': title
+            'summary_queued': deferred and new_transcription.summary is None,
+            'title': title,
+            'cached': False,
+            'original_size': original_size,
+            'compressed_size': compressed_size
         }
         
     except Exception as e:
@@ -147,17 +200,177 @@ def process_transcription(self, file_path=None, title=None, user_id=None, temp_f
     finally:
         # Alltid rensa upp temporära filer och frig??r minne, även om ett fel inträffade
         try:
-            # Ta bort temporär fil om vi skapade den från base64-data
-            if temp_file_path and os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
+            from app.services.spool import release, discard
+            
+            # Ta bort spooljobbet om vi skapade filen från base64-data
+            if temp_file_path:
+                release(temp_file_path)
                 logger.info(f"Removed temporary file: {temp_file_path}")
                 
-            # Om det är en vanlig filsökväg och den ska tas bort
-            if temp_file and file_path and file_path != temp_file_path and os.path.exists(file_path):
-                os.remove(file_path)
+            # Om det är en vanlig filsökväg och den ska tas bort, tillsammans med dess spooljobb
+            if temp_file and file_path and file_path != temp_file_path:
+                release(file_path)
                 logger.info(f"Removed temporary file: {file_path}")
+            
+            # Ta bort optimerade filer som ligger utanför uppladdningens jobb
+            for processed_path in processed_paths:
+                discard(processed_path)
+            
+            from app.services.openai_client import pool_stats
+            stats = pool_stats()
+            logger.info(
+                f"OpenAI connection pool: {stats['requests']} requests, "
+                f"{stats['new_connections']} new connections, {stats['reused_connections']} reused"
+            )
                 
             # Explicit frigör minne
             gc.collect()
         except Exception as cleanup_error:
-            logger.error(f"Error during cleanup: {cleanup_error}")
\ No newline at end of file
+            logger.error(f"Error during cleanup: {cleanup_error}")
+
+@celery.task(name='app.tasks.transcribe_live_slices')
+def transcribe_live_slices(session_id):
+    """
+    Transcribe what has been recorded in a live session up to the latest pause.
+
+    Queued after every received slice. If another worker is already busy with
+    the session this returns at once; the next slice picks up the rest.
+
+    Args:
+        session_id (str): Live recording session ID
+
+    Returns:
+        dict: Number of new segments transcribed
+    """
+    from app.services import live_transcription
+
+    try:
+        return {'status': 'ok', 'segments': live_transcription.transcribe_pending(session_id)}
+    except LookupError:
+        # Sessionen avslutades eller rensades innan skivan hann behandlas
+        return {'status': 'gone'}
+    except Exception as e:
+        logger.error(f"Error in live transcription of {session_id}: {str(e)}", exc_info=True)
+        return {'status': 'error', 'error': str(e)}
+
+
+def _is_transient(error):
+    """True for OpenAI and database errors that may succeed on a later attempt."""
+    import openai
+    from sqlalchemy.exc import OperationalError
+    from app.services.rate_limiter import is_retryable
+
+    # transcribe_audio wraps OpenAI errors in RuntimeError, so follow the chain
+    while error is not None:
+        if is_retryable(error) or isinstance(error, (openai.APITimeoutError, OperationalError)):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+@celery.task(bind=True, name='app.tasks.finish_live_transcription', max_retries=5, default_retry_delay=30)
+def finish_live_transcription(self, session_id, title=None, user_id=None):
+    """
+    Finish a live recording: transcribe the last segment, summarize and save.
+
+    Transient OpenAI and database errors retry the task. Segments already
+    transcribed are kept in the session, so a retry continues where it stopped.
+
+    Args:
+        session_id (str): Live recording session ID
+        title (str): Title for the transcription
+        user_id (int): User ID of the owner
+
+    Returns:
+        dict: Result containing transcription ID and status
+    """
+    from app.services import live_transcription
+
+    try:
+        from app.services.summary_service import generate_summary
+        from app.models.transcription import Transcription
+        from app import db
+
+        if not title or title.strip() == '':
+            title = 'Transcription ' + datetime.now().strftime('%Y-%m-%d %H:%M')
+
+        self.update_state(state='TRANSCRIBING', meta={'status': 'Transcribing audio'})
+        live_transcription.transcribe_pending(session_id, final=True)
+        meta = live_transcription.load_session(session_id, user_id)
+        transcription_text = live_transcription.transcript(session_id)
+        logger.info(f"Live transcription completed, length: {len(transcription_text)} characters")
+
+        self.update_state(state='GENERATING_SUMMARY', meta={'status': 'Generating summary'})
+        summary_dict = generate_summary(transcription_text)
+
+        self.update_state(state='SAVING', meta={'status': 'Saving transcription'})
+        new_transcription = Transcription(
+            title=title,
+            user_id=user_id,
+            transcription_text=transcription_text,
+            summary=json.dumps(summary_dict, ensure_ascii=False),
+            original_size=meta['recorded_bytes'],
+            compressed_size=meta['uploaded_bytes']
+        )
+        db.session.add(new_transcription)
+        db.session.commit()
+        logger.info(f"Live transcription saved with ID: {new_transcription.id}")
+
+        # Inspelningen tas bort först när transkriptionen är sparad; misslyckade
+        # sessioner ligger kvar tills purge_stale_sessions rensar dem
+        live_transcription.discard(session_id)
+
+        return {
+            'transcription_id': new_transcription.id,
+            'status': 'completed',
+            'title': title,
+            'cached': False,
+            'original_size': meta['recorded_bytes'],
+            'compressed_size': meta['uploaded_bytes']
+        }
+
+    except Exception as e:
+        if _is_transient(e) and self.request.retries < self.max_retries:
+            from app import db
+            db.session.rollback()
+            logger.warning(f"Temporary error in live transcription task, retrying: {str(e)}")
+            raise self.retry(exc=e, countdown=self.default_retry_delay * 2 ** self.request.retries)
+        logger.error(f"Error in live transcription task: {str(e)}", exc_info=True)
+        return {
+            'status': 'error',
+            'error': str(e),
+            'session_id': session_id
+        }
+
+
+@celery.task(name='app.tasks.transcribe_files')
+def transcribe_files(paths, max_in_flight=None):
+    """
+    Transcribe several audio files with many Whisper requests in flight at once.
+
+    The requests run as coroutines in one event loop in this worker, instead
+    of one worker process per outstanding HTTP call.
+
+    Args:
+        paths (list): Paths to audio files, already optimized for Whisper
+        max_in_flight (int, optional): Concurrent requests (default WHISPER_MAX_CONCURRENCY)
+
+    Returns:
+        dict: Texts in the same order as paths
+    """
+    from app.services.async_transcription import run_transcriptions
+    from app.services.transcription_service import (
+        WHISPER_MODEL, WHISPER_LANGUAGE, get_api_key, max_concurrency
+    )
+
+    try:
+        api_key = get_api_key()
+        if not api_key:
+            raise ValueError("OpenAI API key not found")
+        texts = run_transcriptions(
+            paths, api_key, WHISPER_MODEL, WHISPER_LANGUAGE, max_in_flight or max_concurrency()
+        )
+        return {'status': 'completed', 'texts': texts}
+    except Exception as e:
+        logger.error(f"Error transcribing {len(paths)} files: {str(e)}", exc_info=True)
+        return {'status': 'error', 'error': str(e)}
@@ -0,0 +1,44 @@
+"""
+Throughput of the downmix / low-pass / resample stage.
+
+Compares pydub's low_pass_filter + set_channels + set_frame_rate chain with
+app.services.audio_dsp.to_whisper_format and reports seconds of audio
+processed per CPU-second.
+
+Usage:
+    python -m benchmarks.bench_dsp [--minutes 2] [--rates 44100 48000 16000]
+"""
+import argparse
+import time
+from pydub.effects import low_pass_filter
+from app.services.audio_dsp import to_whisper_format
+from benchmarks.fixtures import synthetic_consultation
+
+
+def pydub_chain(audio):
+    return low_pass_filter(audio, 4000).set_channels(1).set_frame_rate(16000)
+
+
+def throughput(func, audio):
+    start = time.process_time()
+    func(audio)
+    return (len(audio) / 1000) / (time.process_time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--minutes', type=float, default=2)
+    parser.add_argument('--rates', type=int, nargs='+', default=[44100, 48000, 16000])
+    parser.add_argument('--channels', type=int, default=2)
+    args = parser.parse_args()
+
+    print(f"{'rate':>6} {'ch':>3} {'pydub audio-s/cpu-s':>20} {'numpy audio-s/cpu-s':>20} {'speedup':>8}")
+    for rate in args.rates:
+        audio = synthetic_consultation(args.minutes, rate, args.channels)
+        before = throughput(pydub_chain, audio)
+        after = throughput(to_whisper_format, audio)
+        print(f"{rate:>6} {args.channels:>3} {before:>20.1f} {after:>20.1f} {after / before:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
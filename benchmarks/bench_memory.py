@@ -0,0 +1,81 @@
+"""
+Peak RSS of one job through process_audio and transcribe_audio.
+
+Writes a synthetic WAV upload to disk, then runs the upload -> process_audio
+-> transcribe_audio hand-off in a fresh interpreter per measurement. The
+OpenAI client is replaced by a stub that reads the file it is given in
+64 KiB pieces, the way the HTTP client streams a multipart upload. Reports
+peak RSS (VmHWM, Linux only) above the interpreter's RSS after imports.
+
+Usage:
+    python -m benchmarks.bench_memory [--minutes 10] [--rate 44100] [--channels 2]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from benchmarks.fixtures import synthetic_consultation
+
+_CHILD = r'''
+import sys
+from types import SimpleNamespace
+from app.services import transcription_service
+from app.services.audio_processor import process_audio
+
+def create(model, file, language):
+    while file.read(64 * 1024):
+        pass
+    return SimpleNamespace(text="")
+
+client = SimpleNamespace(audio=SimpleNamespace(transcriptions=SimpleNamespace(create=create)))
+transcription_service.openai.OpenAI = lambda api_key: client
+transcription_service.get_api_key = lambda: "benchmark"
+
+def peak_rss_kb():
+    # VmHWM belongs to this process image; ru_maxrss would include the parent's peak
+    with open("/proc/self/status") as status:
+        return next(int(line.split()[1]) for line in status if line.startswith("VmHWM:"))
+
+baseline = peak_rss_kb()
+
+with open(sys.argv[1], "rb") as upload:
+    processed, error = process_audio(upload)
+transcription_service.transcribe_audio(processed)
+if hasattr(processed, "cleanup"):
+    processed.cleanup()
+
+print(baseline, peak_rss_kb())
+'''
+
+
+def measure(upload_path, streaming_threshold_mb):
+    env = dict(os.environ, AUDIO_STREAMING_THRESHOLD_MB=str(streaming_threshold_mb))
+    output = subprocess.run([sys.executable, '-c', _CHILD, upload_path], env=env,
+                            capture_output=True, text=True, check=True).stdout.split()
+    baseline, peak = int(output[-2]), int(output[-1])
+    return (peak - baseline) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--minutes', type=float, default=10)
+    parser.add_argument('--rate', type=int, default=44100)
+    parser.add_argument('--channels', type=int, default=2)
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as f:
+        upload_path = f.name
+    try:
+        synthetic_consultation(args.minutes, args.rate, args.channels).export(upload_path, format='wav')
+        upload_mb = os.path.getsize(upload_path) / (1024 * 1024)
+        print(f"upload: {upload_mb:.1f} MB WAV ({args.minutes:g} min, {args.rate} Hz, {args.channels} ch)")
+        print(f"{'decode path':>12} {'peak RSS above baseline (MB)':>30}")
+        for label, threshold in (('in-memory', 1e9), ('streaming', 0)):
+            print(f"{label:>12} {measure(upload_path, threshold):>30.1f}")
+    finally:
+        os.remove(upload_path)
+
+
+if __name__ == '__main__':
+    main()
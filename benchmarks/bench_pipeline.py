@@ -0,0 +1,256 @@
+"""
+Stage timings and peak RSS for the optimize_for_whisper pipeline.
+
+Generates deterministic synthetic consultations (benchmarks.fixtures) as WAV
+files and runs each through the in-memory and the streaming pipeline, one
+fresh interpreter per case. The in-memory pipeline is timed as decode, vad,
+filter, assembly and export; the streaming pipeline as decode (ffmpeg pipe
+and spooling), vad and export. Each output codec is run as its own case, so
+encode time and output size can be compared between mp3 and Opus. Results
+can be saved as a JSON baseline and later runs compared against it; a slower
+stage or a higher peak RSS beyond the tolerances exits with status 1.
+
+Usage:
+    python -m benchmarks.bench_pipeline [--profile quick|full] [--repeat 3]
+        [--codecs mp3 opus] [--save benchmarks/baseline.json]
+        [--compare benchmarks/baseline.json]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+# (minutes, sample rate, channels) per profile
+PROFILES = {
+    'quick': [(1, 16000, 1), (1, 44100, 2), (5, 8000, 1), (5, 48000, 2)],
+    'full': [(1, 8000, 1), (10, 16000, 1), (10, 44100, 2), (30, 48000, 2), (60, 22050, 1), (90, 16000, 1)],
+}
+PIPELINES = ('memory', 'streaming')
+CODECS = ('mp3', 'opus')
+
+# Differences smaller than these are treated as noise
+MIN_TIME_DELTA_S = 0.02
+MIN_RSS_DELTA_MB = 5.0
+
+
+def case_key(pipeline, codec, minutes, sample_rate, channels):
+    return f"{pipeline}-{codec}-{minutes:g}min-{sample_rate}hz-{channels}ch"
+
+
+def peak_rss_kb():
+    """VmHWM of this process image (Linux); ru_maxrss would include the parent's peak."""
+    with open('/proc/self/status') as status:
+        return next(int(line.split()[1]) for line in status if line.startswith('VmHWM:'))
+
+
+def _timed(stages, name, func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    stages[name] = time.perf_counter() - start
+    return result
+
+
+def run_memory_pipeline(input_path, output_path, codec):
+    """The stages of optimize_for_whisper's in-memory path."""
+    from app.services.audio_decoder import load_wav, encoder_options, ENCODERS
+    from app.services.audio_dsp import assemble_segments, to_whisper_format
+    from app.services.export_planner import plan_export, OUTPUT_EXTENSIONS
+    from app.services.vad import detect_nonsilent, audio_frame_energies, adaptive_silence_settings
+
+    def vad(audio):
+        settings = adaptive_silence_settings(*audio_frame_energies(audio), audio.sample_width)
+        return detect_nonsilent(audio, silence_thresh=settings['silence_thresh'],
+                                min_silence_len=settings['min_silence_len'], seek_step=100)
+
+    stages = {}
+    audio = _timed(stages, 'decode', load_wav, input_path)
+    ranges = _timed(stages, 'vad', vad, audio)
+    whisper_audio = _timed(stages, 'filter', to_whisper_format, audio, target_rate=16000, cutoff_hz=4000)
+    processed, _ = _timed(stages, 'assembly', assemble_segments, whisper_audio, ranges or [[0, len(audio)]],
+                          gap_ms=100, pad_ms=300 if ranges else 0)
+
+    def export():
+        plan = plan_export(len(processed) / 1000, codec=codec)
+        processed.export(output_path, format=OUTPUT_EXTENSIONS[codec][1:], codec=ENCODERS[codec],
+                         bitrate=plan['bitrate'], parameters=['-ar', str(plan['sample_rate'])] + encoder_options(codec))
+
+    _timed(stages, 'export', export)
+    return stages
+
+
+def run_streaming_pipeline(input_path, output_path, codec):
+    """The stages of optimize_for_whisper's streaming path."""
+    from app.services.audio_decoder import spool_pcm, encode_ranges, frame_length, DEFAULT_SAMPLE_RATE
+    from app.services.export_planner import plan_export
+    from app.services.vad import detect_nonsilent_frames, adaptive_silence_settings
+
+    def vad(energies, frame_len, total_samples, sample_rate):
+        settings = adaptive_silence_settings(energies, frame_len)
+        return detect_nonsilent_frames(energies, frame_len, total_samples, sample_rate,
+                                       silence_thresh=settings['silence_thresh'],
+                                       min_silence_len=settings['min_silence_len'], seek_step=100)
+
+    stages = {}
+    sample_rate = DEFAULT_SAMPLE_RATE
+    frame_len = frame_length(sample_rate)
+    with tempfile.TemporaryFile() as spool:
+        energies, total_samples = _timed(stages, 'decode', spool_pcm, input_path, spool,
+                                         sample_rate=sample_rate, frame_ms=frame_len * 1000 // sample_rate)
+        ranges = _timed(stages, 'vad', vad, energies, frame_len, total_samples, sample_rate)
+
+        def export():
+            kept_ms = sum(end - start for start, end in ranges) + 100 * (len(ranges) - 1) + 600
+            plan = plan_export(kept_ms / 1000, codec=codec)
+            encode_ranges(spool, ranges, output_path, sample_rate=sample_rate,
+                          output_rate=plan['sample_rate'], bitrate=plan['bitrate'], codec=codec)
+
+        _timed(stages, 'export', export)
+    return stages
+
+
+def run_case(pipeline, codec, input_path):
+    """Run one pipeline in this process and return its measurements."""
+    from app.services.export_planner import OUTPUT_EXTENSIONS
+
+    runner = run_memory_pipeline if pipeline == 'memory' else run_streaming_pipeline
+    baseline_kb = peak_rss_kb()
+    with tempfile.NamedTemporaryFile(suffix=OUTPUT_EXTENSIONS[codec], delete=False) as f:
+        output_path = f.name
+    try:
+        stages = runner(input_path, output_path, codec)
+        output_bytes = os.path.getsize(output_path)
+    finally:
+        os.remove(output_path)
+    return {
+        'stages': stages,
+        'total_s': sum(stages.values()),
+        'peak_rss_mb': (peak_rss_kb() - baseline_kb) / 1024,
+        'output_bytes': output_bytes,
+    }
+
+
+def measure(pipeline, codec, input_path, repeat):
+    """Best time per stage and highest peak RSS over repeat fresh interpreters."""
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_pipeline', '--run-case', pipeline, codec, input_path],
+            capture_output=True, text=True, check=True
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    stages = {name: min(run['stages'][name] for run in runs) for name in runs[0]['stages']}
+    return {
+        'stages': stages,
+        'total_s': min(run['total_s'] for run in runs),
+        'peak_rss_mb': max(run['peak_rss_mb'] for run in runs),
+        'output_bytes': runs[0]['output_bytes'],
+    }
+
+
+def run_profile(profile, repeat, codecs=CODECS):
+    from benchmarks.fixtures import synthetic_consultation
+
+    results = {}
+    for minutes, sample_rate, channels in PROFILES[profile]:
+        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as f:
+            input_path = f.name
+        try:
+            synthetic_consultation(minutes, sample_rate, channels).export(input_path, format='wav')
+            for pipeline in PIPELINES:
+                for codec in codecs:
+                    key = case_key(pipeline, codec, minutes, sample_rate, channels)
+                    result = measure(pipeline, codec, input_path, repeat)
+                    result['realtime_factor'] = minutes * 60 / result['total_s']
+                    results[key] = result
+                    stages = ' '.join(f"{name}={seconds:.3f}s" for name, seconds in result['stages'].items())
+                    print(f"{key:<37} total={result['total_s']:.3f}s ({result['realtime_factor']:.0f}x realtime) "
+                          f"rss={result['peak_rss_mb']:.1f}MB out={result['output_bytes'] / 1024:.0f}KB  {stages}")
+        finally:
+            os.remove(input_path)
+    return results
+
+
+def compare(baseline, current, time_tolerance=0.25, rss_tolerance=0.2):
+    """
+    Compare two result sets.
+
+    Returns:
+        list: One message per stage, total or peak RSS that regressed beyond
+              its tolerance (and beyond the noise floor)
+    """
+    regressions = []
+    for key, result in current.items():
+        if key not in baseline:
+            continue
+        before = baseline[key]
+
+        timings = [(f"{key} {name}", before['stages'].get(name), seconds)
+                   for name, seconds in result['stages'].items()]
+        timings.append((f"{key} total", before['total_s'], result['total_s']))
+        for label, old, new in timings:
+            if old is not None and new > old * (1 + time_tolerance) and new - old > MIN_TIME_DELTA_S:
+                regressions.append(f"{label}: {old:.3f}s -> {new:.3f}s ({new / old - 1:+.0%})")
+
+        old_rss, new_rss = before['peak_rss_mb'], result['peak_rss_mb']
+        if new_rss > old_rss * (1 + rss_tolerance) and new_rss - old_rss > MIN_RSS_DELTA_MB:
+            regressions.append(f"{key} peak RSS: {old_rss:.1f}MB -> {new_rss:.1f}MB")
+    return regressions
+
+
+def machine_info():
+    import numpy
+    return {
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='quick')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--codecs', nargs='+', choices=CODECS, default=list(CODECS))
+    parser.add_argument('--save', help='Write results as a JSON baseline to this path')
+    parser.add_argument('--compare', help='Compare against a JSON baseline and exit 1 on regressions')
+    parser.add_argument('--time-tolerance', type=float, default=0.25)
+    parser.add_argument('--rss-tolerance', type=float, default=0.2)
+    parser.add_argument('--run-case', nargs=3, metavar=('PIPELINE', 'CODEC', 'WAV'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        print(json.dumps(run_case(*args.run_case)))
+        return
+
+    results = run_profile(args.profile, args.repeat, args.codecs)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'profile': args.profile, 'machine': machine_info(), 'results': results},
+                      f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Baseline written to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline['machine'] != machine_info():
+            print("Warning: baseline was recorded on a different machine or environment")
+        regressions = compare(baseline['results'], results, args.time_tolerance, args.rss_tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) against {args.compare}:")
+            for message in regressions:
+                print(f"  REGRESSION {message}")
+            sys.exit(1)
+        print(f"No regressions against {args.compare}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""
+Benchmark of the vectorized silence detector against pydub.
+
+Usage:
+    python -m benchmarks.bench_vad [--minutes 10 30 60] [--sample-rate 16000]
+"""
+import argparse
+import time
+from pydub import silence
+from app.services import vad
+from benchmarks.fixtures import synthetic_consultation
+
+SETTINGS = {'silence_thresh': -45, 'min_silence_len': 1000, 'seek_step': 100}
+
+
+def timed(func, audio):
+    start = time.perf_counter()
+    result = func(audio, **SETTINGS)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--minutes', type=float, nargs='+', default=[10, 30, 60])
+    parser.add_argument('--sample-rate', type=int, default=16000)
+    parser.add_argument('--channels', type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'minutes':>8} {'pydub s':>10} {'numpy s':>10} {'speedup':>8} {'ranges':>7} {'equal':>6}")
+    for minutes in args.minutes:
+        audio = synthetic_consultation(minutes, args.sample_rate, args.channels)
+        expected, pydub_time = timed(silence.detect_nonsilent, audio)
+        result, numpy_time = timed(vad.detect_nonsilent, audio)
+        print(f"{minutes:>8g} {pydub_time:>10.3f} {numpy_time:>10.3f} "
+              f"{pydub_time / numpy_time:>7.1f}x {len(result):>7} {str(result == expected):>6}")
+
+
+if __name__ == '__main__':
+    main()
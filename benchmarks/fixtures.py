@@ -0,0 +1,65 @@
+"""
+Deterministic synthetic consultation recordings for benchmarks.
+
+Recordings alternate speech-like bursts (noise shaped by a syllable-rate
+envelope plus a few formant tones) with low-level room noise, so that the
+silence detector has realistic work to do. The same seed always gives the
+same samples.
+"""
+import numpy as np
+from pydub import AudioSegment
+
+
+def synthetic_consultation(minutes, sample_rate=16000, channels=1, seed=0,
+                           speech_ratio=0.6, noise_level=40, speech_level=3000):
+    """
+    Generate a synthetic consultation as an AudioSegment.
+
+    Args:
+        minutes: Length of the recording in minutes
+        sample_rate: Sample rate in Hz
+        channels: 1 for mono, 2 for stereo (right channel slightly attenuated)
+        seed: Random seed
+        speech_ratio: Approximate share of the recording that is speech
+        noise_level: RMS amplitude of the background noise
+        speech_level: Peak amplitude of the speech bursts
+
+    Returns:
+        AudioSegment: 16-bit audio
+    """
+    samples = synthetic_samples(minutes, sample_rate, seed, speech_ratio, noise_level, speech_level)
+    if channels == 2:
+        stereo = np.empty((len(samples), 2), dtype=np.int16)
+        stereo[:, 0] = samples
+        stereo[:, 1] = (samples * 0.8).astype(np.int16)
+        samples = stereo.reshape(-1)
+    return AudioSegment(samples.tobytes(), frame_rate=sample_rate, sample_width=2, channels=channels)
+
+
+def synthetic_samples(minutes, sample_rate=16000, seed=0, speech_ratio=0.6,
+                      noise_level=40, speech_level=3000):
+    """Generate mono int16 samples for a synthetic consultation."""
+    rng = np.random.default_rng(seed)
+    total = int(minutes * 60 * sample_rate)
+    output = rng.normal(0, noise_level, total).astype(np.float32)
+
+    position = 0
+    mean_burst = 4.0
+    mean_gap = mean_burst * (1 - speech_ratio) / speech_ratio
+    while position < total:
+        position += int(rng.exponential(mean_gap) * sample_rate)
+        length = int(rng.uniform(0.5, 2 * mean_burst) * sample_rate)
+        end = min(position + length, total)
+        if end <= position:
+            break
+
+        t = np.arange(end - position, dtype=np.float32) / sample_rate
+        envelope = 0.5 * (1 - np.cos(2 * np.pi * rng.uniform(3, 6) * t))
+        voice = np.zeros_like(t)
+        for formant in rng.uniform(200, 3000, 3):
+            voice += np.sin(2 * np.pi * formant * t)
+        voice += rng.normal(0, 0.5, len(t)).astype(np.float32)
+        output[position:end] += speech_level / 3 * envelope * voice
+        position = end
+
+    return np.clip(output, -32768, 32767).astype(np.int16)
@@ -3,6 +3,21 @@ import pytest
 from app import create_app, db
 from app.models.user import User
 
+@pytest.fixture(autouse=True)
+def spool_dir(tmp_path, monkeypatch):
+    """Keep temporary job files of every test in its own spool directory."""
+    directory = tmp_path / 'spool'
+    monkeypatch.setenv('SPOOL_DIR', str(directory))
+    return directory
+
+
+@pytest.fixture(autouse=True)
+def openai_quotas(monkeypatch):
+    """Lift the shared OpenAI quotas so tests never wait on (or reach) Redis."""
+    for name in ('OPENAI_WHISPER_RPM', 'OPENAI_CHAT_RPM', 'OPENAI_CHAT_TPM'):
+        monkeypatch.setenv(name, '0')
+
+
 @pytest.fixture
 def app():
     """Create and configure a Flask app for testing."""
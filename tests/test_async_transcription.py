@@ -0,0 +1,53 @@
+import asyncio
+from io import BytesIO
+from types import SimpleNamespace
+
+import pytest
+
+
+class SlowClient:
+    """Stand-in for openai.AsyncOpenAI where one request never answers."""
+
+    def __init__(self, hanging):
+        self.hanging = hanging
+        self.cancelled = []
+        self.audio = SimpleNamespace(transcriptions=SimpleNamespace(create=self.create))
+
+    async def create(self, model, file, language):
+        index = int(file.read().decode())
+        try:
+            await asyncio.sleep(10 if index == self.hanging else 0.5)
+        except asyncio.CancelledError:
+            self.cancelled.append(index)
+            raise
+        return SimpleNamespace(text=f"del {index}")
+
+
+def test_timeout_cancels_requests_in_flight():
+    """Test that a request past its deadline fails the batch and cancels the others."""
+    from app.services.async_transcription import transcribe_concurrently
+
+    client = SlowClient(hanging=0)
+    sources = [BytesIO(str(i).encode()) for i in range(4)]
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(transcribe_concurrently(client, sources, 'whisper-1', 'sv', 2, timeout=0.1))
+
+    # Part 0 timed out, part 1 was in flight beside it; parts 2 and 3 never started
+    assert sorted(client.cancelled) == [0, 1]
+
+
+def test_results_follow_input_order():
+    """Test that texts come back in input order with progress reported per part."""
+    from app.services.async_transcription import transcribe_concurrently
+
+    client = SlowClient(hanging=None)
+    sources = [BytesIO(str(i).encode()) for i in range(3)]
+    progress = []
+
+    texts = asyncio.run(transcribe_concurrently(
+        client, sources, 'whisper-1', 'sv', 3, on_done=lambda index, done: progress.append(done)
+    ))
+
+    assert texts == ['del 0', 'del 1', 'del 2']
+    assert progress == [1, 2, 3]
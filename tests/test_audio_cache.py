@@ -0,0 +1,34 @@
+import io
+import hashlib
+
+
+def test_save_and_hash_matches_content(tmp_path):
+    """Test that the upload is written to disk and hashed in the same pass."""
+    from app.services.audio_cache import save_and_hash, hash_file
+
+    data = bytes(range(256)) * 10000
+    path = str(tmp_path / 'upload.wav')
+
+    digest = save_and_hash(io.BytesIO(data), path)
+
+    assert digest == hashlib.sha256(data).hexdigest() == hash_file(path)
+    with open(path, 'rb') as f:
+        assert f.read() == data
+
+
+def test_lookup_counts_hits_and_misses(app):
+    """Test that a stored entry is returned for the same key only and counters track lookups."""
+    from app.services import audio_cache
+
+    with app.app_context():
+        key = ('a' * 64, 'whisper-1', 'sv', '1')
+        assert audio_cache.lookup(*key) is None
+
+        audio_cache.store(*key, 'Patienten har ont.', '{"anamnes": "Ont"}')
+        audio_cache.store(*key, 'Patienten har ont.', '{"anamnes": "Ont"}')
+
+        entry = audio_cache.lookup(*key)
+        assert entry.transcription_text == 'Patienten har ont.'
+        assert audio_cache.lookup('a' * 64, 'whisper-1', 'sv', '2') is None
+
+        assert audio_cache.cache_stats() == {'hits': 1, 'misses': 2, 'hit_rate': 1 / 3, 'entries': 1}
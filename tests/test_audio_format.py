@@ -0,0 +1,50 @@
+import io
+import shutil
+import pytest
+from pydub import AudioSegment
+from pydub.generators import Sine
+
+requires_ffmpeg = pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='ffmpeg saknas')
+
+
+@requires_ffmpeg
+@pytest.mark.parametrize('extension,export_format,expected', [
+    ('wav', 'wav', 'wav'),
+    ('mp3', 'mp3', 'mp3'),
+    ('m4a', 'ipod', 'm4a'),
+    ('mp4', 'mp4', 'mp4'),
+    ('ogg', 'ogg', 'ogg'),
+    ('webm', 'webm', 'webm'),
+])
+def test_detect_format_from_header(tmp_path, extension, export_format, expected):
+    """Test that encoded files are identified from their first bytes."""
+    from app.services.audio_format import detect_format
+
+    path = str(tmp_path / f'tone.{extension}')
+    Sine(440).to_audio_segment(duration=300).export(path, format=export_format)
+
+    assert detect_format(path) == expected
+
+
+def test_detect_format_rejects_garbage_and_restores_position():
+    """Test that unknown data is rejected and file-like objects are rewound."""
+    from app.services.audio_format import detect_format, sniff_format
+
+    stream = io.BytesIO(b'%PDF-1.7 not audio at all' * 10)
+    stream.seek(3)
+    assert detect_format(stream) is None
+    assert stream.tell() == 3
+
+    # An ID3 tag with no MPEG frame after it is not an mp3
+    assert sniff_format(b'ID3\x04\x00\x00\x00\x00\x00\x0a') == 'mp3'
+    assert detect_format(io.BytesIO(b'ID3\x04\x00\x00\x00\x00\x00\x0a' + bytes(10 + 4096))) is None
+
+
+def test_api_transcribe_rejects_mislabelled_upload(client, auth):
+    """Test that the API refuses a file whose header does not match an audio format."""
+    auth.login()
+    response = client.post('/api/transcribe', data={
+        'audio': (io.BytesIO(b'this is a text file' * 100), 'recording.mp3'),
+    }, content_type='multipart/form-data')
+
+    assert response.status_code == 415
@@ -0,0 +1,309 @@
+import os
+import shutil
+import numpy as np
+import pytest
+from pydub import AudioSegment
+from pydub.silence import detect_nonsilent
+
+requires_ffmpeg = pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='ffmpeg saknas')
+
+
+def make_speech_like(seconds_pattern, sample_rate=16000, seed=1):
+    """Build int16 samples alternating quiet noise and loud bursts."""
+    rng = np.random.default_rng(seed)
+    parts = []
+    for i, seconds in enumerate(seconds_pattern):
+        n = int(seconds * sample_rate)
+        scale = 3000 if i % 2 else 50
+        parts.append(rng.normal(0, scale, n).astype(np.int16))
+    return np.concatenate(parts)
+
+
+def to_segment(samples, sample_rate=16000):
+    return AudioSegment(samples.tobytes(), frame_rate=sample_rate, sample_width=2, channels=1)
+
+
+def test_frame_detector_matches_pydub():
+    """Test that the frame-based detector returns the same ranges as pydub."""
+    from app.services.vad import detect_nonsilent_frames
+
+    samples = make_speech_like([1.6, 1.7, 1.2, 3.2, 1.5, 3.0, 2.7, 0.4, 1.9])
+    frame_len = 1600
+    squared = samples.astype(np.int64) ** 2
+    full = len(squared) // frame_len * frame_len
+    energies = np.concatenate([squared[:full].reshape(-1, frame_len).sum(axis=1), [squared[full:].sum()]])
+
+    expected = detect_nonsilent(to_segment(samples), silence_thresh=-45, min_silence_len=1000, seek_step=100)
+    assert detect_nonsilent_frames(energies, frame_len, len(samples), 16000) == expected
+
+
+@requires_ffmpeg
+def test_streaming_optimize(tmp_path):
+    """Test that streaming optimization produces an mp3 without loading the file."""
+    from app.services.audio_processor import optimize_for_whisper
+
+    samples = make_speech_like([2.0, 3.0, 2.5, 4.0, 2.0])
+    input_path = str(tmp_path / 'input.wav')
+    to_segment(samples).set_frame_rate(44100).set_channels(2).export(input_path, format='wav')
+
+    output_path = optimize_for_whisper(input_path, streaming=True)
+    try:
+        assert output_path.endswith('.mp3')
+        assert os.path.getsize(output_path) > 0
+    finally:
+        os.remove(output_path)
+
+
+@pytest.mark.parametrize('frame_rate,channels', [(16000, 1), (44100, 2), (22050, 1)])
+def test_vectorized_vad_matches_pydub(frame_rate, channels):
+    """Test that the vectorized detector is a drop-in for pydub's detect_nonsilent."""
+    from app.services.vad import detect_nonsilent as fast_detect_nonsilent
+
+    samples = make_speech_like([0.9, 2.3, 1.4, 0.3, 1.1, 2.0, 3.1, 1.05, 0.7], seed=frame_rate)
+    audio = to_segment(samples).set_frame_rate(frame_rate).set_channels(channels)
+
+    for kwargs in ({'silence_thresh': -45, 'min_silence_len': 1000, 'seek_step': 100},
+                   {'silence_thresh': -30, 'min_silence_len': 250, 'seek_step': 7}):
+        assert fast_detect_nonsilent(audio, **kwargs) == detect_nonsilent(audio, **kwargs)
+
+
+@pytest.mark.parametrize('noise_scale', [10, 50, 600])
+def test_adaptive_threshold_follows_noise_floor(noise_scale):
+    """Test that the adaptive threshold sits between the noise floor and speech and drops the noise."""
+    from app.services.vad import audio_frame_energies, adaptive_silence_settings
+    from app.services.vad import detect_nonsilent as fast_detect_nonsilent
+
+    rng = np.random.default_rng(noise_scale)
+    parts = [rng.normal(0, 3000 if i % 2 else noise_scale, int(seconds * 16000))
+             for i, seconds in enumerate([2.0, 3.0, 2.5, 4.0, 2.0])]
+    audio = to_segment(np.concatenate(parts).astype(np.int16))
+
+    settings = adaptive_silence_settings(*audio_frame_energies(audio), audio.sample_width)
+    assert settings['noise_floor'] < settings['silence_thresh'] < settings['speech_level']
+
+    ranges = fast_detect_nonsilent(audio, silence_thresh=settings['silence_thresh'],
+                                   min_silence_len=settings['min_silence_len'], seek_step=100)
+    kept = sum(end - start for start, end in ranges)
+    assert 6000 <= kept <= 8000
+
+
+def test_adaptive_threshold_falls_back_without_noise_floor():
+    """Test that a recording with no distinguishable noise floor keeps the fixed threshold."""
+    from app.services.vad import audio_frame_energies, adaptive_silence_settings
+
+    audio = to_segment(make_speech_like([0.2, 20.0]))
+    settings = adaptive_silence_settings(*audio_frame_energies(audio), audio.sample_width)
+    assert (settings['silence_thresh'], settings['min_silence_len']) == (-45, 1000)
+
+
+def test_assemble_segments_single_allocation():
+    """Test that segments are laid out with gaps and padding and bytes copied are reported."""
+    from app.services.audio_dsp import assemble_segments
+
+    samples = make_speech_like([1.0, 1.0, 1.0, 1.0])
+    audio = to_segment(samples)
+    ranges = [[100, 600], [1200, 1250], [3000, 3900]]
+
+    assembled, copied = assemble_segments(audio, ranges, gap_ms=100, pad_ms=300)
+
+    expected = np.concatenate([
+        np.zeros(4800, dtype=np.int16),
+        samples[1600:9600], np.zeros(1600, dtype=np.int16),
+        samples[19200:20000], np.zeros(1600, dtype=np.int16),
+        samples[48000:62400],
+        np.zeros(4800, dtype=np.int16),
+    ])
+    assert np.array_equal(np.frombuffer(assembled.raw_data, dtype=np.int16), expected)
+    assert copied == (8000 + 800 + 14400) * 2
+    assert len(assembled) == 300 + 500 + 100 + 50 + 100 + 900 + 300
+
+
+@requires_ffmpeg
+def test_optimize_in_memory(tmp_path):
+    """Test the in-memory optimization path end to end."""
+    from app.services.audio_processor import optimize_for_whisper
+
+    input_path = str(tmp_path / 'input.wav')
+    to_segment(make_speech_like([2.0, 3.0, 2.5, 4.0, 2.0])).export(input_path, format='wav')
+
+    output_path = optimize_for_whisper(input_path, streaming=False)
+    try:
+        assert os.path.getsize(output_path) > 0
+    finally:
+        os.remove(output_path)
+
+
+@pytest.mark.parametrize('frame_rate,channels', [(44100, 2), (48000, 1), (16000, 1)])
+def test_to_whisper_format_filters_and_resamples(frame_rate, channels):
+    """Test that the DSP stage outputs 16 kHz mono with speech kept and treble removed."""
+    from app.services.audio_dsp import to_whisper_format
+
+    t = np.arange(frame_rate * 2) / frame_rate
+    speech_band = (8000 * np.sin(2 * np.pi * 1000 * t)).astype(np.int16)
+    treble = (8000 * np.sin(2 * np.pi * 7000 * t)).astype(np.int16)
+
+    levels = []
+    for tone in (speech_band, treble):
+        audio = to_segment(tone, frame_rate).set_channels(channels)
+        result = to_whisper_format(audio, target_rate=16000, cutoff_hz=4000)
+        assert (result.frame_rate, result.channels, len(result)) == (16000, 1, 2000)
+        levels.append(np.frombuffer(result.raw_data, dtype=np.int16)[1000:-1000].astype(float).std())
+
+    assert levels[0] == pytest.approx(8000 / np.sqrt(2), rel=0.02)
+    assert levels[1] < 100
+
+
+def test_plan_export_picks_best_quality_that_fits():
+    """Test that the planner steps down the ladder only as far as the budget requires."""
+    from app.services.export_planner import plan_export
+
+    assert (plan_export(600)['bitrate'], plan_export(600)['sample_rate']) == ('32k', 16000)
+
+    hour_plan = plan_export(3600 * 2, max_size_mb=24)
+    assert hour_plan['bitrate'] == '24k' and hour_plan['fits']
+
+    too_long = plan_export(3600 * 10, max_size_mb=24)
+    assert (too_long['bitrate'], too_long['sample_rate'], too_long['fits']) == ('8k', 16000, False)
+
+
+@requires_ffmpeg
+def test_planned_size_matches_encoded_size(tmp_path):
+    """Test that the planned mp3 size matches what the encoder produces."""
+    from app.services.audio_processor import optimize_for_whisper
+    from app.services.export_planner import plan_export, compare_plan
+
+    input_path = str(tmp_path / 'input.wav')
+    to_segment(make_speech_like([1.0, 20.0])).export(input_path, format='wav')
+
+    for max_size_mb in (24, 0.05):
+        output_path = optimize_for_whisper(input_path, max_size_mb=max_size_mb, streaming=True)
+        try:
+            plan = plan_export(20.0 + 0.6, max_size_mb)
+            assert compare_plan(plan, os.path.getsize(output_path))['matched']
+        finally:
+            os.remove(output_path)
+
+
+def test_plan_export_opus_is_smaller_than_mp3():
+    """Test that the Opus ladder plans smaller files than mp3 at each step."""
+    from app.services.export_planner import plan_export
+
+    mp3_plan, opus_plan = plan_export(600), plan_export(600, codec='opus')
+    assert (opus_plan['format'], opus_plan['bitrate']) == ('opus', '24k')
+    assert opus_plan['estimated_bytes'] < mp3_plan['estimated_bytes']
+
+    too_long = plan_export(3600 * 10, max_size_mb=24, codec='opus')
+    assert (too_long['bitrate'], too_long['sample_rate']) == ('6k', 8000)
+
+
+@requires_ffmpeg
+@pytest.mark.parametrize('streaming', [False, True])
+def test_optimize_opus_output(tmp_path, streaming):
+    """Test that the Opus codec option writes an Ogg file of the planned size."""
+    from app.services.audio_processor import optimize_for_whisper
+    from app.services.audio_format import detect_format
+    from app.services.export_planner import plan_export, compare_plan
+
+    input_path = str(tmp_path / 'input.wav')
+    to_segment(make_speech_like([1.0, 20.0])).export(input_path, format='wav')
+
+    output_path = optimize_for_whisper(input_path, streaming=streaming, codec='opus')
+    try:
+        assert output_path.endswith('.ogg') and detect_format(output_path) == 'ogg'
+        plan = plan_export(20.0 + 0.6, codec='opus')
+        assert compare_plan(plan, os.path.getsize(output_path), tolerance=0.05)['matched']
+    finally:
+        os.remove(output_path)
+
+
+def test_plan_chunks_cuts_in_silence():
+    """Test that chunks are cut midway through gaps and long segments are hard-cut."""
+    from app.services.export_planner import plan_chunks
+
+    ranges = [[0, 1000], [2000, 3000], [5000, 9000], [10000, 10500]]
+    assert plan_chunks(ranges, 2500) == [[0, 2450], [2450, 4950], [4950, 7400]]
+    assert plan_chunks(ranges, 60000) == [[0, 7400]]
+
+
+@requires_ffmpeg
+def test_optimize_split_returns_ordered_chunks(tmp_path, monkeypatch):
+    """Test that split mode returns several mp3 files covering the output in order."""
+    from app.services.audio_processor import optimize_for_whisper
+    from app.services.audio_decoder import iter_pcm_blocks
+
+    monkeypatch.setenv('WHISPER_MAX_CHUNK_SECONDS', '5')
+    input_path = str(tmp_path / 'input.wav')
+    to_segment(make_speech_like([1.5, 3.0, 1.5, 3.0, 1.5, 3.0, 1.5])).export(input_path, format='wav')
+
+    for streaming in (False, True):
+        paths = optimize_for_whisper(input_path, streaming=streaming, split=True)
+        try:
+            assert len(paths) > 1
+            assert paths == sorted(paths)
+            durations = [sum(len(block) for block in iter_pcm_blocks(path)) / 16 for path in paths]
+            assert all(duration <= 5100 for duration in durations)
+        finally:
+            for path in paths:
+                os.remove(path)
+
+
+def test_load_wav_maps_file_without_copy(tmp_path):
+    """Test that the memory-mapped WAV loader returns the same samples as pydub."""
+    from app.services.audio_decoder import load_wav
+
+    path = str(tmp_path / 'input.wav')
+    expected = to_segment(make_speech_like([0.5, 0.5])).set_channels(2)
+    expected.export(path, format='wav')
+
+    audio = load_wav(path)
+    assert isinstance(audio.raw_data, memoryview)
+    assert (audio.frame_rate, audio.channels, audio.sample_width) == (16000, 2, 2)
+    assert bytes(audio.raw_data) == expected.raw_data
+
+
+@requires_ffmpeg
+def test_pcm_blocks_from_start_ms_match_full_decode(tmp_path):
+    """Test that decoding from start_ms gives the same samples as the tail of a full decode."""
+    from app.services.audio_decoder import iter_pcm_blocks
+
+    path = str(tmp_path / 'input.wav')
+    to_segment(make_speech_like([1.0, 1.0, 1.0])).export(path, format='wav')
+
+    full = np.concatenate(list(iter_pcm_blocks(path, low_pass_hz=None)))
+    tail = np.concatenate(list(iter_pcm_blocks(path, low_pass_hz=None, start_ms=1250)))
+    assert abs(len(tail) - (len(full) - 1250 * 16)) <= 16
+    assert np.array_equal(tail[:8000], full[1250 * 16:1250 * 16 + 8000])
+
+
+def test_load_wav_leaves_float_wav_to_ffmpeg(tmp_path):
+    """Test that an IEEE-float WAV is not mapped as integer PCM."""
+    import struct
+    from app.services.audio_decoder import load_wav
+
+    samples = np.zeros(1600, dtype='<f4').tobytes()
+    chunks = (b'WAVE' + b'fmt ' + struct.pack('<IHHIIHH', 16, 3, 1, 16000, 64000, 4, 32)
+              + b'data' + struct.pack('<I', len(samples)) + samples)
+    path = tmp_path / 'float.wav'
+    path.write_bytes(b'RIFF' + struct.pack('<I', len(chunks)) + chunks)
+
+    assert load_wav(str(path)) is None
+
+
+@requires_ffmpeg
+def test_process_audio_hands_off_file_on_disk(tmp_path):
+    """Test that process_audio returns a path-based result instead of an in-memory copy."""
+    from app.services.audio_processor import process_audio
+    from app.services.processed_audio import ProcessedAudio
+
+    input_path = str(tmp_path / 'input.wav')
+    to_segment(make_speech_like([1.0, 3.0, 1.0])).export(input_path, format='wav')
+
+    with open(input_path, 'rb') as upload:
+        processed, error = process_audio(upload)
+
+    assert error is None and isinstance(processed, ProcessedAudio)
+    with processed:
+        assert processed.name.endswith('.mp3') and processed.size > 0
+        with processed.buffer() as data, processed.open() as f:
+            assert bytes(data[:64]) == f.read(64)
+    assert not os.path.exists(processed.path)
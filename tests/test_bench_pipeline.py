@@ -0,0 +1,34 @@
+import numpy as np
+from benchmarks.bench_pipeline import compare
+from benchmarks.fixtures import synthetic_consultation
+
+
+def _result(decode, export, rss):
+    return {
+        'stages': {'decode': decode, 'export': export},
+        'total_s': decode + export,
+        'peak_rss_mb': rss,
+    }
+
+
+def test_synthetic_consultation_is_deterministic():
+    """The same arguments always give the same recording."""
+    first = synthetic_consultation(0.1, 8000, 2)
+    second = synthetic_consultation(0.1, 8000, 2)
+    assert first.channels == 2
+    assert first.frame_rate == 8000
+    assert first.raw_data == second.raw_data
+    assert np.abs(np.frombuffer(first.raw_data, dtype=np.int16)).max() > 1000
+
+
+def test_compare_reports_slower_stages_and_rss():
+    """Regressions beyond tolerance are reported, noise is not."""
+    baseline = {'case': _result(1.0, 0.010, 100.0)}
+
+    assert compare(baseline, {'case': _result(1.1, 0.025, 110.0)}) == []
+
+    regressions = compare(baseline, {'case': _result(1.5, 0.010, 200.0), 'new': _result(9, 9, 999)})
+    assert any(message.startswith('case decode') for message in regressions)
+    assert any(message.startswith('case total') for message in regressions)
+    assert any('peak RSS' in message for message in regressions)
+    assert not any(message.startswith('new') for message in regressions)
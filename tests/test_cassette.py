@@ -0,0 +1,57 @@
+import asyncio
+import time
+
+import httpx
+
+
+def test_recorded_responses_replay_offline(tmp_path):
+    """Test that a recorded response is replayed without network, exact JSON matches first."""
+    from app.services.cassette import Cassette, CassetteTransport, RECORD, REPLAY
+
+    def openai_api(request):
+        prompt = request.read().decode()
+        return httpx.Response(200, json={'answer': prompt}, headers={'set-cookie': 'secret', 'x-request-id': 'r1'})
+
+    recorder = httpx.Client(transport=CassetteTransport(Cassette(str(tmp_path)), RECORD, httpx.MockTransport(openai_api)))
+    for prompt in ('"a"', '"b"'):
+        recorder.post('https://api.openai.com/v1/chat/completions', content=prompt,
+                      headers={'content-type': 'application/json'})
+
+    player = httpx.Client(transport=CassetteTransport(Cassette(str(tmp_path)), REPLAY))
+    response = player.post('https://api.openai.com/v1/chat/completions', content='"b"',
+                           headers={'content-type': 'application/json'})
+    assert response.json() == {'answer': '"b"'}
+    assert response.headers['x-request-id'] == 'r1'
+    assert 'set-cookie' not in response.headers
+
+    # Unknown bodies take turns among the recordings; unknown endpoints fail without retry
+    answers = [
+        player.post('https://api.openai.com/v1/chat/completions', content='"c"',
+                    headers={'content-type': 'application/json'}).json()['answer']
+        for _ in range(2)
+    ]
+    assert sorted(answers) == ['"a"', '"b"']
+    assert player.post('https://api.openai.com/v1/audio/transcriptions').status_code == 400
+
+
+def test_replay_simulates_latency(tmp_path, monkeypatch):
+    """Test that replay waits the configured latency, also on async clients."""
+    from app.services.cassette import Cassette, AsyncCassetteTransport, REPLAY
+
+    cassette = Cassette(str(tmp_path))
+    request = httpx.Request('POST', 'https://api.openai.com/v1/audio/transcriptions')
+    cassette.record(request, httpx.Response(200, json={'text': 'hej'}), latency=5.0)
+
+    monkeypatch.setenv('OPENAI_REPLAY_LATENCY_SCALE', '0.5')
+    assert cassette.delay({'latency': 5.0}) == 2.5
+    monkeypatch.setenv('OPENAI_REPLAY_LATENCY', '0.1')
+
+    async def transcribe():
+        async with httpx.AsyncClient(transport=AsyncCassetteTransport(cassette, REPLAY)) as client:
+            started = time.perf_counter()
+            response = await client.post('https://api.openai.com/v1/audio/transcriptions', content=b'audio')
+            return response.json(), time.perf_counter() - started
+
+    body, elapsed = asyncio.run(transcribe())
+    assert body == {'text': 'hej'}
+    assert elapsed >= 0.05
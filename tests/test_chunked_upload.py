@@ -0,0 +1,132 @@
+import io
+import os
+import hashlib
+import pytest
+from pydub import AudioSegment
+
+
+@pytest.fixture
+def session_dir(tmp_path, monkeypatch):
+    directory = tmp_path / 'uploads'
+    monkeypatch.setenv('UPLOAD_SESSION_DIR', str(directory))
+    return directory
+
+
+def wav_bytes(seconds=10.0):
+    buffer = io.BytesIO()
+    AudioSegment.silent(duration=int(seconds * 1000), frame_rate=16000).export(buffer, format='wav')
+    return buffer.getvalue()
+
+
+def test_chunks_resume_in_any_order(session_dir):
+    """Test that chunks are written at their offsets, can be resent and are verified at the end."""
+    from app.services import chunked_upload
+
+    data = bytes(range(256)) * 4000
+    meta = chunked_upload.create_session(1, 'visit.wav', len(data), 10 * 1024 * 1024, chunk_size=256 * 1024)
+    assert meta['total_chunks'] == 4
+
+    def chunk(index):
+        return data[index * meta['chunk_size']:(index + 1) * meta['chunk_size']]
+
+    for index in (3, 0, 2):
+        chunked_upload.write_chunk(meta['upload_id'], 1, index, io.BytesIO(chunk(index)),
+                                   checksum=hashlib.sha256(chunk(index)).hexdigest())
+    assert chunked_upload.load_session(meta['upload_id'], 1)['received'] == [0, 2, 3]
+
+    with pytest.raises(ValueError):
+        chunked_upload.finalize(meta['upload_id'], 1)
+    with pytest.raises(ValueError):
+        chunked_upload.write_chunk(meta['upload_id'], 1, 1, io.BytesIO(chunk(1)[:-1]))
+    with pytest.raises(ValueError):
+        chunked_upload.write_chunk(meta['upload_id'], 1, 1, io.BytesIO(chunk(1)), checksum='0' * 64)
+    with pytest.raises(LookupError):
+        chunked_upload.load_session(meta['upload_id'], 2)
+
+    chunked_upload.write_chunk(meta['upload_id'], 1, 1, io.BytesIO(chunk(1)))
+    path, content_hash, _ = chunked_upload.finalize(meta['upload_id'], 1, hashlib.sha256(data).hexdigest())
+    try:
+        assert content_hash == hashlib.sha256(data).hexdigest()
+        assert path.endswith('.wav')
+        with open(path, 'rb') as f:
+            assert f.read() == data
+        assert not os.path.exists(session_dir / meta['upload_id'])
+    finally:
+        os.remove(path)
+
+
+def test_purge_stale_sessions(session_dir):
+    """Test that only sessions idle for longer than the limit are removed."""
+    from app.services import chunked_upload
+
+    stale = chunked_upload.create_session(1, 'a.wav', 10, 100)
+    fresh = chunked_upload.create_session(1, 'b.wav', 10, 100)
+    os.utime(session_dir / stale['upload_id'] / 'meta.json', (0, 0))
+
+    assert chunked_upload.purge_stale_sessions(3600) == 1
+    assert sorted(os.listdir(session_dir)) == [fresh['upload_id']]
+
+
+def test_upload_api_queues_transcription(client, auth, session_dir, monkeypatch):
+    """Test the init, PUT chunk and finalize endpoints end to end."""
+    from app.tasks import transcription_tasks
+
+    queued = []
+
+    class FakeTask:
+        id = 'task-123'
+
+    def delay(path, title, user_id, content_hash=None):
+        queued.append((path, title, content_hash))
+        return FakeTask()
+
+    monkeypatch.setattr(transcription_tasks.process_transcription, 'delay', delay)
+    auth.login()
+
+    data = wav_bytes()
+    response = client.post('/api/uploads', json={
+        'filename': 'visit.wav', 'size': len(data), 'title': 'Kontroll', 'chunk_size': 256 * 1024,
+    })
+    assert response.status_code == 201
+    meta = response.get_json()
+
+    chunk_size = meta['chunk_size']
+    for index in range(meta['total_chunks']):
+        response = client.put(f"/api/uploads/{meta['upload_id']}/chunks/{index}",
+                              data=data[index * chunk_size:(index + 1) * chunk_size],
+                              content_type='application/octet-stream')
+        assert response.status_code == 200
+
+    response = client.post(f"/api/uploads/{meta['upload_id']}/finalize", json={'sha256': '0' * 64})
+    assert response.status_code == 409
+
+    response = client.post(f"/api/uploads/{meta['upload_id']}/finalize",
+                           json={'sha256': hashlib.sha256(data).hexdigest()})
+    assert response.status_code == 200
+    assert response.get_json()['task_id'] == 'task-123'
+
+    path, title, content_hash = queued[0]
+    try:
+        assert title == 'Kontroll'
+        assert content_hash == hashlib.sha256(data).hexdigest()
+        with open(path, 'rb') as f:
+            assert f.read() == data
+    finally:
+        os.remove(path)
+
+    assert client.get(f"/api/uploads/{meta['upload_id']}").status_code == 404
+
+
+def test_upload_api_rejects_corrupt_file_and_removes_job(client, auth, session_dir, spool_dir):
+    """Test that a finalized upload that is not audio gets 415 and leaves no spool job behind."""
+    auth.login()
+
+    data = b'not audio at all' * 1000
+    meta = client.post('/api/uploads', json={'filename': 'visit.wav', 'size': len(data)}).get_json()
+    response = client.put(f"/api/uploads/{meta['upload_id']}/chunks/0", data=data,
+                          content_type='application/octet-stream')
+    assert response.status_code == 200
+
+    response = client.post(f"/api/uploads/{meta['upload_id']}/finalize", json={})
+    assert response.status_code == 415
+    assert not spool_dir.exists() or os.listdir(spool_dir) == []
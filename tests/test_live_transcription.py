@@ -0,0 +1,109 @@
+import io
+import os
+import shutil
+import numpy as np
+import pytest
+from pydub import AudioSegment
+
+requires_ffmpeg = pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='ffmpeg saknas')
+
+
+@pytest.fixture
+def session_dir(tmp_path, monkeypatch):
+    directory = tmp_path / 'live'
+    monkeypatch.setenv('LIVE_SESSION_DIR', str(directory))
+    return directory
+
+
+def speech_like_wav(seconds_pattern, sample_rate=16000, seed=1):
+    """WAV bytes alternating quiet noise and loud bursts."""
+    rng = np.random.default_rng(seed)
+    parts = []
+    for i, seconds in enumerate(seconds_pattern):
+        scale = 3000 if i % 2 else 50
+        parts.append(rng.normal(0, scale, int(seconds * sample_rate)).astype(np.int16))
+    buffer = io.BytesIO()
+    AudioSegment(np.concatenate(parts).tobytes(), frame_rate=sample_rate, sample_width=2, channels=1).export(
+        buffer, format='wav'
+    )
+    return buffer.getvalue()
+
+
+def test_choose_cut_waits_for_a_pause():
+    """Test that segments end in the latest pause at least MIN_SEGMENT_MS in."""
+    from app.services.live_transcription import choose_cut
+
+    ranges = [(0, 9000), (11000, 24000), (26000, 31000)]
+    assert choose_cut(ranges, 15000) is None
+    assert choose_cut(ranges, 31000) == 25000
+    assert choose_cut(ranges, 35000) == 33000
+    assert choose_cut(ranges, 31000, final=True) == 31000
+    assert choose_cut([(0, 30000)], 30000) is None
+    assert choose_cut([(0, 130000)], 130000) == 130000
+    assert choose_cut([], 25000) == 25000
+
+
+def test_slices_are_appended_in_order(session_dir):
+    """Test that resent slices are ignored and gaps are rejected."""
+    from app.services import live_transcription
+
+    meta = live_transcription.create_session(1, 'Kontroll')
+    session_id = meta['session_id']
+    live_transcription.append_slice(session_id, 1, 0, io.BytesIO(b'abc'))
+    live_transcription.append_slice(session_id, 1, 0, io.BytesIO(b'abc'))
+    live_transcription.append_slice(session_id, 1, 1, io.BytesIO(b'de'))
+
+    with pytest.raises(ValueError):
+        live_transcription.append_slice(session_id, 1, 3, io.BytesIO(b'f'))
+    with pytest.raises(LookupError):
+        live_transcription.load_session(session_id, 2)
+
+    meta = live_transcription.load_session(session_id, 1)
+    assert meta['slices'] == 2
+    assert meta['recorded_bytes'] == 5
+    with open(session_dir / session_id / 'recording', 'rb') as f:
+        assert f.read() == b'abcde'
+
+
+@requires_ffmpeg
+def test_transcribe_pending_cuts_at_pauses(session_dir, monkeypatch):
+    """Test that only audio up to the latest pause is transcribed until the recording ends."""
+    from app.services import live_transcription
+
+    transcribed = []
+
+    def fake_transcribe(samples):
+        transcribed.append(len(samples))
+        return f'del {len(transcribed)}', 1000
+
+    monkeypatch.setattr(live_transcription, '_transcribe_samples', fake_transcribe)
+
+    meta = live_transcription.create_session(1)
+    session_id = meta['session_id']
+    live_transcription.append_slice(session_id, 1, 0, io.BytesIO(speech_like_wav([2, 8] * 5)))
+
+    assert live_transcription.transcribe_pending(session_id) == 1
+    meta = live_transcription.load_session(session_id, 1)
+    assert 40000 <= meta['transcribed_ms'] <= 42000
+    assert live_transcription.transcript(session_id) == 'del 1'
+
+    assert live_transcription.transcribe_pending(session_id, final=True) == 1
+    meta = live_transcription.load_session(session_id, 1)
+    assert meta['transcribed_ms'] == pytest.approx(50000, abs=100)
+    assert meta['uploaded_bytes'] == 2000
+    assert sum(transcribed) == pytest.approx(50 * 16000, abs=1600)
+    assert live_transcription.transcript(session_id) == 'del 1 del 2'
+
+    live_transcription.discard(session_id)
+    assert not os.path.exists(session_dir / session_id)
+
+
+def test_transcribe_pending_after_discard_is_gone(session_dir):
+    """Test that a slice task queued before the session was discarded sees an unknown session."""
+    from app.services import live_transcription
+
+    session_id = live_transcription.create_session(1)['session_id']
+    live_transcription.discard(session_id)
+
+    with pytest.raises(LookupError):
+        live_transcription.transcribe_pending(session_id)
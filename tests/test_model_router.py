@@ -0,0 +1,47 @@
+import pytest
+
+
+@pytest.fixture
+def router(monkeypatch):
+    from app.services import model_router
+
+    monkeypatch.setattr(model_router, 'get_redis', lambda: None)
+    monkeypatch.setattr(model_router, '_local', model_router.LocalHealth())
+    monkeypatch.setenv('SUMMARY_BREAKER_MIN_CALLS', '3')
+    monkeypatch.setenv('SUMMARY_BREAKER_COOLDOWN', '60')
+    return model_router
+
+
+def test_routes_to_fastest_healthy_model(router):
+    """Test that unmeasured models are tried first and measured ones by latency."""
+    models = ['gpt-4o', 'gpt-4', 'gpt-3.5-turbo']
+    assert router.route(models) == models
+
+    router.record_success('gpt-4o', 4.0)
+    router.record_success('gpt-4', 1.5)
+    assert router.route(models) == ['gpt-3.5-turbo', 'gpt-4', 'gpt-4o']
+
+    router.record_success('gpt-3.5-turbo', 2.0)
+    assert router.route(models) == ['gpt-4', 'gpt-3.5-turbo', 'gpt-4o']
+
+
+def test_failing_model_is_skipped_then_probed_once(router, monkeypatch):
+    """Test that the breaker opens on failures, lets one probe through, and closes on success."""
+    models = ['gpt-4o', 'gpt-4']
+    router.record_success('gpt-4', 3.0)
+    for _ in range(3):
+        router.record_failure('gpt-4o')
+
+    health = router.model_health('gpt-4o')
+    assert health['state'] == router.OPEN
+    assert health['failure_rate'] == 1.0
+    assert router.route(models) == ['gpt-4', 'gpt-4o']
+
+    # Cooldown over: exactly one caller gets the probe
+    monkeypatch.setattr(router._local, 'open_for', lambda model: 0)
+    assert router.route(models) == ['gpt-4o', 'gpt-4']
+    assert router.route(models) == ['gpt-4', 'gpt-4o']
+
+    router.record_success('gpt-4o', 1.0)
+    assert router.model_health('gpt-4o')['state'] == router.CLOSED
+    assert router.route(models) == ['gpt-4o', 'gpt-4']
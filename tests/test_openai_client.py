@@ -0,0 +1,55 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class OkHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def local_server():
+    # Handler threads hold the keep-alive connection open, so they must not block shutdown
+    server = ThreadingHTTPServer(('127.0.0.1', 0), OkHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}/'
+    server.shutdown()
+
+
+@pytest.fixture
+def fresh_clients():
+    from app.services import openai_client
+    openai_client._reset_after_fork()
+    yield openai_client
+    openai_client._reset_after_fork()
+
+
+def test_client_is_shared_per_process_and_key(fresh_clients):
+    """Test that one client is built per API key and rebuilt after fork."""
+    first = fresh_clients.get_client('key-a')
+    assert fresh_clients.get_client('key-a') is first
+    assert fresh_clients.get_client('key-b') is not first
+
+    fresh_clients._reset_after_fork()
+    assert fresh_clients.get_client('key-a') is not first
+
+
+def test_pool_reuses_connections(fresh_clients, local_server):
+    """Test that repeated calls reuse the pooled keep-alive connection."""
+    http_client = fresh_clients.get_client('key-a')._client
+    for _ in range(3):
+        assert http_client.get(local_server).status_code == 200
+
+    assert fresh_clients.pool_stats() == {'requests': 3, 'new_connections': 1, 'reused_connections': 2}
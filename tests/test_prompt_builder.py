@@ -0,0 +1,37 @@
+import pytest
+
+
+@pytest.fixture
+def builder(monkeypatch):
+    from app.services import model_router, prompt_builder
+
+    monkeypatch.setattr(model_router, 'get_redis', lambda: None)
+    monkeypatch.setattr(model_router, '_local', model_router.LocalHealth())
+    monkeypatch.setenv('SUMMARY_MODELS', 'gpt-4o,gpt-4,gpt-3.5-turbo')
+    monkeypatch.setenv('SUMMARY_FAST_MODELS', 'gpt-4o-mini')
+    monkeypatch.setenv('SUMMARY_SHORT_PROMPT_TOKENS', '3000')
+    return prompt_builder
+
+
+def test_instructions_are_a_stable_system_prefix(builder):
+    """Test that only the user message differs between requests."""
+    first = builder.plan_request('Transkription: Pat har ont i 36.')
+    second = builder.plan_request('Transkription: Kontroll ua.')
+
+    assert first['messages'][0] == second['messages'][0]
+    assert first['messages'][0]['role'] == 'system'
+    assert first['messages'][1] == {'role': 'user', 'content': 'Transkription: Pat har ont i 36.'}
+    assert first['prompt_tokens'] > builder.count_tokens(builder.SYSTEM_PROMPT)
+
+
+def test_model_and_budget_follow_prompt_size(builder):
+    """Test that short prompts go to the fast model and long ones to large-context models."""
+    short = builder.plan_request('Transkription: Kontroll, inga besvär.')
+    assert short['models'][0] == 'gpt-4o-mini'
+    assert short['max_tokens'] == 500
+
+    long = builder.plan_request('Transkription: ' + 'Pat berättar om värk i 36 och 37 sedan en vecka. ' * 2000)
+    # Too large for gpt-4 (8k) and gpt-3.5-turbo (16k)
+    assert long['prompt_tokens'] > 16385
+    assert long['models'] == ['gpt-4o']
+    assert long['max_tokens'] == 1500
@@ -0,0 +1,131 @@
+import httpx
+import openai
+import pytest
+
+
+def rate_limit_error(retry_after):
+    request = httpx.Request('POST', 'https://api.openai.com/v1/audio/transcriptions')
+    response = httpx.Response(429, headers={'retry-after': retry_after}, request=request)
+    return openai.RateLimitError('Rate limit reached', response=response, body=None)
+
+
+@pytest.fixture
+def local_bucket(monkeypatch):
+    from app.services import rate_limiter
+
+    bucket = rate_limiter.LocalBucket()
+    monkeypatch.setattr(rate_limiter, 'get_backend', lambda: bucket)
+    return bucket
+
+
+def test_bucket_limits_requests_and_tokens(local_bucket):
+    """Test that the bucket grants up to the quota and then reports the wait until refill."""
+    assert [local_bucket.acquire('chat', 2, 0, 0) for _ in range(2)] == [0, 0]
+    assert 29000 <= local_bucket.acquire('chat', 2, 0, 0) <= 30001
+
+    assert local_bucket.acquire('tokens', 0, 600, 500) == 0
+    assert 39000 <= local_bucket.acquire('tokens', 0, 600, 500) <= 40001
+
+    local_bucket.block('whisper', 5)
+    assert 4000 < local_bucket.acquire('whisper', 100, 0, 0) <= 5001
+
+
+def test_rate_limit_honors_retry_after_and_pauses_bucket(local_bucket, monkeypatch):
+    """Test that a 429 is retried after Retry-After and pauses the bucket for everyone."""
+    from app.services import rate_limiter
+
+    sleeps = []
+    monkeypatch.setattr(rate_limiter.time, 'sleep', sleeps.append)
+    monkeypatch.setenv('OPENAI_WHISPER_RPM', '1000')
+
+    responses = [rate_limit_error('2'), 'ok']
+
+    def request():
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    blocked = []
+    monkeypatch.setattr(local_bucket, 'block', lambda name, seconds: blocked.append((name, seconds)))
+
+    assert rate_limiter.call_with_backoff(rate_limiter.WHISPER, request) == 'ok'
+    assert sleeps == [2.0]
+    assert blocked == [('whisper', 2.0)]
+
+
+def test_non_retryable_errors_and_exhausted_retries_raise(local_bucket, monkeypatch):
+    """Test that client errors fail at once and retries stop at OPENAI_MAX_RETRIES."""
+    from app.services import rate_limiter
+
+    monkeypatch.setattr(rate_limiter.time, 'sleep', lambda seconds: None)
+    monkeypatch.setenv('OPENAI_MAX_RETRIES', '2')
+
+    calls = []
+
+    def bad_request():
+        calls.append(1)
+        raise ValueError('bad input')
+
+    with pytest.raises(ValueError):
+        rate_limiter.call_with_backoff(rate_limiter.CHAT, bad_request)
+    assert len(calls) == 1
+
+    def always_limited():
+        calls.append(1)
+        raise rate_limit_error('0')
+
+    with pytest.raises(openai.RateLimitError):
+        rate_limiter.call_with_backoff(rate_limiter.CHAT, always_limited)
+    assert len(calls) == 1 + 3
+
+
+def test_backoff_without_hint_is_jittered_and_capped():
+    """Test full jitter below the exponential ceiling and the cap."""
+    from app.services.rate_limiter import backoff_delay
+
+    settings = {'max_retries': 6, 'base': 1.0, 'cap': 10.0}
+    delays = [backoff_delay(attempt, settings=settings) for attempt in range(8) for _ in range(20)]
+    assert all(0 <= delay <= 10.0 for delay in delays)
+    assert max(backoff_delay(1, settings=settings) for _ in range(50)) <= 2.0
+
+
+def test_redis_is_retried_after_backoff(monkeypatch):
+    """Test that a failed Redis connection is retried after REDIS_RETRY_INTERVAL instead of never."""
+    import sys
+    import types
+    from app.services import rate_limiter
+
+    class FakeRedis:
+        up = False
+        attempts = 0
+
+        @classmethod
+        def from_url(cls, url, **options):
+            return cls()
+
+        def ping(self):
+            FakeRedis.attempts += 1
+            if not FakeRedis.up:
+                raise ConnectionError('Connection refused')
+
+        def register_script(self, script):
+            return None
+
+    now = [1000.0]
+    monkeypatch.setitem(sys.modules, 'redis', types.SimpleNamespace(Redis=FakeRedis))
+    monkeypatch.setattr(rate_limiter.time, 'monotonic', lambda: now[0])
+    monkeypatch.setenv('REDIS_RETRY_INTERVAL', '30')
+    rate_limiter._reset_after_fork()
+    try:
+        assert rate_limiter.get_backend() is rate_limiter._local
+        FakeRedis.up = True
+        now[0] += 10
+        assert rate_limiter.get_backend() is rate_limiter._local
+        assert FakeRedis.attempts == 1
+
+        now[0] += 25
+        assert isinstance(rate_limiter.get_backend(), rate_limiter.RedisBucket)
+        assert FakeRedis.attempts == 2
+    finally:
+        rate_limiter._reset_after_fork()
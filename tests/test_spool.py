@@ -0,0 +1,56 @@
+import os
+
+
+def test_outputs_share_the_job_of_their_input(spool_dir):
+    """Test that files derived from an upload land in its job and are released together."""
+    from app.services.spool import SpoolJob, spool_path, release, spool_usage
+
+    upload = spool_path('.wav')
+    with open(upload, 'wb') as f:
+        f.write(b'x' * 1000)
+    processed = spool_path('.mp3', near=upload)
+    with open(processed, 'wb') as f:
+        f.write(b'y' * 200)
+
+    job = SpoolJob.for_path(upload)
+    assert SpoolJob.for_path(processed).job_id == job.job_id
+    assert job.size == 1200
+    assert spool_usage() == {'jobs': 1, 'bytes': 1200}
+    assert SpoolJob.for_path('/somewhere/else.wav') is None
+
+    release(processed)
+    assert not os.path.exists(job.directory)
+    assert spool_usage() == {'jobs': 0, 'bytes': 0}
+
+
+def test_discard_removes_empty_job(spool_dir):
+    """Test that the job directory goes away with its last file."""
+    from app.services.spool import SpoolJob, spool_path, discard
+
+    first = spool_path('.mp3')
+    second = spool_path('.mp3', near=first)
+    job = SpoolJob.for_path(first)
+
+    discard(first)
+    assert os.path.isdir(job.directory)
+    discard(second)
+    assert not os.path.exists(job.directory)
+
+
+def test_purge_only_touches_stale_jobs(spool_dir):
+    """Test that purging scans only the spool root and keeps active jobs."""
+    from app.services.spool import SpoolJob, purge_stale_jobs
+
+    stale = SpoolJob.create()
+    stale_file = stale.path('.wav')
+    fresh = SpoolJob.create()
+    fresh_file = fresh.path('.wav')
+    for path in (stale_file, stale.directory):
+        os.utime(path, (0, 0))
+
+    # A recently written file keeps the job alive even if the directory is old
+    os.utime(fresh.directory, (0, 0))
+
+    assert purge_stale_jobs(3600) == 1
+    assert not os.path.exists(stale.directory)
+    assert os.path.exists(fresh_file)
@@ -0,0 +1,203 @@
+import json
+import threading
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class BatchHandler(BaseHTTPRequestHandler):
+    """Stand-in for the OpenAI files and batches endpoints.
+
+    A batch is reported in progress on its first retrieve and completed on the
+    next. Requests whose transcript contains FEL end up in the error file.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def _send(self, payload, content_type='application/json'):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _store_file(self, content, purpose):
+        state = self.server.state
+        file_id = f"file-{len(state['files']) + 1}"
+        state['files'][file_id] = content
+        return {'id': file_id, 'object': 'file', 'bytes': len(content), 'created_at': 0,
+                'filename': f'{file_id}.jsonl', 'purpose': purpose, 'status': 'processed'}
+
+    def _run(self, input_file_id):
+        outputs, errors = [], []
+        for line in self.server.state['files'][input_file_id].decode('utf-8').splitlines():
+            request = json.loads(line)
+            transcript = request['body']['messages'][-1]['content']
+            if 'FEL' in transcript:
+                errors.append({'custom_id': request['custom_id'], 'error': None, 'response': {
+                    'status_code': 400, 'body': {'error': {'message': 'Invalid request'}}}})
+                continue
+            content = json.dumps({'anamnes': transcript, 'status': 'ua'}, ensure_ascii=False)
+            outputs.append({'custom_id': request['custom_id'], 'error': None, 'response': {
+                'status_code': 200, 'body': {'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}}]}}})
+        as_file = lambda lines: '\n'.join(json.dumps(line, ensure_ascii=False) for line in lines).encode('utf-8')
+        return (self._store_file(as_file(outputs), 'batch_output')['id'] if outputs else None,
+                self._store_file(as_file(errors), 'batch_output')['id'] if errors else None)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        state = self.server.state
+        if self.path == '/v1/files':
+            form = BytesParser().parsebytes(b'Content-Type: ' + self.headers['Content-Type'].encode() + b'\r\n\r\n' + body)
+            parts = {part.get_param('name', header='content-disposition'): part.get_payload(decode=True)
+                     for part in form.get_payload()}
+            self._send(self._store_file(parts['file'], parts['purpose'].decode()))
+        elif self.path == '/v1/batches':
+            request = json.loads(body)
+            batch_id = f"batch-{len(state['batches']) + 1}"
+            state['batches'][batch_id] = {
+                'id': batch_id, 'object': 'batch', 'endpoint': request['endpoint'],
+                'input_file_id': request['input_file_id'], 'completion_window': request['completion_window'],
+                'created_at': 0, 'status': 'validating', 'output_file_id': None, 'error_file_id': None,
+            }
+            self._send(state['batches'][batch_id])
+
+    def do_GET(self):
+        state = self.server.state
+        if self.path.startswith('/v1/batches/'):
+            batch = state['batches'].get(self.path.rsplit('/', 1)[1])
+            if batch is None:
+                body = json.dumps({'error': {'message': 'No such batch'}}).encode('utf-8')
+                self.send_response(404)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            if batch['status'] == 'validating':
+                batch['status'] = 'in_progress'
+            elif batch['status'] == 'in_progress':
+                batch['output_file_id'], batch['error_file_id'] = self._run(batch['input_file_id'])
+                batch['status'] = 'completed'
+            self._send(batch)
+        elif self.path.endswith('/content'):
+            self._send(state['files'][self.path.split('/')[3]], 'application/octet-stream')
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def batch_server(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), BatchHandler)
+    server.daemon_threads = True
+    server.state = {'files': {}, 'batches': {}}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    from app.services import openai_client, model_router
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    monkeypatch.setenv('OPENAI_BASE_URL', f'http://127.0.0.1:{server.server_port}/v1')
+    monkeypatch.setattr(model_router, 'get_redis', lambda: None)
+    openai_client._reset_after_fork()
+    yield server.state
+    openai_client._reset_after_fork()
+    server.shutdown()
+
+
+def _save_transcription(text):
+    from app import db
+    from app.models.transcription import Transcription
+    transcription = Transcription(title='Import', transcription_text=text, user_id=1)
+    db.session.add(transcription)
+    db.session.commit()
+    return transcription
+
+
+def test_deferred_summary_is_written_back_when_batch_completes(app, batch_server):
+    """Test that a queued summary is submitted, polled until done and saved to the transcription."""
+    from app.services import summary_batch, summary_service
+
+    with app.app_context():
+        transcription = _save_transcription('Pat har ont i 36.')
+        assert summary_service.generate_summary(transcription.transcription_text, defer_to=transcription.id) is None
+        assert summary_batch.poll_batches() == 0
+
+        batch_id = summary_batch.submit_pending()
+        assert summary_batch.submit_pending() is None
+        submitted = json.loads(batch_server['files']['file-1'])
+        assert submitted['url'] == '/v1/chat/completions'
+        assert submitted['body']['messages'][0]['content'] == summary_service.SYSTEM_PROMPT
+
+        assert summary_batch.poll_batches() == 0
+        assert summary_batch.poll_batches() == 1
+        assert batch_server['batches'][batch_id]['status'] == 'completed'
+        assert json.loads(transcription.summary)['anamnes'] == 'Transkription: Pat har ont i 36.'
+        assert summary_batch.queue_stats()['completed'] == 1
+
+        # The same text again comes from the summary cache without a new batch
+        again = _save_transcription('Pat har ont i 36.')
+        assert summary_service.generate_summary(again.transcription_text, defer_to=again.id) == json.loads(transcription.summary)
+        assert summary_batch.queue_stats()['pending'] == 0
+
+
+def test_failed_requests_are_retried_then_given_up(app, batch_server, monkeypatch):
+    """Test that a failing request is queued again and gets an error summary after the last attempt."""
+    from app.models.summary_batch import SummaryBatchJob
+    from app.services import summary_batch, summary_service
+
+    monkeypatch.setenv('SUMMARY_BATCH_MAX_ATTEMPTS', '2')
+    with app.app_context():
+        ok = _save_transcription('Pat har ont i 46.')
+        broken = _save_transcription('FEL i transkriptionen')
+        summary_batch.enqueue(ok.id, ok.transcription_text)
+        job = summary_batch.enqueue(broken.id, broken.transcription_text)
+
+        summary_batch.submit_pending()
+        summary_batch.poll_batches()
+        assert summary_batch.poll_batches() == 1
+        assert (job.status, job.attempts, job.error) == ('pending', 1, 'Invalid request')
+        assert broken.summary is None
+
+        summary_batch.submit_pending()
+        summary_batch.poll_batches()
+        summary_batch.poll_batches()
+        assert (job.status, job.attempts) == ('failed', 2)
+        assert summary_service.is_error_response(json.loads(broken.summary))
+        assert SummaryBatchJob.query.filter_by(status='completed').count() == 1
+
+
+def test_unknown_batch_is_requeued_without_blocking_others(app, batch_server):
+    """Test that the jobs of a batch the API does not know are queued again and the others are still collected."""
+    from app import db
+    from app.services import summary_batch
+
+    with app.app_context():
+        lost = _save_transcription('Pat har ont i 26.')
+        job = summary_batch.enqueue(lost.id, lost.transcription_text)
+        job.status, job.batch_id, job.attempts = 'submitted', 'batch-0', 1
+        db.session.commit()
+
+        transcription = _save_transcription('Pat har ont i 16.')
+        summary_batch.enqueue(transcription.id, transcription.transcription_text)
+        summary_batch.submit_pending()
+
+        summary_batch.poll_batches()
+        assert (job.status, job.batch_id) == ('pending', None)
+        assert 'HTTP 404' in job.error
+
+        assert summary_batch.poll_batches() == 1
+        assert transcription.summary is not None
+        assert lost.summary is None
+
+
+def test_queued_summary_is_shown_as_queued(app, client, auth):
+    """Test that a transcription waiting for its batch summary renders a queued state, not a parse error."""
+    with app.app_context():
+        transcription_id = _save_transcription('Pat har ont i 36.').id
+    auth.login()
+
+    page = client.get(f'/transcriptions/{transcription_id}').get_data(as_text=True)
+    assert 'Sammanfattningen är köad' in page
+    assert 'Error parsing summary' not in page
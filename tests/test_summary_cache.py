@@ -0,0 +1,65 @@
+import json
+from datetime import datetime, timedelta
+
+from tests.test_summary_service import FakeChat
+
+
+def test_lookup_ignores_whitespace_and_misses_on_new_prompt(app):
+    """Test that a stored summary is found for reformatted text only under the same prompt version."""
+    from app.services import summary_cache
+
+    with app.app_context():
+        summary = {'anamnes': 'Ont i 36', 'status': 'ua'}
+        assert summary_cache.lookup('Pat har ont i 36.', 'gpt-4o', '3:abc') is None
+
+        summary_cache.store('Pat har ont i 36.', 'gpt-4o', '3:abc', summary)
+        summary_cache.store('Pat har ont i 36.', 'gpt-4o', '3:abc', summary)
+
+        assert summary_cache.lookup('  Pat har\nont i   36. ', 'gpt-4o', '3:abc') == summary
+        assert summary_cache.lookup('Pat har ont i 36.', 'gpt-4o', '3:def') is None
+        assert summary_cache.lookup('Pat har ont i 36.', 'gpt-4', '3:abc') is None
+
+        stats = summary_cache.cache_stats()
+        assert (stats['hits'], stats['misses'], stats['entries']) == (1, 3, 1)
+
+
+def test_purge_evicts_old_versions_and_least_recently_used(app, monkeypatch):
+    """Test that entries for other prompt versions, expired and overflow entries are removed."""
+    from app import db
+    from app.models.summary_cache import SummaryCacheEntry
+    from app.services import summary_cache
+
+    monkeypatch.setenv('SUMMARY_CACHE_MAX_ENTRIES', '2')
+    with app.app_context():
+        for text in ('a', 'b', 'c', 'd'):
+            summary_cache.store(text, 'gpt-4o', '3:abc', {'anamnes': text})
+        summary_cache.store('old', 'gpt-4o', '2:abc', {'anamnes': 'old'})
+
+        now = datetime.utcnow()
+        ages = {'a': 60, 'b': 3, 'c': 2, 'd': 1}
+        for entry in SummaryCacheEntry.query.filter_by(prompt_version='3:abc'):
+            text = json.loads(entry.summary)['anamnes']
+            entry.last_used_at = now - timedelta(days=ages[text])
+        db.session.commit()
+
+        assert summary_cache.purge_stale_entries('3:abc') == 3
+        remaining = sorted(json.loads(entry.summary)['anamnes'] for entry in SummaryCacheEntry.query)
+        assert remaining == ['c', 'd']
+
+
+def test_generate_summary_reuses_cached_result(app, monkeypatch):
+    """Test that summarizing an identical transcript again makes no API call."""
+    from app.services import summary_service, model_router
+
+    client = FakeChat()
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    monkeypatch.setattr(summary_service, 'get_client', lambda api_key: client)
+    monkeypatch.setattr(model_router, 'get_redis', lambda: None)
+    monkeypatch.setattr(model_router, '_local', model_router.LocalHealth())
+
+    with app.app_context():
+        first = summary_service.generate_summary("Pat har ont i 36.")
+        second = summary_service.generate_summary("Pat har ont  i 36.\n")
+
+    assert first == second
+    assert len(client.prompts) == 1
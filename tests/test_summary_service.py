@@ -0,0 +1,130 @@
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+
+class FakeChat:
+    """Stand-in for openai.OpenAI that answers chunk and merge prompts with six-field JSON."""
+
+    def __init__(self):
+        self.prompts = []
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, **kwargs):
+        prompt = messages[-1]['content']
+        with self._lock:
+            self.prompts.append(prompt)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.05)
+        with self._lock:
+            self.active -= 1
+        if prompt.startswith('Nedan följer'):
+            anamnes = ' + '.join(json.loads(line.split(': ', 1)[1])['anamnes']
+                                 for line in prompt.split('Delsammanfattningar:\n')[1].splitlines()
+                                 if line.startswith('Del '))
+        else:
+            anamnes = prompt.split('(del ')[1].split(')')[0] if '(del ' in prompt else 'hel'
+        content = json.dumps({'anamnes': anamnes, 'status': 'ua', 'diagnos': 'Ej dokumenterat',
+                              'åtgärd': 'Ej dokumenterat', 'behandlingsplan': 'Ej dokumenterat',
+                              'kommunikation': 'Ej dokumenterat'})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+@pytest.fixture
+def chat(monkeypatch):
+    from app.services import summary_service, model_router
+
+    client = FakeChat()
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    monkeypatch.setattr(summary_service, 'get_client', lambda api_key: client)
+    monkeypatch.setattr(model_router, 'get_redis', lambda: None)
+    monkeypatch.setattr(model_router, '_local', model_router.LocalHealth())
+    return client
+
+
+def test_split_transcript_keeps_utterances_whole():
+    """Test that chunks break between utterances and only split an utterance that is too long."""
+    from app.services.summary_service import split_transcript
+
+    text = "Hej och välkommen. Har du ont?\nJa, i 36! " + "mycket " * 10
+    chunks = split_transcript(text, 30)
+
+    assert chunks[:3] == ["Hej och välkommen. Har du ont?", "Ja, i 36!", "mycket mycket mycket mycket"]
+    assert all(len(chunk) <= 30 for chunk in chunks)
+    assert " ".join(chunks) == " ".join(text.split())
+
+
+def test_long_transcript_is_mapped_in_parallel_and_reduced(chat, monkeypatch):
+    """Test that a long transcript is summarized per chunk concurrently and merged in order."""
+    from app.services.summary_service import generate_summary
+
+    monkeypatch.setenv('SUMMARY_LONG_TRANSCRIPT_CHARS', '2000')
+    monkeypatch.setenv('SUMMARY_CHUNK_CHARS', '1000')
+    monkeypatch.setenv('SUMMARY_REDUCE_FAN_IN', '3')
+    transcript = " ".join(f"Yttrande nummer {i} om tand 36." for i in range(150))
+
+    summary = generate_summary(transcript)
+
+    chunk_prompts = [p for p in chat.prompts if '(del ' in p]
+    assert len(chunk_prompts) == 5
+    assert chat.peak > 1
+    # Five chunks merged three at a time, then the two partial merges into one
+    assert summary['anamnes'] == '1/5 + 2/5 + 3/5 + 4/5 + 5/5'
+    assert len(chat.prompts) == 5 + 2 + 1
+
+
+def test_short_transcript_uses_single_call(chat):
+    """Test that a normal transcript is summarized with one call."""
+    from app.services.summary_service import generate_summary
+
+    assert generate_summary("Pat har ont i 36.")['anamnes'] == 'hel'
+    assert len(chat.prompts) == 1
+
+
+def test_latency_excludes_quota_wait(chat, monkeypatch):
+    """Test that the latency reported to the router covers only the API call, not the backoff."""
+    from app.services import summary_service
+
+    def slow_backoff(name, request, tokens=0, max_retries=None):
+        time.sleep(0.3)
+        return request()
+
+    latencies = []
+    monkeypatch.setattr(summary_service, 'call_with_backoff', slow_backoff)
+    monkeypatch.setattr(summary_service, 'record_success', lambda model, latency: latencies.append(latency))
+
+    summary_service._complete_summary(chat, summary_service.build_prompt("Pat har ont i 36."))
+    assert len(latencies) == 1 and 0.04 < latencies[0] < 0.25
+
+
+def test_only_retryable_errors_count_against_the_model(chat, monkeypatch):
+    """Test that a rejected request does not mark the model as failing, but a timeout does."""
+    import httpx
+    import openai
+    from app.services import summary_service
+
+    request = httpx.Request('POST', 'https://api.openai.com/v1/chat/completions')
+    errors = [openai.BadRequestError('context_length_exceeded', response=httpx.Response(400, request=request), body=None),
+              openai.APITimeoutError(request=request)]
+
+    def failing_backoff(name, call, tokens=0, max_retries=None):
+        raise errors[0]
+
+    failures = []
+    monkeypatch.setattr(summary_service, 'call_with_backoff', failing_backoff)
+    monkeypatch.setattr(summary_service, 'record_failure', failures.append)
+    monkeypatch.setattr(summary_service, 'plan_request', lambda content: {
+        'models': ['gpt-4o'], 'messages': [], 'max_tokens': 10, 'prompt_tokens': 10})
+
+    for error in list(errors):
+        with pytest.raises(type(error)):
+            summary_service._complete_summary(chat, 'Pat har ont i 36.')
+        errors.pop(0)
+    assert failures == ['gpt-4o']
@@ -0,0 +1,41 @@
+import asyncio
+from io import BytesIO
+from types import SimpleNamespace
+
+
+class FakeClient:
+    """Stand-in for openai.AsyncOpenAI that answers out of order and tracks concurrency."""
+
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+        self.audio = SimpleNamespace(transcriptions=SimpleNamespace(create=self.create))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def create(self, model, file, language):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        index = int(file.read().decode())
+        await asyncio.sleep(0.02 * (5 - index))
+        self.active -= 1
+        return SimpleNamespace(text=f"del {index}")
+
+
+def test_transcribe_chunks_keeps_order_and_bounds_concurrency(monkeypatch):
+    """Test that chunk texts are stitched in order with at most max_workers calls in flight."""
+    from app.services import transcription_service, async_transcription
+
+    client = FakeClient()
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    monkeypatch.setattr(async_transcription, 'build_async_client', lambda api_key: client)
+
+    chunks = [BytesIO(str(i).encode()) for i in range(5)]
+    text = transcription_service.transcribe_chunks(chunks, max_workers=2)
+
+    assert text == "del 0 del 1 del 2 del 3 del 4"
+    assert client.peak == 2
@@ -0,0 +1,87 @@
+import os
+import shutil
+import pytest
+from tests.test_audio_processor import make_speech_like, to_segment
+
+requires_ffmpeg = pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='ffmpeg saknas')
+
+
+@requires_ffmpeg
+def test_process_transcription_uploads_optimized_audio(app, tmp_path, monkeypatch):
+    """Test that the Celery task compresses the upload before sending it to Whisper."""
+    from app.tasks.transcription_tasks import process_transcription
+    from app.services import transcription_service, summary_service
+    from app.models.transcription import Transcription
+
+    input_path = str(tmp_path / 'upload.wav')
+    to_segment(make_speech_like([1.0, 6.0, 1.5, 6.0, 1.0])).set_frame_rate(44100).set_channels(2) \
+        .export(input_path, format='wav')
+    original_size = os.path.getsize(input_path)
+
+    uploaded = []
+
+    def fake_transcribe(audio_file, task_id=None):
+        uploaded.extend(audio_file)
+        assert all(path.endswith('.mp3') and os.path.exists(path) for path in audio_file)
+        return 'Patienten har ont i en tand.'
+
+    monkeypatch.setenv('OPENAI_API_KEY', 'test-key')
+    monkeypatch.setattr(transcription_service, 'transcribe_audio', fake_transcribe)
+    monkeypatch.setattr(summary_service, 'generate_summary', lambda text, task_id=None: {'anamnes': 'Tandvärk'})
+    monkeypatch.setattr(process_transcription, 'update_state', lambda **kwargs: None)
+
+    with app.app_context():
+        result = process_transcription.run(input_path, 'Test', 1)
+
+        assert result['status'] == 'completed'
+        assert result['original_size'] == original_size
+        assert result['compressed_size'] * 10 < original_size
+        transcription = Transcription.query.get(result['transcription_id'])
+        assert transcription.compressed_size == result['compressed_size']
+
+    # Both the upload and the optimized files are removed afterwards
+    assert uploaded and not any(os.path.exists(path) for path in uploaded + [input_path])
+
+
+def test_finish_live_transcription_retries_transient_errors(app, monkeypatch):
+    """Test that a temporary OpenAI error retries the live finish task instead of losing the recording."""
+    import httpx
+    import openai
+    from celery.exceptions import Retry
+    from app.tasks.transcription_tasks import finish_live_transcription
+    from app.services import live_transcription, summary_service
+
+    attempts = []
+
+    def flaky_transcribe(session_id, final=False):
+        attempts.append(session_id)
+        if len(attempts) == 1:
+            try:
+                raise openai.APIConnectionError(request=httpx.Request('POST', 'https://api.openai.com/v1/audio'))
+            except openai.OpenAIError:
+                raise RuntimeError('Fel under transkribering: Connection error.')
+        return 1
+
+    monkeypatch.setattr(live_transcription, 'transcribe_pending', flaky_transcribe)
+    monkeypatch.setattr(live_transcription, 'load_session',
+                        lambda session_id, user_id: {'recorded_bytes': 100, 'uploaded_bytes': 10})
+    monkeypatch.setattr(live_transcription, 'transcript', lambda session_id: 'Patienten har ont.')
+    monkeypatch.setattr(live_transcription, 'discard', lambda session_id: None)
+    monkeypatch.setattr(summary_service, 'generate_summary', lambda text, task_id=None: {'anamnes': 'Ont'})
+    monkeypatch.setattr(finish_live_transcription, 'update_state', lambda **kwargs: None)
+
+    retries = []
+
+    def fake_retry(exc=None, countdown=None):
+        retries.append(countdown)
+        return Retry(exc=exc)
+
+    monkeypatch.setattr(finish_live_transcription, 'retry', fake_retry)
+
+    with app.app_context():
+        with pytest.raises(Retry):
+            finish_live_transcription.run('a' * 32, 'Live', 1)
+        result = finish_live_transcription.run('a' * 32, 'Live', 1)
+
+    assert retries == [finish_live_transcription.default_retry_delay]
+    assert result['status'] == 'completed'